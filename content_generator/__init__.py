@@ -4,22 +4,54 @@ Content Generator Package
 A modular, context-independent package for generating content using Claude API.
 """
 
+import json
 import os
+import sys
+import threading
+import time
 from .extractors.metadata_extractor import (
     extract_metadata, get_categories, get_items_in_category,
     get_item_by_index, get_item_name, get_file_type
 )
-from .generators.prompt_generator import generate_full_prompt, generate_prompt_from_topic
-from .utils.api_utils import generate_content_with_claude
-from .utils.file_utils import write_file
-from .config import DEFAULT_OUTPUT_DIR
+from .extractors.metadata_store import MetadataStore
+from .generators.prompt_generator import (
+    generate_prompt_parts, get_item_template, build_topic_item
+)
+from .generators.section_generator import (
+    should_generate_sections, generate_outline_prompt, parse_outline, generate_section_prompt, stitch_sections
+)
+from .utils.api_utils import (
+    generate_content_with_claude, stream_content_with_claude, create_client,
+    submit_message_batch, iter_message_batch_results
+)
+from .utils.retry_utils import RetryPolicy
+from .utils.cache_utils import ResponseCache
+from .utils.singleflight import SingleFlight
+from .utils.build_manifest import BuildManifest, make_fingerprint
+from .utils.file_utils import read_json, AtomicFileWriter, FSYNC_POLICIES
+from .utils.output_writer import OutputWriter, RateLimitedLog, ARCHIVE_FORMATS, get_archive_format
+from .utils.telemetry import new_record, TOKEN_TYPES, IMAGE_STATS
+from .config import (
+    DEFAULT_OUTPUT_DIR, DEFAULT_MAX_WORKERS, DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS, DEFAULT_KEEPALIVE_EXPIRY, DEFAULT_CACHE_PATH,
+    DEFAULT_BATCH_MANIFEST_PATH, DEFAULT_MODEL, DEFAULT_MAX_TOKENS, OUTLINE_MAX_TOKENS, SECTION_WORKERS,
+    MAX_CONTINUATIONS, PROMPT_EXPORT_CHUNK_LINES, OUTPUT_FSYNC, DEFAULT_EXEMPLARS_DIR, DEFAULT_IMAGE_CACHE_DIR,
+    BUILD_MANIFEST_NAME
+)
 
 class ContentGenerator:
     """
     Main class for generating content using Claude API
     """
     
-    def __init__(self, api_key=None, metadata_path=None, output_dir=DEFAULT_OUTPUT_DIR):
+    def __init__(self, api_key=None, metadata_path=None, output_dir=DEFAULT_OUTPUT_DIR,
+                 base_url=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY, cache_path=DEFAULT_CACHE_PATH,
+                 refresh_cache=False, telemetry=None, retry_policy=None, sections='auto',
+                 section_workers=SECTION_WORKERS, max_continuations=MAX_CONTINUATIONS, archive_path=None,
+                 fsync=OUTPUT_FSYNC, reference_images=False, exemplars_dir=DEFAULT_EXEMPLARS_DIR,
+                 image_cache_dir=DEFAULT_IMAGE_CACHE_DIR):
         """
         Initialize the ContentGenerator
         
@@ -27,16 +59,177 @@ class ContentGenerator:
             api_key (str, optional): API key for Claude API
             metadata_path (str, optional): Path to metadata file
             output_dir (str, optional): Directory to save generated content
+            base_url (str, optional): Override the API base URL
+            max_connections (int, optional): Maximum open connections in the client pool
+            max_keepalive_connections (int, optional): Maximum idle connections kept open
+            keepalive_expiry (float, optional): Seconds an idle connection is kept open
+            cache_path (str, optional): Path to the response cache, None to disable caching
+            refresh_cache (bool, optional): Ignore cached responses but store fresh ones
+            telemetry (Telemetry, optional): Receives a metrics record for every generation
+            retry_policy (RetryPolicy, optional): Retries, deadline and hedging for every request
+            sections (str, optional): When to generate items as an outline plus concurrent sections:
+                'auto' (long items), 'always' or 'never'
+            section_workers (int, optional): Maximum concurrent section requests per item
+            max_continuations (int, optional): Follow-up requests that may resume a response cut off
+                at max_tokens or a stream that dropped part way
+            archive_path (str, optional): Save files into this .zip or .tar(.gz) archive instead of
+                the output directory
+            fsync (str, optional): When saved files are flushed to disk: 'never', 'file' or 'always'
+            reference_images (bool, optional): Attach matching exemplar images to the requests of
+                file types that take them (see REFERENCE_IMAGE_PATTERNS)
+            exemplars_dir (str, optional): Directory searched for reference images
+            image_cache_dir (str, optional): Directory of downscaled reference images, None to keep
+                them in memory only
+        
+        Raises:
+            ValueError: Unknown fsync policy or archive type
         """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync} (use one of {', '.join(FSYNC_POLICIES)})")
+        if archive_path and get_archive_format(archive_path) is None:
+            raise ValueError(f"Unsupported archive type: {archive_path} (use one of {', '.join(ARCHIVE_FORMATS)})")
+        
         self.api_key = api_key
         self.metadata_path = metadata_path
         self.output_dir = output_dir
         self.metadata = None
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache_path = cache_path
+        self.refresh_cache = refresh_cache
+        self._cache = None
+        self._manifest = None
+        self.telemetry = telemetry
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.sections = sections
+        self.section_workers = section_workers
+        self.max_continuations = max_continuations
+        self.archive_path = archive_path
+        self.fsync = fsync
+        self._writer = None
+        self.reference_images = reference_images
+        self.exemplars_dir = exemplars_dir
+        self.image_cache_dir = image_cache_dir
+        
+        # Concurrent identical requests (batch workers, server jobs) share one API call
+        self.singleflight = SingleFlight()
+        
+        # Token usage totals across every response, including prompt cache reads and writes
+        self.usage = {}
+        self._usage_lock = threading.Lock()
         
         # Load metadata if path is provided
         if metadata_path:
             self.load_metadata(metadata_path)
     
+    @property
+    def client(self):
+        """
+        The shared API client, created on first use
+        
+        Every generation made through this instance reuses the same client and
+        its connection pool.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = create_client(
+                        self.api_key,
+                        base_url=self.base_url,
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry
+                    )
+        return self._client
+    
+    @property
+    def writer(self):
+        """The background output writer, started on first use"""
+        if self._writer is None:
+            with self._client_lock:
+                if self._writer is None:
+                    self._writer = OutputWriter(self.output_dir, self.archive_path, self.fsync)
+        return self._writer
+    
+    @property
+    def cache(self):
+        """The response cache, opened on first use, or None if caching is disabled"""
+        if self._cache is None and self.cache_path:
+            with self._client_lock:
+                if self._cache is None:
+                    self._cache = ResponseCache(self.cache_path)
+        return self._cache
+    
+    @property
+    def manifest(self):
+        """The build manifest of the output directory, opened on first use"""
+        if self._manifest is None:
+            with self._client_lock:
+                if self._manifest is None:
+                    self._manifest = BuildManifest(self.output_dir)
+        return self._manifest
+    
+    def _read_manifest(self):
+        """The build manifest for status checks only; a missing one is not created, nor its directory"""
+        if self._manifest is None and not os.path.exists(os.path.join(self.output_dir, BUILD_MANIFEST_NAME)):
+            return BuildManifest(self.output_dir, read_only=True)
+        return self.manifest
+    
+    def cache_stats(self):
+        """
+        Get response cache statistics
+        
+        Returns:
+            dict: Cache hits, misses, entries and bytes, or None if caching is disabled
+        """
+        return self.cache.stats() if self.cache else None
+    
+    def coalescing_stats(self):
+        """
+        Get statistics on requests that shared an identical request already in flight
+        
+        Returns:
+            dict: API calls made, calls coalesced into them and keys in flight
+        """
+        return self.singleflight.stats()
+    
+    def close(self, abort=False):
+        """
+        Finish writing output files, then close the shared API client, its connections,
+        the response cache, a JSONL metadata store and telemetry sinks
+        
+        Args:
+            abort (bool, optional): Discard the output archive instead of moving it into place
+        """
+        # Before taking the lock: the writer's callbacks record files in the build manifest
+        if self._writer is not None:
+            self._writer.close(abort)
+            self._writer = None
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            if self._cache is not None:
+                self._cache.close()
+                self._cache = None
+            if self._manifest is not None:
+                self._manifest.close()
+                self._manifest = None
+        self._close_metadata()
+        if self.telemetry is not None:
+            self.telemetry.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An interrupted run leaves any previous archive in place
+        self.close(abort=exc_type is not None)
+    
     def load_metadata(self, metadata_path):
         """
         Load metadata from a file
@@ -47,9 +240,17 @@ class ContentGenerator:
         Returns:
             bool: True if metadata was loaded successfully, False otherwise
         """
+        self._close_metadata()
         self.metadata = extract_metadata(metadata_path)
         return bool(self.metadata)
     
+    def _close_metadata(self):
+        """
+        Close the offset index and file handle of a JSONL metadata store
+        """
+        if isinstance(self.metadata, MetadataStore):
+            self.metadata.close()
+    
     def get_categories(self):
         """
         Get the list of categories from metadata
@@ -75,7 +276,7 @@ class ContentGenerator:
             return []
         return get_items_in_category(self.metadata, category)
     
-    def generate_from_metadata(self, category, item_index, include_examples=True, save=True):
+    def generate_from_metadata(self, category, item_index, include_examples=True, save=True, stream=False):
         """
         Generate content from metadata
         
@@ -84,9 +285,16 @@ class ContentGenerator:
             item_index (int): Index of the item in the category
             include_examples (bool, optional): Whether to include examples in the prompt
             save (bool, optional): Whether to save the generated content to a file
+            stream (bool, optional): Stream content into the file (or to stdout when not saving) as it arrives
             
         Returns:
             str: Generated content
+            
+        Raises:
+            GenerationError: The API request failed
+        
+        Saved files are recorded in the build manifest so that later batch
+        runs can skip them while their inputs are unchanged.
         """
         if not self.metadata:
             print("No metadata loaded. Use load_metadata() first.")
@@ -98,22 +306,855 @@ class ContentGenerator:
             print(f"Item not found at index {item_index} in category {category}")
             return None
         
+        started = time.perf_counter()
+        record = self._new_record(item, category)
+        
         # Generate prompt
-        prompt = generate_full_prompt(item, include_examples)
+        system_prompt, prompt = generate_prompt_parts(item, include_examples)
+        self._record_phase(record, 'prompt_build', started)
         
-        # Generate content
-        content = generate_content_with_claude(prompt, api_key=self.api_key)
+        filename = self.get_output_filename(item)
+        on_saved = self._on_saved(filename, self._fingerprint(item, system_prompt, prompt)) if save else None
         
-        # Save content if requested
-        if save:
-            item_name = get_item_name(item)
-            file_type = get_file_type(item)
-            filename = f"{file_type}_{item_name.replace(' ', '_')}.md"
-            write_file(content, filename, self.output_dir)
+        try:
+            # Stream content straight to its destination if requested
+            if stream and not (save and self.archive_path):
+                content, path = self._stream_content(prompt, filename if save else None, system_prompt, record, item)
+                if path:
+                    on_saved(path, None)
+            else:
+                # Generate content
+                content = self._generate_content(prompt, system_prompt, record, item)
+                
+                # Save content if requested
+                if save:
+                    self._write_file(content, filename, record, on_saved, wait=True)
+        finally:
+            self._emit_record(record, started)
         
         return content
     
-    def generate_from_topic(self, topic, file_type="lesson", learning_objectives=None, save=True):
+    def get_output_filename(self, item):
+        """
+        Get the output filename for a metadata item
+        
+        Args:
+            item (dict): Metadata item
+            
+        Returns:
+            str: Filename relative to the output directory
+        """
+        item_name = get_item_name(item)
+        file_type = get_file_type(item)
+        return f"{file_type}_{item_name.replace(' ', '_')}.md"
+    
+    def plan_build(self, categories=None, include_examples=True, items=None):
+        """
+        Work out which items' output files are stale
+        
+        Each item's fingerprint (metadata, assembled prompt and model) is
+        compared with the one recorded in the build manifest when its file
+        was last generated. Nothing is written: without a manifest, every
+        item is 'new'.
+        
+        Args:
+            categories (list, optional): Category names to check, defaults to all categories
+            include_examples (bool, optional): Whether examples are included in the prompt
+            items (list, optional): (category, index) pairs to check instead of whole categories
+            
+        Returns:
+            list: One dict per item with 'category', 'index', 'name', 'filename' and 'status' keys,
+                where status is 'up to date', 'new', 'missing' or 'changed'
+        """
+        if not self.metadata:
+            print("No metadata loaded. Use load_metadata() first.")
+            return []
+        
+        manifest = self._read_manifest()
+        plan = []
+        for category, index, item in self._select_items(categories, items):
+            filename = self.get_output_filename(item)
+            system_prompt, prompt = generate_prompt_parts(item, include_examples)
+            plan.append({
+                'category': category,
+                'index': index,
+                'name': get_item_name(item),
+                'filename': filename,
+                'status': manifest.status(filename, self._fingerprint(item, system_prompt, prompt))
+            })
+        return plan
+    
+    def export_prompts(self, path, categories=None, include_examples=True, items=None):
+        """
+        Write the rendered prompt of every item to a JSON Lines file without calling the API
+        
+        Each line holds an item's 'category', 'index', 'name', 'file_type',
+        'filename', response 'cache_key', estimated 'input_tokens' and its
+        'system' and 'prompt', for offline review, token accounting or batch
+        submission. Each file type's template is compiled once for the whole
+        export. The file is moved into place only when complete.
+        
+        Args:
+            path (str): Path of the JSON Lines file
+            categories (list, optional): Category names to export, defaults to all categories
+            include_examples (bool, optional): Whether examples are included in the prompt
+            items (list, optional): (category, index) pairs to export instead of whole categories
+            
+        Returns:
+            int: Number of prompts written
+        """
+        if not self.metadata:
+            print("No metadata loaded. Use load_metadata() first.")
+            return 0
+        
+        lines = []
+        count = 0
+        with AtomicFileWriter(path) as writer:
+            for category, index, item in self._select_items(categories, items):
+                template, example_prompt = get_item_template(item, include_examples)
+                system_prompt, prompt = template.render(item, example_prompt)
+                line = json.dumps({
+                    'category': category,
+                    'index': index,
+                    'name': get_item_name(item),
+                    'file_type': template.file_type,
+                    'filename': self.get_output_filename(item),
+                    'cache_key': ResponseCache.make_key(DEFAULT_MODEL, DEFAULT_MAX_TOKENS, prompt, system_prompt),
+                    'input_tokens': template.count_tokens(system_prompt, prompt),
+                    'prompt': prompt
+                })
+                # The shared system prompt is encoded once per template and spliced in
+                system_json = template.system_json if system_prompt is template.system_prompt else json.dumps(system_prompt)
+                lines.append(f'{line[:-1]}, "system": {system_json}}}\n')
+                count += 1
+                if len(lines) >= PROMPT_EXPORT_CHUNK_LINES:
+                    writer.write(''.join(lines))
+                    lines.clear()
+            writer.write(''.join(lines))
+        return count
+    
+    def _select_items(self, categories=None, items=None):
+        """
+        Iterate over the selected items of the metadata
+        
+        Args:
+            categories (list, optional): Category names, defaults to all categories
+            items (list, optional): (category, index) pairs to select instead of whole categories
+            
+        Yields:
+            tuple: (category, index, item) for each item that exists
+        """
+        if items is not None:
+            selected = (
+                (category, index, get_item_by_index(self.metadata, category, index)) for category, index in items
+            )
+        else:
+            if categories is None:
+                categories = self.get_categories()
+            selected = (
+                (category, index, item)
+                for category in categories
+                for index, item in enumerate(self.get_items_in_category(category))
+            )
+        
+        for category, index, item in selected:
+            if item:
+                yield category, index, item
+    
+    def generate_batch(self, categories=None, include_examples=True, save=True, max_workers=DEFAULT_MAX_WORKERS,
+                       stream=False, force=False, items=None, on_result=None):
+        """
+        Generate content for every item in one or more categories concurrently
+        
+        Generations run on a bounded thread pool, since each one spends almost
+        all of its time waiting on the API. Results are saved and reported as
+        they complete rather than at the end of the run.
+        
+        When saving, items whose output file is up to date with its inputs
+        (see plan_build()) are skipped unless ``force`` is set. Every item is
+        generated when saving into an archive. Files are written by the output
+        writer and are all on disk when this returns.
+        
+        Args:
+            categories (list, optional): Category names to generate, defaults to all categories
+            include_examples (bool, optional): Whether to include examples in the prompt
+            save (bool, optional): Whether to save the generated content to files
+            max_workers (int, optional): Maximum number of concurrent generations
+            stream (bool, optional): Stream each item into its file as it arrives (ignored when not saving)
+            force (bool, optional): Regenerate items even if their output is up to date
+            items (list, optional): (category, index) pairs to generate instead of whole categories
+            on_result (callable, optional): Called with each result dict as soon as it completes
+            
+        Returns:
+            list: One result dict per generated item with 'category', 'index', 'name', 'content', 'path'
+                and 'error' keys
+        """
+        if not self.metadata:
+            print("No metadata loaded. Use load_metadata() first.")
+            return []
+        
+        # Collect every (category, index) pair up front so progress can be reported
+        if items is not None:
+            jobs = list(items)
+        else:
+            if categories is None:
+                categories = self.get_categories()
+            jobs = []
+            for category in categories:
+                category_items = self.get_items_in_category(category)
+                if not category_items:
+                    print(f"No items found in category '{category}'.")
+                jobs.extend((category, index) for index in range(len(category_items)))
+        
+        # Skip outputs that were built from exactly the current inputs
+        if save and not force and not self.archive_path and jobs:
+            stale = {
+                (entry['category'], entry['index'])
+                for entry in self.plan_build(include_examples=include_examples, items=jobs)
+                if entry['status'] != 'up to date'
+            }
+            stale_jobs = [job for job in jobs if job in stale]
+            skipped = len(jobs) - len(stale_jobs)
+            if skipped:
+                print(f"Skipping {skipped} up-to-date items (use --force to regenerate them)")
+            jobs = stale_jobs
+        
+        results = []
+        if not jobs:
+            return results
+        
+        # Imported here to keep package import (and the listing commands) fast
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        print(f"Generating {len(jobs)} items with up to {max_workers} concurrent workers...")
+        progress = RateLimitedLog()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [
+                executor.submit(self._generate_batch_item, category, index, include_examples, save, stream)
+                for category, index in jobs
+            ]
+            for completed, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                results.append(result)
+                if on_result:
+                    on_result(result)
+                label = f"{result['category']}[{result['index']}] {result['name']}"
+                if result['error']:
+                    print(f"[{completed}/{len(jobs)}] FAILED {label}: {result['error']}")
+                else:
+                    progress.log(f"[{completed}/{len(jobs)}] OK {label}")
+        progress.flush()
+        
+        # Files still being written can fail too
+        if save:
+            self.writer.flush()
+        failed = sum(1 for result in results if result['error'])
+        print(f"Batch complete: {len(results) - failed} succeeded, {failed} failed")
+        return results
+    
+    def enqueue_batch(self, queue, categories=None, include_examples=True, stream=False, force=False):
+        """
+        Record a batch run in a durable job queue, to be generated with run_queue()
+        
+        Only items whose output is stale are queued, unless ``force`` is set.
+        The run's settings are stored with it so it can be resumed as it was
+        started.
+        
+        Args:
+            queue (JobQueue): Queue to record the run in
+            categories (list, optional): Category names to generate, defaults to all categories
+            include_examples (bool, optional): Whether to include examples in the prompt
+            stream (bool, optional): Stream each item into its file as it arrives
+            force (bool, optional): Queue items even if their output is up to date
+            
+        Returns:
+            int: The run ID, or None if there is nothing to generate
+        """
+        if not self.metadata:
+            print("No metadata loaded. Use load_metadata() first.")
+            return None
+        
+        plan = self.plan_build(categories, include_examples)
+        stale = [entry for entry in plan if force or entry['status'] != 'up to date']
+        if len(stale) < len(plan):
+            print(f"Skipping {len(plan) - len(stale)} up-to-date items (use --force to regenerate them)")
+        if not stale:
+            return None
+        
+        return queue.create_run(
+            [(entry['category'], entry['index'], entry['name']) for entry in stale],
+            {
+                'categories': categories,
+                'include_examples': include_examples,
+                'stream': stream,
+                'metadata_path': self.metadata_path,
+                'output_dir': self.output_dir
+            }
+        )
+    
+    def run_queue(self, queue, run_id, max_workers=DEFAULT_MAX_WORKERS, on_result=None):
+        """
+        Generate and save the items of a queued run that are not done yet
+        
+        Items left running by a worker that has since died are picked up
+        again, and items that are already done are never regenerated, so a
+        run that was interrupted continues where it stopped. An item whose
+        metadata changed since it was queued fails instead of generating
+        something else under its name.
+        
+        On KeyboardInterrupt, workers stop claiming items and the items in
+        flight are finished and recorded before the interrupt is re-raised.
+        
+        Args:
+            queue (JobQueue): Queue holding the run
+            run_id (int): ID of the run
+            max_workers (int, optional): Maximum number of concurrent generations
+            on_result (callable, optional): Called with each result dict as soon as it completes
+            
+        Returns:
+            list: One result dict per item generated by this call, as from generate_batch()
+        """
+        options = queue.get_run_options(run_id)
+        if options is None:
+            print(f"No run {run_id} in the job queue.")
+            return []
+        include_examples = options.get('include_examples', True)
+        stream = options.get('stream', False)
+        
+        released = queue.release_lost_jobs(run_id)
+        if released:
+            print(f"Released {released} items left running by stopped workers")
+        counts = queue.counts(run_id)
+        total = sum(counts.values())
+        remaining = counts['pending'] + counts['running']
+        print(
+            f"Run {run_id}: {counts['done']} of {total} items done, {counts['failed']} failed, "
+            f"{remaining} to generate with up to {max_workers} concurrent workers..."
+        )
+        
+        results = []
+        results_lock = threading.Lock()
+        progress = {'done': counts['done']}
+        stop = threading.Event()
+        
+        log = RateLimitedLog()
+        
+        def finish(seq):
+            # Called once the item's file is written, so a done item always has its file
+            def finished(result):
+                if result['error']:
+                    queue.fail(run_id, seq, result['error'])
+                else:
+                    queue.complete(run_id, seq)
+            return finished
+        
+        def work():
+            while not stop.is_set():
+                job = queue.claim(run_id)
+                if job is None:
+                    return
+                result = self._generate_batch_item(
+                    job['category'], job['index'], include_examples, True, stream, expected_name=job['name'],
+                    on_saved=finish(job['seq'])
+                )
+                
+                with results_lock:
+                    results.append(result)
+                    label = f"{result['category']}[{result['index']}] {result['name']}"
+                    if result['error']:
+                        print(f"[{progress['done']}/{total}] FAILED {label}: {result['error']}")
+                    else:
+                        progress['done'] += 1
+                        log.log(f"[{progress['done']}/{total}] OK {label}")
+                    if on_result:
+                        on_result(result)
+        
+        def heartbeat():
+            while not stop.wait(queue.lease_seconds / 3):
+                queue.renew()
+        
+        workers = [threading.Thread(target=work, daemon=True) for _ in range(max(1, max_workers))]
+        renewer = threading.Thread(target=heartbeat, daemon=True)
+        for thread in workers + [renewer]:
+            thread.start()
+        try:
+            for thread in workers:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            print("Interrupted; finishing the items in flight (resume to continue the run)...")
+            stop.set()
+            for thread in workers:
+                thread.join()
+            raise
+        finally:
+            stop.set()
+            log.flush()
+            # Items are marked done as their files are written, before the queue is closed
+            if self._writer is not None:
+                self._writer.flush()
+        
+        counts = queue.counts(run_id)
+        print(
+            f"Run {run_id}: {counts['done']} of {total} items done, {counts['failed']} failed, "
+            f"{counts['pending'] + counts['running']} left"
+        )
+        return results
+    
+    def submit_batch(self, categories=None, include_examples=True, manifest_path=DEFAULT_BATCH_MANIFEST_PATH):
+        """
+        Submit every item in one or more categories as a single Message Batch
+        
+        The batch runs offline on the API side, so there is no client-side
+        concurrency to manage. The batch ID and the item behind each request
+        are saved to a manifest for collect_batch().
+        
+        Args:
+            categories (list, optional): Category names to generate, defaults to all categories
+            include_examples (bool, optional): Whether to include examples in the prompt
+            manifest_path (str, optional): Where to save the batch manifest
+            
+        Returns:
+            str: The batch ID, or None if nothing was submitted
+        """
+        if not self.metadata:
+            print("No metadata loaded. Use load_metadata() first.")
+            return None
+        
+        if categories is None:
+            categories = self.get_categories()
+        
+        requests = []
+        entries = {}
+        for category in categories:
+            items = self.get_items_in_category(category)
+            if not items:
+                print(f"No items found in category '{category}'.")
+            for index, item in enumerate(items):
+                # Custom IDs are limited to 64 letters, digits, '-' and '_'
+                custom_id = f"item-{len(requests)}"
+                system_prompt, prompt = generate_prompt_parts(item, include_examples)
+                images = self._reference_images(item)
+                requests.append((custom_id, prompt, system_prompt, images))
+                entries[custom_id] = {
+                    'category': category,
+                    'index': index,
+                    'name': get_item_name(item),
+                    'filename': self.get_output_filename(item),
+                    'file_type': get_file_type(item),
+                    'cache_key': ResponseCache.make_key(
+                        DEFAULT_MODEL, DEFAULT_MAX_TOKENS, prompt, system_prompt, images
+                    ),
+                    'fingerprint': make_fingerprint(item, system_prompt, prompt, images=images)
+                }
+        
+        if not requests:
+            return None
+        
+        print(f"Submitting {len(requests)} items as a message batch...")
+        batch = submit_message_batch(requests, self.client)
+        
+        manifest = {
+            'batch_id': batch.id,
+            'submitted_at': time.time(),
+            'requests': entries
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        with open(manifest_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+        
+        print(f"Submitted batch {batch.id}; manifest saved to {manifest_path}")
+        return batch.id
+    
+    def collect_batch(self, manifest_path=DEFAULT_BATCH_MANIFEST_PATH, save=True):
+        """
+        Fetch the results of a batch submitted with submit_batch()
+        
+        Successful results are written with the same filenames as
+        generate_from_metadata() and stored in the response cache, so later
+        synchronous runs of the same prompts are served from it. Results cut
+        off at max_tokens are reported as failed and neither saved nor cached.
+        
+        Args:
+            manifest_path (str, optional): Manifest saved by submit_batch()
+            save (bool, optional): Whether to save the generated content to files
+            
+        Returns:
+            list: One result dict per item, as from generate_batch(), or None if the
+                manifest is missing or the batch is still processing
+        """
+        manifest = read_json(manifest_path) if os.path.exists(manifest_path) else None
+        if not manifest:
+            print(f"No batch manifest found at {manifest_path}. Use --batch-submit first.")
+            return None
+        
+        batch_id = manifest['batch_id']
+        batch = self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != 'ended':
+            counts = batch.request_counts
+            print(
+                f"Batch {batch_id} is still {batch.processing_status}: {counts.processing} processing, "
+                f"{counts.succeeded} succeeded, {counts.errored} errored"
+            )
+            return None
+        
+        entries = manifest['requests']
+        results = []
+        progress = RateLimitedLog()
+        for custom_id, content, usage, error in iter_message_batch_results(batch_id, self.client):
+            entry = entries.get(custom_id)
+            if entry is None:
+                continue
+            result = {
+                'category': entry['category'],
+                'index': entry['index'],
+                'name': entry['name'],
+                'content': content,
+                'path': None,
+                'error': error
+            }
+            started = time.perf_counter()
+            record = self._new_record({'topic': entry['name'], 'file_type': entry.get('file_type', 'content')}, entry['category'])
+            if record is not None:
+                record.update(usage or {}, error=error)
+            if usage:
+                self._record_usage(usage)
+            # Only complete responses are cached and saved
+            if content is not None:
+                if self.cache is not None:
+                    self.cache.set(entry['cache_key'], content)
+                if save:
+                    result['path'] = self.writer.path_for(entry['filename'])
+                    self._write_file(
+                        content, entry['filename'], record,
+                        self._on_saved(entry['filename'], entry['fingerprint'], self._on_write_failed(result))
+                    )
+            self._emit_record(record, started)
+            results.append(result)
+            
+            label = f"{result['category']}[{result['index']}] {result['name']}"
+            if result['error']:
+                print(f"[{len(results)}/{len(entries)}] FAILED {label}: {result['error']}")
+            else:
+                progress.log(f"[{len(results)}/{len(entries)}] OK {label}")
+        progress.flush()
+        if save and results:
+            self.writer.flush()
+        
+        failed = sum(1 for result in results if result['error'])
+        print(f"Batch {batch_id} collected: {len(results) - failed} succeeded, {failed} failed")
+        return results
+    
+    def _generate_content(self, prompt, system_prompt=None, record=None, item=None):
+        """Generate content for a prompt with the shared client and response cache, in sections if the item is long"""
+        if item is not None and should_generate_sections(item, self.sections):
+            return self._generate_sections(item, system_prompt, prompt, record)
+        return generate_content_with_claude(
+            prompt, **self._request_options(system_prompt, record, self._reference_images(item))
+        )
+    
+    def _generate_sections(self, item, system_prompt, prompt, record=None, on_text=None):
+        """
+        Generate an item as an outline, then each of its sections concurrently
+        
+        Every request sends the system prompt and the item prompt as cached
+        prefix blocks, followed by the outline or section instruction, so the
+        shared context is paid for in full once. If the outline cannot be
+        parsed, the item is generated in one request instead.
+        
+        Args:
+            item (dict): Metadata item
+            system_prompt (str): Static system prompt
+            prompt (str): Item prompt
+            record (dict, optional): Telemetry record to fill in with the totals of every request
+            on_text (callable, optional): Called with each section, in order, as soon as it and
+                every section before it are done
+            
+        Returns:
+            str: The sections joined in order
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        started = time.perf_counter()
+        on_metrics = self._collect_metrics(record)
+        images = self._reference_images(item)
+        options = dict(self._request_options((system_prompt, prompt), images=images), on_metrics=on_metrics)
+        name = get_item_name(item)
+        
+        try:
+            try:
+                outline = parse_outline(generate_content_with_claude(
+                    generate_outline_prompt(item), **dict(options, max_tokens=OUTLINE_MAX_TOKENS)
+                ))
+            except ValueError as e:
+                print(f"Could not use the outline of {name} ({e}); generating it in one request")
+                content = generate_content_with_claude(
+                    prompt, **dict(self._request_options(system_prompt, images=images), on_metrics=on_metrics)
+                )
+                if on_text:
+                    on_text(content)
+                return content
+            
+            print(f"Generating {name} in {len(outline)} sections...")
+            if record is not None:
+                record['sections'] = len(outline)
+            sections = []
+            executor = ThreadPoolExecutor(max_workers=max(1, min(len(outline), self.section_workers)))
+            try:
+                futures = [
+                    executor.submit(
+                        generate_content_with_claude, generate_section_prompt(item, outline, position), **options
+                    )
+                    for position in range(len(outline))
+                ]
+                # Sections are delivered in order, each as soon as the ones before it are done
+                for future in futures:
+                    sections.append(future.result().strip())
+                    if on_text:
+                        on_text(sections[-1] if len(sections) == 1 else f"\n\n{sections[-1]}")
+            finally:
+                # A failed section cancels the ones that have not started
+                executor.shutdown(wait=True, cancel_futures=True)
+            return stitch_sections(sections)
+        finally:
+            self._record_phase(record, 'api', started)
+    
+    def _collect_metrics(self, record):
+        """Get an on_metrics callback that totals the metrics of several requests into one record"""
+        if record is None:
+            return None
+        lock = threading.Lock()
+        cached = []
+        
+        def collect(metrics):
+            with lock:
+                for key in TOKEN_TYPES + IMAGE_STATS + ('retries', 'hedged', 'continuations'):
+                    record[key] = (record.get(key) or 0) + (metrics.get(key) or 0)
+                cached.append(bool(metrics.get('cached')))
+                record['cached'] = all(cached)
+                # A truncated section makes the whole item truncated
+                if metrics.get('stop_reason') and record.get('stop_reason') != 'max_tokens':
+                    record['stop_reason'] = metrics['stop_reason']
+                record['error'] = record.get('error') or metrics.get('error')
+        return collect
+    
+    def _request_options(self, system_prompt=None, record=None, images=None):
+        """Keyword arguments shared by every API request made by this instance"""
+        return {
+            'client': self.client,
+            'cache': self.cache,
+            'refresh': self.refresh_cache,
+            'system': system_prompt,
+            'on_usage': self._record_usage,
+            'retry': self.retry_policy,
+            'singleflight': self.singleflight,
+            'max_continuations': self.max_continuations,
+            'images': images,
+            # The API metrics use the same keys as the telemetry record
+            'on_metrics': record.update if record is not None else None
+        }
+    
+    def _reference_images(self, item):
+        """Load the reference images sent with an item's requests, or None if there are none"""
+        if not self.reference_images or item is None:
+            return None
+        # Imported here to keep package import fast
+        from .extractors.image_extractor import get_reference_images
+        return get_reference_images(item, self.exemplars_dir, cache_dir=self.image_cache_dir) or None
+    
+    def _fingerprint(self, item, system_prompt, prompt):
+        """Fingerprint the inputs of an item's output file, including its reference images and generation mode"""
+        outline = None
+        if should_generate_sections(item, self.sections):
+            outline = (generate_outline_prompt(item), OUTLINE_MAX_TOKENS)
+        return make_fingerprint(item, system_prompt, prompt, images=self._reference_images(item), outline=outline)
+    
+    def _new_record(self, item, category=None):
+        """Start the telemetry record of one generation, or None when telemetry is off"""
+        if self.telemetry is None:
+            return None
+        return new_record(category, get_file_type(item), get_item_name(item))
+    
+    def _record_phase(self, record, phase, started):
+        """Record the wall time of a phase that began at ``started``"""
+        if record is not None:
+            record[f"{phase}_seconds"] = time.perf_counter() - started
+    
+    def _emit_record(self, record, started):
+        """Finish a telemetry record and send it to the sinks"""
+        if record is not None:
+            self._record_phase(record, 'total', started)
+            self.telemetry.emit(record)
+    
+    def _write_file(self, content, filename, record=None, on_saved=None, wait=False):
+        """
+        Queue content to be written to the output directory (or archive), timing the hand-off
+        
+        Args:
+            content (str): Content to save
+            filename (str): Filename relative to the output directory
+            record (dict, optional): Telemetry record to fill in
+            on_saved (callable, optional): Called as on_saved(path, error) once the file is written or has failed
+            wait (bool, optional): Return only once the file is written
+            
+        Returns:
+            str: The path the file is written to
+        """
+        started = time.perf_counter()
+        path = self.writer.submit(content, filename, on_saved)
+        if wait:
+            self.writer.flush()
+        self._record_phase(record, 'write', started)
+        return path
+    
+    def _on_saved(self, filename, fingerprint, then=None):
+        """
+        Make the callback for a queued write that records the file in the build manifest once it is written
+        
+        Files saved into an archive are not recorded, as they are not in the output directory.
+        
+        Args:
+            filename (str): Filename relative to the output directory
+            fingerprint (str): Fingerprint of the file's inputs
+            then (callable, optional): Called afterwards with the same (path, error) arguments
+        """
+        def saved(path, error):
+            if error is None and not self.archive_path:
+                self.manifest.record(filename, fingerprint)
+            if then is not None:
+                then(path, error)
+        return saved
+    
+    def _on_write_failed(self, result, then=None):
+        """
+        Make the callback for a queued write that marks a batch result failed if its file could not be written
+        
+        Args:
+            result (dict): Batch result of the item
+            then (callable, optional): Called afterwards with the result
+        """
+        def saved(path, error):
+            if error is not None:
+                result['path'] = None
+                result['error'] = f"Failed to save content: {error}"
+            if then is not None:
+                then(result)
+        return saved
+    
+    def _record_usage(self, counts):
+        """Add the token counts of one response to the running totals"""
+        with self._usage_lock:
+            for key, value in counts.items():
+                self.usage[key] = self.usage.get(key, 0) + value
+    
+    def _stream_content(self, prompt, filename=None, system_prompt=None, record=None, item=None):
+        """
+        Stream content for a prompt into a file in the output directory, or to stdout
+        
+        The file is written through a temporary file that is renamed into place
+        only if generation succeeds. A long item generated in sections is
+        streamed a section at a time.
+        
+        Args:
+            prompt (str): The user prompt
+            filename (str, optional): Output filename, None to echo to stdout
+            system_prompt (str, optional): Static system prompt
+            record (dict, optional): Telemetry record to fill in
+            item (dict, optional): Metadata item, to decide whether to generate in sections
+            
+        Returns:
+            tuple: (content, path) where path is None unless the file was saved
+        """
+        if item is not None and should_generate_sections(item, self.sections):
+            def generate(on_text):
+                return self._generate_sections(item, system_prompt, prompt, record, on_text)
+        else:
+            options = self._request_options(system_prompt, record, self._reference_images(item))
+            def generate(on_text):
+                return stream_content_with_claude(prompt, on_text, **options)
+        
+        if filename is None:
+            def echo(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            return generate(echo), None
+        
+        # A failed generation leaves no partial file behind
+        writer = AtomicFileWriter(filename, self.output_dir, self.fsync)
+        try:
+            content = generate(writer.write)
+        except BaseException:
+            writer.abort()
+            raise
+        
+        # Chunks were written as they arrived; the write phase is the final flush and rename
+        started = time.perf_counter()
+        path = writer.commit()
+        self._record_phase(record, 'write', started)
+        return content, path
+    
+    def _generate_batch_item(self, category, index, include_examples, save, stream=False, expected_name=None,
+                             on_saved=None):
+        """
+        Generate and save a single item for generate_batch, capturing any failure
+        
+        Saving is queued on the output writer, so the result is returned before
+        its file is written. ``on_saved`` is called with the result once the
+        file is written, or straight away if the item failed or was not saved;
+        a failed write sets the result's 'error'.
+        """
+        queued = False
+        result = {
+            'category': category,
+            'index': index,
+            'name': None,
+            'content': None,
+            'path': None,
+            'error': None
+        }
+        started = time.perf_counter()
+        record = None
+        try:
+            item = get_item_by_index(self.metadata, category, index)
+            if not item:
+                result['error'] = f"Item not found at index {index} in category {category}"
+                return result
+            result['name'] = get_item_name(item)
+            if expected_name is not None and result['name'] != expected_name:
+                result['error'] = f"Metadata changed: expected '{expected_name}' at index {index} in category {category}"
+                return result
+            record = self._new_record(item, category)
+            
+            system_prompt, prompt = generate_prompt_parts(item, include_examples)
+            self._record_phase(record, 'prompt_build', started)
+            filename = self.get_output_filename(item)
+            if stream and save and not self.archive_path:
+                content, result['path'] = self._stream_content(prompt, filename, system_prompt, record, item)
+            else:
+                content = self._generate_content(prompt, system_prompt, record, item)
+            result['content'] = content
+            
+            if save:
+                on_written = self._on_saved(
+                    filename, self._fingerprint(item, system_prompt, prompt), self._on_write_failed(result, on_saved)
+                )
+                if result['path']:
+                    on_written(result['path'], None)
+                else:
+                    # Set before queueing, as a failed write clears it from the writer thread
+                    queued = True
+                    result['path'] = self.writer.path_for(filename)
+                    self._write_file(content, filename, record, on_written)
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            if record is not None:
+                record['error'] = record['error'] or result['error']
+                self._emit_record(record, started)
+            if on_saved and not queued and not (save and result['path']):
+                on_saved(result)
+        return result
+    
+    def generate_from_topic(self, topic, file_type="lesson", learning_objectives=None, save=True, stream=False):
         """
         Generate content from a topic
         
@@ -122,19 +1163,35 @@ class ContentGenerator:
             file_type (str, optional): Type of file (e.g., 'lesson', 'lab')
             learning_objectives (list, optional): List of learning objectives
             save (bool, optional): Whether to save the generated content to a file
+            stream (bool, optional): Stream content into the file (or to stdout when not saving) as it arrives
             
         Returns:
             str: Generated content
+            
+        Raises:
+            GenerationError: The API request failed
         """
-        # Generate prompt
-        prompt = generate_prompt_from_topic(topic, file_type, learning_objectives)
+        started = time.perf_counter()
         
-        # Generate content
-        content = generate_content_with_claude(prompt, api_key=self.api_key)
+        # Generate prompt
+        item = build_topic_item(topic, file_type, learning_objectives)
+        record = self._new_record(item)
+        system_prompt, prompt = generate_prompt_parts(item)
+        self._record_phase(record, 'prompt_build', started)
+        filename = f"{file_type}_{topic.replace(' ', '_')}.md"
         
-        # Save content if requested
-        if save:
-            filename = f"{file_type}_{topic.replace(' ', '_')}.md"
-            write_file(content, filename, self.output_dir)
+        try:
+            # Stream content straight to its destination if requested
+            if stream and not (save and self.archive_path):
+                content, _ = self._stream_content(prompt, filename if save else None, system_prompt, record, item)
+            else:
+                # Generate content
+                content = self._generate_content(prompt, system_prompt, record, item)
+                
+                # Save content if requested
+                if save:
+                    self._write_file(content, filename, record, wait=True)
+        finally:
+            self._emit_record(record, started)
         
         return content
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the content generator package.
+
+Each module can be run directly, e.g. ``python -m content_generator.benchmarks.bench_client``.
+"""
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for per-request API client overhead.
+
+Compares building a new client for every request against reusing one pooled
+client, using a local stub server so that only client-side overhead and
+connection setup are measured.
+"""
+
+import argparse
+import time
+from ..utils.api_utils import generate_content_with_claude, create_client
+from ..utils.stub_server import StubAPIServer
+
+def time_requests(send, requests):
+    """Time ``requests`` calls to ``send`` and return the mean milliseconds per request"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        send()
+    return (time.perf_counter() - start) * 1000 / requests
+
+def run_benchmark(requests=200):
+    """
+    Run the client overhead benchmark
+    
+    Args:
+        requests (int, optional): Number of requests per scenario
+        
+    Returns:
+        dict: Mean milliseconds per request and connections opened, by scenario
+    """
+    results = {}
+    with StubAPIServer() as server:
+        # Before: every call builds its own client, pool and connection
+        def fresh_client():
+            client = create_client('bench', base_url=server.base_url)
+            generate_content_with_claude("Benchmark prompt", max_tokens=16, client=client)
+            client.close()
+        
+        # Warm up imports and the server before timing anything
+        fresh_client()
+        
+        connections = server.connection_count
+        results['per_request_client'] = {
+            'ms_per_request': time_requests(fresh_client, requests),
+            'connections': server.connection_count - connections
+        }
+        
+        # After: one long-lived client shared by every call
+        client = create_client('bench', base_url=server.base_url)
+        connections = server.connection_count
+        results['pooled_client'] = {
+            'ms_per_request': time_requests(
+                lambda: generate_content_with_claude("Benchmark prompt", max_tokens=16, client=client),
+                requests
+            ),
+            'connections': server.connection_count - connections
+        }
+        client.close()
+    
+    return results
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description='Benchmark per-request API client overhead')
+    parser.add_argument('--requests', type=int, default=200, help='Number of requests per scenario')
+    args = parser.parse_args()
+    
+    results = run_benchmark(args.requests)
+    for name, result in results.items():
+        print(f"{name:<20} {result['ms_per_request']:8.3f} ms/request  {result['connections']:5d} connections")
+    
+    before = results['per_request_client']['ms_per_request']
+    after = results['pooled_client']['ms_per_request']
+    print(f"Overhead saved per request: {before - after:.3f} ms ({before / after:.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
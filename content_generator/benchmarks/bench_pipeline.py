@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the local (non-network) pipeline stages.
+
+Times and measures the peak memory of each stage separately over synthetic
+catalogs of increasing size: metadata loading (JSON, and JSONL through the
+offset index), item lookup, prompt assembly with and without examples,
+bulk prompt export, example extraction and writing output files. Results are written as JSON,
+and can be compared against an earlier run to catch regressions; compare
+runs from the same machine, as timings are not portable.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from .. import ContentGenerator
+from ..config import EXAMPLE_PATHS
+from ..extractors.example_extractor import extract_example_content, clear_example_cache
+from ..extractors.metadata_extractor import extract_metadata, get_item_by_index
+from ..extractors.metadata_store import MetadataStore, write_jsonl
+from ..generators import prompt_generator
+from ..generators.prompt_generator import generate_full_prompt, clear_static_prompt_cache
+from ..utils.file_utils import write_file
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+# Per-item stages run over at most this many items, so large catalogs finish in reasonable time
+DEFAULT_MAX_OPS = 10000
+
+# Timings are the best of this many runs, to filter out scheduling and disk noise
+DEFAULT_REPEAT = 3
+
+# A stage is reported as a regression when it is this much slower than the
+# baseline; stages that took under MIN_COMPARE_SECONDS are too noisy to compare
+DEFAULT_TOLERANCE = 0.5
+MIN_COMPARE_SECONDS = 0.005
+
+def make_catalog(size, categories=10):
+    """Build a synthetic catalog of ``size`` items spread over ``categories`` categories"""
+    per_category = max(1, size // categories)
+    catalog = {}
+    for number in range(size):
+        category = f"Category_{number // per_category}"
+        catalog.setdefault(category, []).append({
+            'topic': f"Benchmark Topic {number}",
+            'file_type': 'lesson',
+            'learning_objectives': [f"Objective {number}.{j}" for j in range(4)],
+            'content_metrics': {'word_count': 1000, 'text_to_code_ratio': 0.7, 'number_of_images': 2},
+            'course_description': "A synthetic item used to benchmark the local pipeline. " * 4
+        })
+    return catalog
+
+def measure(run, ops, repeat=DEFAULT_REPEAT):
+    """
+    Time a stage, then run it once more under tracemalloc for its peak memory
+
+    Args:
+        run (callable): The stage; called ``repeat + 1`` times
+        ops (int): Number of operations one call performs
+        repeat (int, optional): Timed runs; the fastest is reported
+
+    Returns:
+        dict: 'ops', 'seconds', 'per_op_us', 'ops_per_second' and 'peak_bytes'
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'ops': ops,
+        'seconds': seconds,
+        'per_op_us': seconds / ops * 1e6 if ops else 0.0,
+        'ops_per_second': ops / seconds if seconds else 0.0,
+        'peak_bytes': peak
+    }
+
+def run_size(size, work_dir, max_ops=DEFAULT_MAX_OPS, repeat=DEFAULT_REPEAT):
+    """
+    Benchmark every stage over one catalog size
+
+    Args:
+        size (int): Number of items in the catalog
+        work_dir (str): Scratch directory
+        max_ops (int, optional): Cap on operations for per-item stages
+        repeat (int, optional): Timed runs per stage
+
+    Returns:
+        dict: Measurements by stage name
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _run_size(size, work_dir, max_ops, repeat)
+
+def _run_size(size, work_dir, max_ops, repeat):
+    """Prepare the catalog for one size and measure every stage"""
+    catalog = make_catalog(size)
+    json_path = os.path.join(work_dir, f"catalog_{size}.json")
+    jsonl_path = os.path.join(work_dir, f"catalog_{size}.jsonl")
+    index_dir = os.path.join(work_dir, f"index_{size}")
+    output_dir = os.path.join(work_dir, f"output_{size}")
+    with open(json_path, 'w', encoding='utf-8') as file:
+        json.dump(catalog, file)
+    write_jsonl(catalog, jsonl_path)
+
+    metadata = extract_metadata(json_path)
+    items = [item for category_items in metadata.values() for item in category_items]
+    rng = random.Random(size)
+    lookups = [
+        (category, rng.randrange(len(metadata[category])))
+        for category in rng.choices(list(metadata), k=min(size, max_ops))
+    ]
+    sample = items[:max_ops]
+    example_path = EXAMPLE_PATHS['lesson']
+    content = "# Generated lesson\n\n" + "Some generated text with `code`.\n" * 200
+
+    def load_jsonl_cold():
+        for name in os.listdir(index_dir) if os.path.isdir(index_dir) else ():
+            os.remove(os.path.join(index_dir, name))
+        MetadataStore(jsonl_path, index_dir).close()
+
+    def load_jsonl_warm():
+        MetadataStore(jsonl_path, index_dir).close()
+
+    store = MetadataStore(jsonl_path, index_dir)
+
+    def lookup(source):
+        def run():
+            for category, index in lookups:
+                get_item_by_index(source, category, index)
+        return run
+
+    def prompts(include_examples):
+        def run():
+            clear_static_prompt_cache()
+            for item in sample:
+                generate_full_prompt(item, include_examples)
+        return run
+
+    exporter = ContentGenerator(api_key='benchmark', cache_path=None)
+    exporter.metadata = {'Benchmark': sample}
+    prompts_path = os.path.join(work_dir, f"prompts_{size}.jsonl")
+
+    def export_prompts():
+        clear_static_prompt_cache()
+        exporter.export_prompts(prompts_path)
+
+    def extract_cold():
+        for _ in range(len(sample)):
+            clear_example_cache()
+            extract_example_content(file_path=example_path)
+
+    def extract_warm():
+        clear_example_cache()
+        for _ in range(len(sample)):
+            extract_example_content(file_path=example_path)
+
+    def write_files():
+        for number in range(len(sample)):
+            write_file(content, f"item_{number}.md", output_dir)
+
+    stages = {
+        'load_json': (lambda: extract_metadata(json_path), 1),
+        'load_jsonl_cold': (load_jsonl_cold, 1),
+        'load_jsonl_warm': (load_jsonl_warm, 1),
+        'lookup_json': (lookup(metadata), len(lookups)),
+        'lookup_jsonl': (lookup(store), len(lookups)),
+        'prompt_with_examples': (prompts(True), len(sample)),
+        'prompt_without_examples': (prompts(False), len(sample)),
+        'prompt_export': (export_prompts, len(sample)),
+        'example_extraction_cold': (extract_cold, len(sample)),
+        'example_extraction_warm': (extract_warm, len(sample)),
+        'write_file': (write_files, len(sample))
+    }
+
+    results = {}
+    try:
+        for name, (run, ops) in stages.items():
+            results[name] = measure(run, ops, repeat)
+    finally:
+        store.close()
+    return results
+
+def run_benchmark(sizes=DEFAULT_SIZES, max_ops=DEFAULT_MAX_OPS, repeat=DEFAULT_REPEAT):
+    """
+    Run the pipeline benchmarks
+
+    Exemplar retrieval is switched off and a fixed example file is used, so
+    results do not depend on the local exemplar index or sample content.
+
+    Args:
+        sizes (iterable, optional): Catalog sizes to benchmark
+        max_ops (int, optional): Cap on operations for per-item stages
+        repeat (int, optional): Timed runs per stage
+
+    Returns:
+        dict: Environment details and a list of measurements, one per size and stage
+    """
+    report = {
+        'benchmark': 'pipeline',
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'max_ops': max_ops,
+        'repeat': repeat,
+        'results': []
+    }
+
+    original_path = EXAMPLE_PATHS['lesson']
+    original_retrieval = prompt_generator.EXAMPLE_RETRIEVAL
+    with tempfile.TemporaryDirectory() as work_dir:
+        example_path = os.path.join(work_dir, 'example.md')
+        with open(example_path, 'w', encoding='utf-8') as file:
+            file.write("## Example section\n\nSome example lesson text with `code`.\n\n" * 400)
+        EXAMPLE_PATHS['lesson'] = example_path
+        prompt_generator.EXAMPLE_RETRIEVAL = False
+        try:
+            for size in sizes:
+                for stage, measurement in run_size(size, work_dir, max_ops, repeat).items():
+                    report['results'].append(dict(measurement, size=size, stage=stage))
+        finally:
+            EXAMPLE_PATHS['lesson'] = original_path
+            prompt_generator.EXAMPLE_RETRIEVAL = original_retrieval
+            clear_example_cache()
+            clear_static_prompt_cache()
+
+    return report
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Find stages that got slower than a baseline run
+
+    Args:
+        report (dict): Results of run_benchmark
+        baseline (dict): Earlier results of run_benchmark
+        tolerance (float, optional): Allowed slowdown as a fraction of the baseline time per operation
+
+    Returns:
+        list: (size, stage, baseline per-op µs, current per-op µs) for each regression
+    """
+    previous = {(result['size'], result['stage']): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['size'], result['stage']))
+        if not before or before['seconds'] < MIN_COMPARE_SECONDS:
+            continue
+        if result['per_op_us'] > before['per_op_us'] * (1 + tolerance):
+            regressions.append((result['size'], result['stage'], before['per_op_us'], result['per_op_us']))
+    return regressions
+
+def main():
+    """Run the benchmarks, print and save the results"""
+    parser = argparse.ArgumentParser(description='Benchmark the local pipeline stages')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Catalog sizes to benchmark')
+    parser.add_argument('--max-ops', type=int, default=DEFAULT_MAX_OPS, help='Cap on operations for per-item stages')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per stage; the fastest is reported')
+    parser.add_argument('--output', type=str, default='bench_pipeline.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', type=str, metavar='BASELINE', help='Earlier results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.max_ops, args.repeat)
+    print(f"{'size':>7} {'stage':<24} {'ops':>6} {'per op':>12} {'ops/s':>12} {'peak memory':>12}")
+    for result in report['results']:
+        print(
+            f"{result['size']:>7} {result['stage']:<24} {result['ops']:>6} {result['per_op_us']:>10.1f}µs "
+            f"{result['ops_per_second']:>12.0f} {result['peak_bytes'] / 1024:>10.0f}KB"
+        )
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for size, stage, before, after in regressions:
+            print(f"REGRESSION {stage} at {size} items: {before:.1f}µs -> {after:.1f}µs per op")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for batch prompt assembly.
+
+Assembles prompts for many synthetic items against a real example file, once
+with the in-process example and static prompt caches cleared before every
+prompt (every prompt re-reads the example) and once with warm caches.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from ..config import EXAMPLE_PATHS
+from ..extractors import example_extractor
+from ..extractors.example_extractor import clear_example_cache
+from ..generators.prompt_generator import generate_full_prompt, clear_static_prompt_cache
+
+def make_items(count):
+    """Build ``count`` synthetic lesson items"""
+    return [
+        {
+            'topic': f"Benchmark Topic {i}",
+            'file_type': 'lesson',
+            'learning_objectives': [f"Objective {i}.{j}" for j in range(3)],
+            'content_metrics': {'word_count': 1000, 'text_to_code_ratio': 0.7}
+        }
+        for i in range(count)
+    ]
+
+def count_reads(run):
+    """Run ``run`` and return how many example files it read"""
+    reads = []
+    original = example_extractor.read_example_content
+    example_extractor.read_example_content = lambda path, *args: reads.append(path) or original(path, *args)
+    try:
+        run()
+    finally:
+        example_extractor.read_example_content = original
+    return len(reads)
+
+def run_benchmark(count=10000):
+    """
+    Run the prompt assembly benchmark
+    
+    Args:
+        count (int, optional): Number of prompts to assemble per scenario
+        
+    Returns:
+        dict: Prompts per second and example file reads, by scenario
+    """
+    items = make_items(count)
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as example_dir:
+        # A realistically sized example lesson
+        example_path = os.path.join(example_dir, 'example.md')
+        with open(example_path, 'w', encoding='utf-8') as file:
+            file.write("## Example section\n\nSome example lesson text with `code`.\n\n" * 400)
+        
+        original_path = EXAMPLE_PATHS['lesson']
+        EXAMPLE_PATHS['lesson'] = example_path
+        try:
+            def cold():
+                for item in items:
+                    clear_example_cache()
+                    clear_static_prompt_cache()
+                    generate_full_prompt(item)
+            
+            def warm():
+                for item in items:
+                    generate_full_prompt(item)
+            
+            for name, run in (('cold_caches', cold), ('warm_caches', warm)):
+                clear_example_cache()
+                clear_static_prompt_cache()
+                start = time.perf_counter()
+                reads = count_reads(run)
+                elapsed = time.perf_counter() - start
+                results[name] = {'prompts_per_second': count / elapsed, 'example_reads': reads}
+        finally:
+            EXAMPLE_PATHS['lesson'] = original_path
+            clear_example_cache()
+            clear_static_prompt_cache()
+    
+    return results
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description='Benchmark batch prompt assembly')
+    parser.add_argument('--count', type=int, default=10000, help='Number of prompts to assemble')
+    args = parser.parse_args()
+    
+    results = run_benchmark(args.count)
+    for name, result in results.items():
+        print(f"{name:<12} {result['prompts_per_second']:12.0f} prompts/s  {result['example_reads']:6d} example reads")
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,17 @@ Command-line interface for the Content Generator package.
 
 import argparse
 import sys
+import time
 from . import ContentGenerator
-from .config import DEFAULT_METADATA_PATH, DEFAULT_OUTPUT_DIR
+from .utils.retry_utils import RetryPolicy, GenerationError
+from .utils.job_queue import JobQueue
+from .generators.section_generator import SECTION_MODES
+from .utils.file_utils import FSYNC_POLICIES
+from .config import (
+    DEFAULT_METADATA_PATH, DEFAULT_OUTPUT_DIR, DEFAULT_MAX_WORKERS, DEFAULT_MAX_CONNECTIONS, DEFAULT_CACHE_PATH,
+    DEFAULT_EXEMPLARS_DIR, DEFAULT_INDEX_PATH, DEFAULT_BATCH_MANIFEST_PATH, RETRY_MAX_ATTEMPTS,
+    DEFAULT_REQUEST_DEADLINE, DEFAULT_JOB_QUEUE_PATH, MAX_CONTINUATIONS, OUTPUT_FSYNC
+)
 
 def parse_args():
     """Parse command-line arguments"""
@@ -20,14 +29,59 @@ def parse_args():
     # Metadata-based generation
     parser.add_argument('--metadata', type=str, default=DEFAULT_METADATA_PATH, help='Path to metadata file')
     parser.add_argument('--category', type=str, help='Category in metadata')
-    parser.add_argument('--item', type=int, help='Item index in category')
+    parser.add_argument('--item', type=int, help='Item index in category (omit to generate the whole category)')
+    parser.add_argument('--all', action='store_true', help='Generate every item in every category')
     parser.add_argument('--list-categories', action='store_true', help='List categories in metadata')
     parser.add_argument('--list-items', type=str, help='List items in a category')
+    parser.add_argument('--export-jsonl', type=str, metavar='PATH', help='Write the metadata as JSON Lines for lazy, indexed loading')
+    
+    # Offline bulk generation with the Message Batches API
+    parser.add_argument('--batch-submit', action='store_true', help='Submit --all or --category as one message batch instead of generating now')
+    parser.add_argument('--batch-collect', action='store_true', help='Fetch and save the results of the submitted message batch')
+    parser.add_argument('--batch-manifest', type=str, default=DEFAULT_BATCH_MANIFEST_PATH, help='Path to the message batch manifest')
+    
+    # Durable job queue for saved batch runs
+    parser.add_argument('--resume', action='store_true', help='Continue the last interrupted --all or --category run')
+    parser.add_argument('--retry-failed', action='store_true', help='With --resume, also retry the items that failed')
+    parser.add_argument('--queue-path', type=str, default=DEFAULT_JOB_QUEUE_PATH, help='Path to the job queue')
+    
+    # Exemplar index
+    parser.add_argument('--build-index', action='store_true', help='Build or incrementally update the exemplar index')
+    parser.add_argument('--search-exemplars', type=str, help='Search the exemplar index for passages')
+    parser.add_argument('--exemplars-dir', type=str, default=DEFAULT_EXEMPLARS_DIR, help='Directory containing exemplars')
+    parser.add_argument('--index-path', type=str, default=DEFAULT_INDEX_PATH, help='Path to the exemplar index')
+    parser.add_argument('--index-workers', type=int, help='Extraction worker processes (default: one per core)')
+    parser.add_argument('--timings', action='store_true', help='Print per-document extraction timings after indexing')
     
     # Options
     parser.add_argument('--no-examples', action='store_true', help='Do not include examples in prompt')
     parser.add_argument('--no-save', action='store_true', help='Do not save generated content to file')
+    parser.add_argument('--archive', type=str, metavar='PATH', help='Save generated files into this .zip or .tar(.gz) archive instead of the output directory')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=OUTPUT_FSYNC, help='When saved files are flushed to disk: never, each file, or always (files and their directory)')
+    parser.add_argument('--reference-images', action='store_true', help='Attach matching exemplar art (downscaled and cached) to course landing page prompts')
+    parser.add_argument('--stream', action='store_true', help='Stream content to the output file (or stdout with --no-save) as it is generated')
     parser.add_argument('--objectives', type=str, nargs='+', help='Learning objectives')
+    parser.add_argument('--force', action='store_true', help='Regenerate items even if their output is up to date')
+    parser.add_argument('--dry-run', action='store_true', help='List the items whose output is stale without generating anything')
+    parser.add_argument('--prompts-out', type=str, metavar='PATH', help='With --dry-run, write the rendered prompt of every selected item to this JSON Lines file instead')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help='Maximum concurrent generations in batch mode')
+    parser.add_argument('--sections', choices=SECTION_MODES, default='auto', help='Generate items as an outline plus concurrent sections: auto (long items), always or never')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS, help='Maximum open connections in the API client pool')
+    
+    # Retries
+    parser.add_argument('--max-attempts', type=int, default=RETRY_MAX_ATTEMPTS, help='Attempts per request before giving up on transient errors')
+    parser.add_argument('--deadline', type=float, default=DEFAULT_REQUEST_DEADLINE, help='Seconds a request may take across all attempts')
+    parser.add_argument('--hedge', action='store_true', help='Send a duplicate of requests slower than the recent p95 latency')
+    parser.add_argument('--max-continuations', type=int, default=MAX_CONTINUATIONS, help='Follow-up requests that may resume a response cut off at max_tokens or a dropped stream')
+    
+    # Response cache
+    parser.add_argument('--cache-path', type=str, default=DEFAULT_CACHE_PATH, help='Path to the response cache')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the response cache')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached responses and store fresh ones')
+    
+    # Per-request telemetry
+    parser.add_argument('--metrics-out', type=str, metavar='PATH', help='Write latency histograms and token counters in Prometheus text format')
+    parser.add_argument('--metrics-log', type=str, metavar='PATH', help='Append a JSON metrics record per request to this file')
     
     return parser.parse_args()
 
@@ -44,27 +98,109 @@ def list_categories(generator):
 
 def list_items(generator, category):
     """List items in a category"""
-    items = generator.get_items_in_category(category)
-    if not items:
+    from .extractors.metadata_extractor import get_item_names
+    names = get_item_names(generator.metadata or {}, category)
+    if not names:
         print(f"No items found in category '{category}'.")
         return
     
     print(f"Items in category '{category}':")
-    for i, item in enumerate(items):
-        from .extractors.metadata_extractor import get_item_name
-        name = get_item_name(item)
+    for i, name in enumerate(names):
         print(f"{i}. {name}")
 
-def main():
-    """Main entry point for the CLI"""
-    args = parse_args()
+def build_index(args):
+    """Build or incrementally update the exemplar index"""
+    from .extractors.exemplar_index import ExemplarIndex
+    print(f"Indexing exemplars in '{args.exemplars_dir}'...")
+    with ExemplarIndex(args.index_path) as index:
+        stats = index.build(args.exemplars_dir, max_workers=args.index_workers)
     
-    # Initialize the generator
-    generator = ContentGenerator(
-        metadata_path=args.metadata,
-        output_dir=args.output
+    if args.timings and stats['results']:
+        from .extractors.extraction_pipeline import format_timings
+        print("Extraction timings (slowest first):")
+        print(format_timings(stats['results']))
+    
+    print(
+        f"Index updated: {stats['added']} added, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+        f"{stats['removed']} removed, {stats['skipped']} skipped"
+    )
+
+def search_exemplars(args):
+    """Print the exemplar passages that best match a query"""
+    from .extractors.example_extractor import search_exemplar_passages
+    results = search_exemplar_passages(args.search_exemplars, index_path=args.index_path)
+    if not results:
+        print("No matching passages found. Use --build-index to build the exemplar index.")
+        return
+    
+    for result in results:
+        print(f"\n=== {result['path']} (passage {result['passage']}, score {result['score']:.2f}) ===\n")
+        print(result['text'])
+
+def print_content(content, args):
+    """Print generated content when it was not saved (streamed content has already been printed)"""
+    if not args.no_save:
+        return
+    
+    if not args.stream:
+        print("\n=== Generated Content ===\n")
+        print(content)
+    print("\n=== End of Generated Content ===\n")
+
+def print_build_plan(generator, args):
+    """Print the items whose output files are stale, as --dry-run"""
+    plan = generator.plan_build(None if args.all else [args.category], include_examples=not args.no_examples)
+    if args.item is not None:
+        plan = [entry for entry in plan if entry['index'] == args.item]
+    
+    stale = [entry for entry in plan if entry['status'] != 'up to date']
+    for entry in stale:
+        print(f"{entry['status']:>8}  {entry['category']}[{entry['index']}] {entry['name']} -> {entry['filename']}")
+    print(f"{len(stale)} of {len(plan)} items would be generated")
+
+def export_prompts(generator, args):
+    """Write the rendered prompts of the selected items to --prompts-out, as --dry-run --prompts-out"""
+    started = time.perf_counter()
+    count = generator.export_prompts(
+        args.prompts_out,
+        None if args.all else [args.category],
+        include_examples=not args.no_examples,
+        items=[(args.category, args.item)] if args.item is not None else None
     )
+    print(f"Wrote {count} prompts to {args.prompts_out} in {time.perf_counter() - started:.2f}s")
+
+def create_telemetry(args):
+    """Create the telemetry sinks requested by --metrics-out and --metrics-log, or None"""
+    if not (args.metrics_out or args.metrics_log):
+        return None
+    from .utils.telemetry import Telemetry, JSONLSink, PrometheusTextfileExporter
+    telemetry = Telemetry()
+    if args.metrics_log:
+        telemetry.add_sink(JSONLSink(args.metrics_log))
+    if args.metrics_out:
+        telemetry.add_sink(PrometheusTextfileExporter(args.metrics_out))
+    return telemetry
+
+def print_cache_stats(generator):
+    """Print response cache hit/miss counters, coalesced requests and prompt cache token usage"""
+    stats = generator.cache_stats()
+    if stats:
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+    
+    coalescing = generator.coalescing_stats()
+    if coalescing['coalesced']:
+        print(f"Coalesced requests: {coalescing['coalesced']} served by identical requests already in flight")
     
+    usage = generator.usage
+    if usage:
+        print(
+            f"Prompt cache: {usage.get('cache_read_input_tokens', 0)} tokens read, "
+            f"{usage.get('cache_creation_input_tokens', 0)} tokens written, "
+            f"{usage.get('input_tokens', 0)} uncached input tokens"
+        )
+
+def run_commands(generator, args):
+    """Run the listing, batch or generation command selected by the arguments"""
     # List categories if requested
     if args.list_categories:
         list_categories(generator)
@@ -75,52 +211,204 @@ def main():
         list_items(generator, args.list_items)
         return
     
+    # Convert metadata to JSON Lines if requested
+    if args.export_jsonl:
+        from .extractors.metadata_store import write_jsonl
+        count = write_jsonl(generator.metadata or {}, args.export_jsonl)
+        print(f"Wrote {count} items to {args.export_jsonl}")
+        return
+    
+    # Submit selected items as a message batch, or collect its results
+    if args.batch_submit:
+        if not (args.all or args.category is not None):
+            print("Use --all or --category to select the items to submit.")
+            return
+        batch_id = generator.submit_batch(
+            None if args.all else [args.category],
+            include_examples=not args.no_examples,
+            manifest_path=args.batch_manifest
+        )
+        if batch_id:
+            print("Run with --batch-collect once the batch has ended to save the results.")
+        return
+    if args.batch_collect:
+        results = generator.collect_batch(args.batch_manifest, save=not args.no_save)
+        if results is not None:
+            print_cache_stats(generator)
+        return
+    
+    # List stale outputs without generating anything
+    if args.dry_run:
+        if not (args.all or args.category is not None):
+            print("Use --all or --category (with optional --item) to select the items to check.")
+            return
+        if args.prompts_out:
+            export_prompts(generator, args)
+        else:
+            print_build_plan(generator, args)
+        return
+    
     # Generate content from metadata
     if args.category is not None and args.item is not None:
         print(f"Generating content from metadata for category '{args.category}', item {args.item}...")
+        if args.stream and args.no_save:
+            print("\n=== Generated Content ===\n")
         content = generator.generate_from_metadata(
             args.category,
             args.item,
             include_examples=not args.no_examples,
-            save=not args.no_save
+            save=not args.no_save,
+            stream=args.stream
         )
         if not content:
             print("Failed to generate content.")
             return
         
+        print_content(content, args)
+        
+        print_cache_stats(generator)
+        print("Content generation complete!")
+        return
+    
+    # Continue an interrupted run from the job queue
+    if args.resume:
+        with JobQueue(args.queue_path) as queue:
+            run_id = queue.latest_unfinished_run(include_failed=args.retry_failed)
+            if run_id is None:
+                failed_run = queue.latest_unfinished_run(include_failed=True)
+                if failed_run is not None:
+                    failed = queue.counts(failed_run)['failed']
+                    print(f"Nothing to resume: run {failed_run} finished with {failed} failed items. "
+                          "Use --resume --retry-failed to retry them.")
+                else:
+                    print("Nothing to resume: every queued run is complete.")
+                return
+            if args.retry_failed:
+                print(f"Retrying {queue.retry_failed(run_id)} failed items")
+            generator.run_queue(queue, run_id, max_workers=args.workers)
+        print_cache_stats(generator)
+        return
+    
+    # Saved runs go through the job queue, so they can be resumed if interrupted; an
+    # archive is written in one go, and rerunning an interrupted one reads the response cache
+    if (args.all or args.category is not None) and not args.no_save and not args.archive:
+        with JobQueue(args.queue_path) as queue:
+            run_id = generator.enqueue_batch(
+                queue,
+                None if args.all else [args.category],
+                include_examples=not args.no_examples,
+                stream=args.stream,
+                force=args.force
+            )
+            if run_id is None:
+                print("No content generated.")
+                return
+            generator.run_queue(queue, run_id, max_workers=args.workers)
+        print_cache_stats(generator)
+        print("Content generation complete!")
+        return
+    
+    # Generate a whole category, or the whole metadata file, concurrently
+    if args.all or args.category is not None:
+        categories = None if args.all else [args.category]
+        results = generator.generate_batch(
+            categories,
+            include_examples=not args.no_examples,
+            save=not args.no_save,
+            max_workers=args.workers,
+            stream=args.stream,
+            force=args.force
+        )
+        if not results:
+            print("No content generated.")
+            return
+        
         if args.no_save:
-            print("\n=== Generated Content ===\n")
-            print(content)
+            for result in results:
+                if result['content']:
+                    print(f"\n=== {result['category']}[{result['index']}] {result['name']} ===\n")
+                    print(result['content'])
             print("\n=== End of Generated Content ===\n")
         
+        print_cache_stats(generator)
         print("Content generation complete!")
         return
     
     # Generate content from topic
     if args.topic:
         print(f"Generating {args.type} on '{args.topic}'...")
+        if args.stream and args.no_save:
+            print("\n=== Generated Content ===\n")
         content = generator.generate_from_topic(
             args.topic,
             file_type=args.type,
             learning_objectives=args.objectives,
-            save=not args.no_save
+            save=not args.no_save,
+            stream=args.stream
         )
         
         if not content:
             print("Failed to generate content.")
             return
         
-        if args.no_save:
-            print("\n=== Generated Content ===\n")
-            print(content)
-            print("\n=== End of Generated Content ===\n")
+        print_content(content, args)
         
+        print_cache_stats(generator)
         print("Content generation complete!")
         return
     
     # If no generation options were provided, show help
-    print("No generation options provided. Use --topic or --category and --item to generate content.")
+    print("No generation options provided. Use --topic, --category (with optional --item) or --all to generate content.")
     print("Use --help for more information.")
 
+def main():
+    """Main entry point for the CLI"""
+    args = parse_args()
+    
+    # Exemplar index commands do not need metadata or an API client
+    if args.build_index:
+        build_index(args)
+        return
+    if args.search_exemplars:
+        search_exemplars(args)
+        return
+    
+    # A resumed run uses the metadata and output directory it was started with
+    if args.resume:
+        with JobQueue(args.queue_path) as queue:
+            run_id = queue.latest_unfinished_run(include_failed=args.retry_failed)
+            options = queue.get_run_options(run_id) if run_id is not None else {}
+        args.metadata = options.get('metadata_path') or args.metadata
+        args.output = options.get('output_dir') or args.output
+    
+    # Initialize the generator
+    try:
+        generator = ContentGenerator(
+            metadata_path=args.metadata,
+            output_dir=args.output,
+            max_connections=args.max_connections,
+            cache_path=None if args.no_cache else args.cache_path,
+            refresh_cache=args.refresh,
+            telemetry=create_telemetry(args),
+            retry_policy=RetryPolicy(max_attempts=args.max_attempts, deadline=args.deadline, hedge=args.hedge),
+            sections=args.sections,
+            max_continuations=args.max_continuations,
+            archive_path=args.archive,
+            fsync=args.fsync,
+            reference_images=args.reference_images,
+            exemplars_dir=args.exemplars_dir
+        )
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    
+    # Closing the generator also writes the final metrics
+    with generator:
+        try:
+            run_commands(generator, args)
+        except GenerationError as e:
+            print(f"Failed to generate content: {e}")
+            sys.exit(1)
+
 if __name__ == '__main__':
     main()
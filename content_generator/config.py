@@ -9,15 +9,122 @@ from pathlib import Path
 DEFAULT_METADATA_PATH = 'sample_content/content_metadata'
 DEFAULT_OUTPUT_DIR = 'generated_content'
 
+# Metadata index: byte offset indexes of JSONL metadata files (.jsonl), built on first use
+DEFAULT_METADATA_INDEX_DIR = '.cache/metadata_index'
+
 # Example content paths by file type
 EXAMPLE_PATHS = {
     'lesson': 'sample_content/GA Lesson Examples/ikea-app-and-gcp-deploy-content-main/build-express-app.md',
     'lab': 'sample_content/GA Lab Examples/lifting-state-in-react-lab-main/exercise/README.md'
 }
 
+# Exemplar corpus and full-text index
+DEFAULT_EXEMPLARS_DIR = 'Exemplars'
+DEFAULT_INDEX_PATH = '.cache/exemplar_index.sqlite3'
+INDEX_PASSAGE_LENGTH = 1000
+
+# Retrieve relevant exemplar passages from the index (when it exists) instead
+# of the fixed example. Either kind of example is limited to this many
+# estimated tokens.
+EXAMPLE_RETRIEVAL = True
+EXAMPLE_TOKEN_BUDGET = 500
+
+# Reference images (--reference-images): for the file types below, the exemplar
+# images matching these file name patterns whose folders best match the item
+# (at most MAX_REFERENCE_IMAGES) are attached to the request, each after a caption
+# naming its folder. Images are downscaled to IMAGE_MAX_EDGE pixels on their
+# longer side and re-encoded at IMAGE_JPEG_QUALITY (when Pillow is installed),
+# and the encoded images are cached in DEFAULT_IMAGE_CACHE_DIR.
+REFERENCE_IMAGE_PATTERNS = {
+    'course_landing': ('Landing Page Art*',)
+}
+REFERENCE_IMAGE_CAPTION = "Landing page art of an existing course ({name}), for reference on its tone and subject:"
+MAX_REFERENCE_IMAGES = 2
+IMAGE_MAX_EDGE = 768
+IMAGE_JPEG_QUALITY = 80
+DEFAULT_IMAGE_CACHE_DIR = '.cache/images'
+
 # API settings
 DEFAULT_MODEL = "claude-3-sonnet-20240229"
 DEFAULT_MAX_TOKENS = 4000
 
-# File settings
-TRUNCATE_EXAMPLE_LENGTH = 2000
+# Long items: items with a content_metrics word_count of at least SECTIONED_MIN_WORDS
+# are planned with one outline request (of up to OUTLINE_MAX_TOKENS), then each of
+# their sections (at most MAX_OUTLINE_SECTIONS) is generated by its own request, up
+# to SECTION_WORKERS at a time, and the sections are joined in order
+SECTIONED_MIN_WORDS = 2500
+OUTLINE_MAX_TOKENS = 1024
+MAX_OUTLINE_SECTIONS = 12
+SECTION_WORKERS = 4
+
+# Continuations: a response cut off at max_tokens, or a stream that drops after
+# delivering text, is resumed by sending the partial text back as the start of
+# the reply, at most this many times per request
+MAX_CONTINUATIONS = 3
+
+# Prompt token budget: prompts are trimmed, lowest-priority sections first, to
+# fit MAX_INPUT_TOKENS and what the context window leaves after the response
+MODEL_CONTEXT_TOKENS = 200000
+MAX_INPUT_TOKENS = 8000
+
+# Retries: transient failures (rate limits, overloads, server errors, timeouts) are
+# retried with jittered exponential backoff until the attempts or the deadline
+# (seconds across all attempts of one request) run out
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+DEFAULT_REQUEST_DEADLINE = 600.0
+
+# Hedging (off by default): requests slower than this quantile of recent
+# latencies get a duplicate, once enough latencies have been seen
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+
+# HTTP connection pool settings for the shared API client
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+# Response cache settings
+DEFAULT_CACHE_PATH = '.cache/responses.sqlite3'
+DEFAULT_CACHE_MAX_ENTRIES = 50000
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Batch settings
+DEFAULT_MAX_WORKERS = 4
+
+# Record of the input fingerprint of every generated file, kept in the output directory
+BUILD_MANIFEST_NAME = '.build_manifest.sqlite3'
+
+# Manifest of the last Message Batches API submission, read back when collecting results
+DEFAULT_BATCH_MANIFEST_PATH = '.cache/batch_manifest.json'
+
+# Prompt export (--dry-run --prompts-out): rendered lines are written this many at a time
+PROMPT_EXPORT_CHUNK_LINES = 256
+
+# Output writer: saved files are queued (at most OUTPUT_QUEUE_SIZE at a time) for a
+# background thread that writes them through a temporary file and a rename, and
+# flushes them to disk as OUTPUT_FSYNC says ('never', 'file' or 'always', which
+# also syncs the directory). Saved files are reported at most once per
+# OUTPUT_LOG_INTERVAL seconds.
+OUTPUT_QUEUE_SIZE = 64
+OUTPUT_FSYNC = 'never'
+OUTPUT_LOG_INTERVAL = 2.0
+
+# Per-request telemetry: the Prometheus text file is rewritten at most this often while generating
+METRICS_FLUSH_INTERVAL = 15.0
+
+# Generation server (python -m content_generator.serve): local interface and port,
+# jobs run at once, and finished jobs kept for status queries
+DEFAULT_SERVE_HOST = '127.0.0.1'
+DEFAULT_SERVE_PORT = 8765
+DEFAULT_SERVE_MAX_JOBS = 4
+DEFAULT_SERVE_JOBS_KEPT = 1000
+
+# Durable job queue for batch runs: a claimed item is reserved for JOB_LEASE_SECONDS
+# without a renewal (longer than a request's deadline), and given up on after its
+# worker has been lost JOB_MAX_ATTEMPTS times
+DEFAULT_JOB_QUEUE_PATH = '.cache/job_queue.sqlite3'
+JOB_LEASE_SECONDS = 900.0
+JOB_MAX_ATTEMPTS = 3
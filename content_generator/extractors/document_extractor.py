@@ -0,0 +1,218 @@
+"""
+Functions for extracting plain text from exemplar documents.
+
+Office Open XML files (docx, pptx, xlsx) are zip archives of XML parts and are
+parsed with the standard library. PDF text extraction uses pypdf when it is
+installed and is skipped otherwise.
+"""
+
+import csv
+import io
+import os
+import re
+import zipfile
+from itertools import islice
+from xml.etree.ElementTree import iterparse
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+# XML namespaces used by Office Open XML parts
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DRAWING_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+# Rows of a CSV file, and of each worksheet, to extract; large data tables
+# are reference material rather than prose and would swamp the index
+CSV_MAX_ROWS = 50
+SHEET_MAX_ROWS = 1000
+
+def extract_docx(source):
+    """
+    Extract text from a Word document, one line per paragraph
+
+    Args:
+        source: Path or binary file object
+
+    Returns:
+        str: Document text
+    """
+    with zipfile.ZipFile(source) as archive:
+        with archive.open('word/document.xml') as part:
+            return '\n'.join(_iter_paragraphs(part, f'{WORD_NS}p', f'{WORD_NS}t'))
+
+def extract_pptx(source):
+    """
+    Extract text from a PowerPoint deck, slide by slide
+
+    Args:
+        source: Path or binary file object
+
+    Returns:
+        str: Deck text with a heading per slide
+    """
+    with zipfile.ZipFile(source) as archive:
+        slides = [
+            name for name in archive.namelist()
+            if re.fullmatch(r'ppt/slides/slide\d+\.xml', name)
+        ]
+        slides.sort(key=lambda name: int(re.search(r'(\d+)\.xml$', name).group(1)))
+
+        sections = []
+        for number, name in enumerate(slides, start=1):
+            with archive.open(name) as part:
+                lines = list(_iter_paragraphs(part, f'{DRAWING_NS}p', f'{DRAWING_NS}t'))
+            if lines:
+                sections.append(f"Slide {number}:\n" + '\n'.join(lines))
+        return '\n\n'.join(sections)
+
+def extract_xlsx(source):
+    """
+    Extract text from an Excel workbook, one tab-separated line per row
+
+    Parts are parsed incrementally so memory stays flat for large sheets.
+
+    Args:
+        source: Path or binary file object
+
+    Returns:
+        str: Workbook text with a heading per sheet
+    """
+    with zipfile.ZipFile(source) as archive:
+        names = archive.namelist()
+
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in names:
+            with archive.open('xl/sharedStrings.xml') as part:
+                shared_strings = list(_iter_paragraphs(part, f'{SHEET_NS}si', f'{SHEET_NS}t', keep_empty=True))
+
+        sheets = [name for name in names if re.fullmatch(r'xl/worksheets/sheet\d+\.xml', name)]
+        sheets.sort(key=lambda name: int(re.search(r'(\d+)\.xml$', name).group(1)))
+
+        sections = []
+        for number, name in enumerate(sheets, start=1):
+            with archive.open(name) as part:
+                rows = list(islice(_iter_sheet_rows(part, shared_strings), SHEET_MAX_ROWS))
+            if rows:
+                sections.append(f"Sheet {number}:\n" + '\n'.join(rows))
+        return '\n\n'.join(sections)
+
+def extract_pdf(source):
+    """
+    Extract text from a PDF, page by page
+
+    Args:
+        source: Path or binary file object
+
+    Returns:
+        str: Document text, or None if pypdf is not installed
+    """
+    if PdfReader is None:
+        return None
+    reader = PdfReader(source)
+    return '\n\n'.join(page.extract_text() or '' for page in reader.pages).strip()
+
+def extract_csv(source):
+    """
+    Extract the header and first rows of a CSV file
+
+    Args:
+        source: Path or binary file object
+
+    Returns:
+        str: Tab-separated rows
+    """
+    with _open_text(source) as file:
+        rows = []
+        for number, row in enumerate(csv.reader(file)):
+            if number >= CSV_MAX_ROWS:
+                break
+            rows.append('\t'.join(row))
+        return '\n'.join(rows)
+
+def extract_plain_text(source):
+    """
+    Read a plain text file
+
+    Args:
+        source: Path or binary file object
+
+    Returns:
+        str: File text
+    """
+    with _open_text(source) as file:
+        return file.read()
+
+# Text extractors by lower-case file extension
+EXTRACTORS = {
+    '.docx': extract_docx,
+    '.pptx': extract_pptx,
+    '.xlsx': extract_xlsx,
+    '.pdf': extract_pdf,
+    '.csv': extract_csv,
+    '.txt': extract_plain_text,
+    '.md': extract_plain_text
+}
+
+def is_supported(path):
+    """Check whether text can be extracted from a file based on its extension"""
+    return os.path.splitext(path)[1].lower() in EXTRACTORS
+
+def extract_text(path, source=None):
+    """
+    Extract plain text from a document
+
+    Args:
+        path (str): Path (or name) of the document, used to pick the extractor
+        source (optional): Binary file object to read instead of opening ``path``
+
+    Returns:
+        str: Extracted text, or None if the format is unsupported or unavailable
+    """
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    if extractor is None:
+        return None
+    return extractor(source if source is not None else path)
+
+def _open_text(source):
+    """Open a path or binary file object as UTF-8 text, tolerating bad bytes"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'r', encoding='utf-8', errors='replace', newline='')
+    return io.TextIOWrapper(source, encoding='utf-8', errors='replace', newline='')
+
+def _iter_paragraphs(part, paragraph_tag, text_tag, keep_empty=False):
+    """Yield the text of each paragraph element in an XML part, parsing incrementally"""
+    pieces = []
+    for event, element in iterparse(part, events=('end',)):
+        if element.tag == text_tag:
+            pieces.append(element.text or '')
+        elif element.tag == paragraph_tag:
+            text = ''.join(pieces).strip()
+            if text or keep_empty:
+                yield text
+            pieces = []
+            element.clear()
+
+def _iter_sheet_rows(part, shared_strings):
+    """Yield each non-empty row of a worksheet part as tab-separated text"""
+    cells = []
+    value = None
+    for event, element in iterparse(part, events=('end',)):
+        tag = element.tag
+        if tag == f'{SHEET_NS}v' or tag == f'{SHEET_NS}t':
+            value = element.text
+        elif tag == f'{SHEET_NS}c':
+            if value is not None and element.get('t') == 's':
+                index = int(value)
+                value = shared_strings[index] if index < len(shared_strings) else None
+            if value:
+                cells.append(value.strip())
+            value = None
+            element.clear()
+        elif tag == f'{SHEET_NS}row':
+            if any(cells):
+                yield '\t'.join(cells)
+            cells = []
+            element.clear()
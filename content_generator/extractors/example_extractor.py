@@ -2,8 +2,14 @@
 Functions for extracting example content from files.
 """
 
-from ..config import EXAMPLE_PATHS, TRUNCATE_EXAMPLE_LENGTH
-from ..utils.file_utils import read_file
+import os
+import threading
+from ..config import EXAMPLE_PATHS, EXAMPLE_TOKEN_BUDGET, DEFAULT_INDEX_PATH
+from ..utils.file_utils import read_example_content
+
+# Extracted example content by path, validated against the file's (mtime, size)
+_example_cache = {}
+_example_cache_lock = threading.Lock()
 
 def get_example_path(file_type):
     """Get the path to an example file based on file type"""
@@ -19,20 +25,69 @@ def extract_example_content(file_type=None, file_path=None):
         file_path (str, optional): Direct path to example file, overrides file_type
         
     Returns:
-        str: The example content, truncated if necessary
+        str: The example content, truncated to EXAMPLE_TOKEN_BUDGET estimated tokens if necessary
+    
+    The result is cached in memory per path and reused until the file's
+    modification time or size changes.
     """
     # Determine the file path
     path = file_path if file_path else get_example_path(file_type)
     
-    try:
-        # Read the file content
-        content = read_file(path)
-        
-        # Truncate if necessary
-        if content and len(content) > TRUNCATE_EXAMPLE_LENGTH:
-            content = content[:TRUNCATE_EXAMPLE_LENGTH] + "\n...\n[Example truncated for brevity]"
+    # Reuse the cached extraction while the file is unchanged
+    stamp = get_example_stamp(path)
+    cached = _example_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    
+    content = _read_example_content(path)
+    with _example_cache_lock:
+        _example_cache[path] = (stamp, content)
+    return content
+
+def get_example_stamp(path):
+    """
+    Get the (mtime, size) of an example file, used to detect changes
+    
+    Args:
+        path (str): Path to the example file
         
-        return content or "Example content not available."
+    Returns:
+        tuple: (mtime_ns, size), or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def clear_example_cache():
+    """Forget every cached example"""
+    with _example_cache_lock:
+        _example_cache.clear()
+
+def _read_example_content(path):
+    """Read and truncate an example file"""
+    try:
+        return read_example_content(path, EXAMPLE_TOKEN_BUDGET) or "Example content not available."
     except Exception as e:
         print(f"Error extracting example content from {path}: {e}")
         return "Example content not available."
+
+def search_exemplar_passages(query, limit=5, index_path=DEFAULT_INDEX_PATH):
+    """
+    Search the exemplar index for passages relevant to a query
+    
+    Args:
+        query (str): Free text such as a topic or learning objectives
+        limit (int, optional): Maximum number of passages to return
+        index_path (str, optional): Path to the exemplar index
+        
+    Returns:
+        list: Passage dicts with 'path', 'passage', 'text' and 'score' keys, empty if there is no index
+    """
+    if not os.path.exists(index_path):
+        return []
+    
+    from .exemplar_index import ExemplarIndex
+    with ExemplarIndex(index_path) as index:
+        return index.search(query, limit)
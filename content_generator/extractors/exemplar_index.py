@@ -0,0 +1,276 @@
+"""
+Persistent full-text index over the exemplar corpus.
+
+Text is extracted from each supported document once and stored, split into
+passages, in a SQLite FTS5 table. Rebuilding the index only re-extracts files
+whose size, modification time and content hash show that they changed.
+Documents inside ``.zip`` bundles are indexed as ``archive.zip!member``.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from ..config import DEFAULT_EXEMPLARS_DIR, DEFAULT_INDEX_PATH, INDEX_PASSAGE_LENGTH
+from .document_extractor import is_supported
+from .extraction_pipeline import make_tasks, run_pipeline
+
+# Bump when the table layout changes; older indexes are rebuilt from scratch
+SCHEMA_VERSION = 2
+
+def hash_file(path):
+    """Get the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def split_passages(text, max_length=INDEX_PASSAGE_LENGTH):
+    """
+    Split text into passages of roughly ``max_length`` characters on line boundaries
+
+    Args:
+        text (str): Text to split
+        max_length (int, optional): Target maximum passage length in characters
+
+    Returns:
+        list: Passage strings
+    """
+    passages = []
+    current = []
+    size = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        # Hard-wrap single lines that are longer than a whole passage
+        while len(line) > max_length:
+            passages.append(line[:max_length])
+            line = line[max_length:]
+
+        if size + len(line) > max_length and current:
+            passages.append('\n'.join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line) + 1
+
+    if current:
+        passages.append('\n'.join(current))
+    return passages
+
+def make_match_query(query):
+    """
+    Turn free text into an FTS5 query that matches any of its words
+
+    Args:
+        query (str): Free text such as a topic or learning objectives
+
+    Returns:
+        str: FTS5 MATCH expression, or an empty string if there are no words
+    """
+    terms = dict.fromkeys(word.lower() for word in re.findall(r'\w+', query))
+    return ' OR '.join(f'"{term}"' for term in terms)
+
+class ExemplarIndex:
+    """
+    SQLite FTS5 index of exemplar passages
+
+    Files are identified by their path relative to the indexed root.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        """
+        Open (or create) the index
+
+        Args:
+            path (str, optional): Path to the SQLite database file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.executescript("""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS passages;
+            """)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                indexed_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+                file UNINDEXED,
+                path UNINDEXED,
+                passage UNINDEXED,
+                text,
+                tokenize = 'porter unicode61'
+            );
+        """)
+        self._conn.commit()
+
+    def build(self, root=DEFAULT_EXEMPLARS_DIR, max_workers=None):
+        """
+        Bring the index up to date with the files under ``root``
+
+        Unchanged files are skipped without being read. Files whose size or
+        modification time changed are hashed, and only re-extracted if their
+        content actually changed. Files that no longer exist are removed.
+        Extraction runs on a process pool via the extraction pipeline.
+
+        Args:
+            root (str, optional): Directory containing the exemplars
+            max_workers (int, optional): Extraction worker processes, defaults to one per core
+
+        Returns:
+            dict: Counts of 'added', 'updated', 'unchanged', 'removed' and 'skipped' files,
+                plus the per-document extraction results under 'results'
+        """
+        stats = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'skipped': 0, 'results': []}
+        known = {
+            row[0]: row[1:]
+            for row in self._conn.execute("SELECT path, size, mtime_ns, sha256 FROM files")
+        }
+        seen = set()
+
+        # Work out which files changed before extracting anything
+        changed = {}
+        tasks = []
+        file_of = {}
+        for full_path, rel_path in self._iter_files(root):
+            seen.add(rel_path)
+            stat = os.stat(full_path)
+            previous = known.get(rel_path)
+            if previous and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                stats['unchanged'] += 1
+                continue
+
+            sha256 = None
+            if previous:
+                sha256 = hash_file(full_path)
+                if previous[2] == sha256:
+                    # Touched but not modified; just record the new stamp
+                    self._conn.execute(
+                        "UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                        (stat.st_size, stat.st_mtime_ns, rel_path)
+                    )
+                    stats['unchanged'] += 1
+                    continue
+
+            try:
+                file_tasks = make_tasks(full_path, rel_path)
+            except Exception as e:
+                print(f"Error reading {rel_path}: {e}")
+                file_tasks = []
+            if not file_tasks:
+                stats['skipped'] += 1
+                continue
+            changed[rel_path] = {
+                'full_path': full_path, 'stat': stat, 'sha256': sha256, 'previous': previous, 'documents': []
+            }
+            for task in file_tasks:
+                file_of[task[0]] = rel_path
+            tasks.extend(file_tasks)
+
+        for result in run_pipeline(tasks, max_workers):
+            stats['results'].append(result)
+            if result['error']:
+                print(f"Error extracting text from {result['name']}: {result['error']}")
+            elif result['text'] is not None:
+                changed[file_of[result['name']]]['documents'].append(result)
+
+        for rel_path, entry in changed.items():
+            if not entry['documents']:
+                # Not recorded, so it is retried once it can be extracted
+                stats['skipped'] += 1
+                continue
+            sha256 = entry['sha256'] or hash_file(entry['full_path'])
+            self._store(rel_path, entry['stat'], sha256, entry['documents'])
+            stats['updated' if entry['previous'] else 'added'] += 1
+
+        for rel_path in known.keys() - seen:
+            self._remove(rel_path)
+            stats['removed'] += 1
+
+        self._conn.commit()
+        return stats
+
+    def search(self, query, limit=10):
+        """
+        Find the passages that best match free text
+
+        Args:
+            query (str): Free text such as a topic or learning objectives
+            limit (int, optional): Maximum number of passages to return
+
+        Returns:
+            list: Dicts with 'path', 'passage', 'text' and 'score' keys, best match first
+        """
+        match = make_match_query(query)
+        if not match:
+            return []
+        rows = self._conn.execute(
+            "SELECT path, passage, text, bm25(passages) AS score FROM passages "
+            "WHERE passages MATCH ? ORDER BY score LIMIT ?",
+            (match, limit)
+        ).fetchall()
+        return [
+            {'path': path, 'passage': passage, 'text': text, 'score': -score}
+            for path, passage, text, score in rows
+        ]
+
+    def files(self):
+        """
+        List the indexed files
+
+        Returns:
+            list: Relative paths of indexed files
+        """
+        return [row[0] for row in self._conn.execute("SELECT path FROM files ORDER BY path")]
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _iter_files(self, root):
+        """Yield (full path, relative path) for every supported document or zip bundle under root"""
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                full_path = os.path.join(directory, filename)
+                if is_supported(filename) or filename.lower().endswith('.zip'):
+                    yield full_path, os.path.relpath(full_path, root)
+
+    def _store(self, rel_path, stat, sha256, documents):
+        """Replace the passages and file record for one file of the corpus"""
+        self._conn.execute("DELETE FROM passages WHERE file = ?", (rel_path,))
+        for document in documents:
+            self._conn.executemany(
+                "INSERT INTO passages (file, path, passage, text) VALUES (?, ?, ?, ?)",
+                [
+                    (rel_path, document['name'], number, passage)
+                    for number, passage in enumerate(split_passages(document['text']))
+                ]
+            )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, indexed_at) VALUES (?, ?, ?, ?, ?)",
+            (rel_path, stat.st_size, stat.st_mtime_ns, sha256, time.time())
+        )
+
+    def _remove(self, rel_path):
+        """Remove a file of the corpus from the index"""
+        self._conn.execute("DELETE FROM passages WHERE file = ?", (rel_path,))
+        self._conn.execute("DELETE FROM files WHERE path = ?", (rel_path,))
@@ -0,0 +1,174 @@
+"""
+Relevance-ranked retrieval of exemplar passages.
+
+Passages from the exemplar index are scored against an item's topic,
+objectives and description with BM25. Term weights are precomputed into a
+sparse term-by-passage matrix when the retriever is built, so answering a
+query is a sum over the postings of its terms.
+"""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from ..config import DEFAULT_INDEX_PATH, EXAMPLE_TOKEN_BUDGET
+from ..utils.token_utils import estimate_tokens
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Common words that carry no topical signal
+STOPWORDS = frozenset("""
+a an and are as at be by can for from how in into is it its of on or that the their them
+these this those to use using what when which will with you your students student learn
+learning understand able
+""".split())
+
+# Retrievers by index path, with the (mtime, size) of the index they were built from
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+def tokenize(text):
+    """Split text into lower-case terms, dropping stopwords and numbers"""
+    return [
+        term for term in re.findall(r'[a-z][a-z0-9]+', text.lower())
+        if term not in STOPWORDS
+    ]
+
+class ExemplarRetriever:
+    """
+    BM25 retriever over exemplar passages with a precomputed term matrix
+    """
+
+    def __init__(self, passages):
+        """
+        Build the term matrix
+
+        Args:
+            passages (list): Dicts with at least 'path' and 'text' keys
+        """
+        # The corpus holds several copies of the same documents; keep one of each passage
+        unique = {}
+        for passage in passages:
+            key = hashlib.sha1(passage['text'].encode('utf-8')).digest()
+            unique.setdefault(key, passage)
+        self.passages = list(unique.values())
+        self.token_counts = [estimate_tokens(passage['text']) for passage in self.passages]
+
+        term_counts = [Counter(tokenize(passage['text'])) for passage in self.passages]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = (sum(lengths) / len(lengths)) if lengths else 0
+
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+
+        # postings[term] = [(passage id, BM25 weight), ...]
+        total = len(self.passages)
+        self.postings = defaultdict(list)
+        for passage_id, (counts, length) in enumerate(zip(term_counts, lengths)):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) if average_length else BM25_K1
+            for term, tf in counts.items():
+                df = document_frequency[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                self.postings[term].append((passage_id, idf * tf * (BM25_K1 + 1) / (tf + norm)))
+        self.postings = dict(self.postings)
+
+    @classmethod
+    def from_index(cls, index_path=DEFAULT_INDEX_PATH):
+        """
+        Build a retriever from every passage in the exemplar index
+
+        Args:
+            index_path (str, optional): Path to the exemplar index
+
+        Returns:
+            ExemplarRetriever: The retriever
+        """
+        conn = sqlite3.connect(index_path)
+        try:
+            rows = conn.execute("SELECT path, passage, text FROM passages ORDER BY path, passage").fetchall()
+        finally:
+            conn.close()
+        return cls([{'path': path, 'passage': passage, 'text': text} for path, passage, text in rows])
+
+    def score(self, query):
+        """
+        Score every passage that shares a term with the query
+
+        Args:
+            query (str): Free text
+
+        Returns:
+            dict: BM25 score by passage id
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for passage_id, weight in self.postings.get(term, ()):
+                scores[passage_id] += weight
+        return scores
+
+    def retrieve(self, query, token_budget=EXAMPLE_TOKEN_BUDGET):
+        """
+        Get the highest-scoring passages that fit in a token budget
+
+        Passages are taken best first; any that would overflow the budget are
+        skipped in favour of smaller ones further down the ranking.
+
+        Args:
+            query (str): Free text
+            token_budget (int, optional): Maximum estimated tokens of passage text
+
+        Returns:
+            list: Passage dicts with an added 'score' key, best match first
+        """
+        scores = self.score(query)
+        selected = []
+        remaining = token_budget
+        for passage_id in sorted(scores, key=scores.get, reverse=True):
+            tokens = self.token_counts[passage_id]
+            if tokens > remaining:
+                continue
+            selected.append(dict(self.passages[passage_id], score=scores[passage_id]))
+            remaining -= tokens
+            if remaining <= 0:
+                break
+        return selected
+
+def get_retriever(index_path=DEFAULT_INDEX_PATH):
+    """
+    Get a retriever for an exemplar index, building it once per process
+
+    The retriever is rebuilt when the index file changes.
+
+    Args:
+        index_path (str, optional): Path to the exemplar index
+
+    Returns:
+        ExemplarRetriever: The retriever, or None if there is no index
+    """
+    try:
+        stat = os.stat(index_path)
+    except OSError:
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _retrievers.get(index_path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    with _retrievers_lock:
+        cached = _retrievers.get(index_path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        try:
+            retriever = ExemplarRetriever.from_index(index_path)
+        except sqlite3.Error as e:
+            print(f"Error loading exemplar index {index_path}: {e}")
+            retriever = None
+        _retrievers[index_path] = (stamp, retriever)
+        return retriever
@@ -0,0 +1,164 @@
+"""
+Parallel text extraction pipeline for the exemplar corpus.
+
+Documents are extracted on a process pool, one worker per core by default,
+since parsing Office XML and PDFs is CPU-bound. Supported documents inside
+``.zip`` bundles are read straight out of the archive without unpacking
+them to disk.
+"""
+
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .document_extractor import extract_text, is_supported
+
+# Separates an archive path from the member path in document names
+ARCHIVE_SEPARATOR = '!'
+
+# Formats that are themselves zip archives and need a seekable stream
+ZIP_BASED_EXTENSIONS = ('.docx', '.pptx', '.xlsx')
+
+def member_name(info):
+    """
+    Get the real name of a zip member
+
+    Archives written without the UTF-8 flag store names in the legacy code
+    page, which mangles emoji and accented names unless they were UTF-8 all along.
+
+    Args:
+        info (zipfile.ZipInfo): Archive member
+
+    Returns:
+        str: Member name
+    """
+    name = info.filename
+    if not info.flag_bits & 0x800:
+        try:
+            name = name.encode('cp437').decode('utf-8')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return name
+
+def list_archive_documents(archive_path):
+    """
+    List the supported documents inside a zip archive
+
+    Args:
+        archive_path (str): Path to the archive
+
+    Returns:
+        list: (member filename in the archive, decoded member name) tuples
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members = []
+        for info in archive.infolist():
+            name = member_name(info)
+            # Skip directories and macOS resource forks
+            if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('._'):
+                continue
+            if is_supported(name):
+                members.append((info.filename, name))
+        return members
+
+def make_tasks(full_path, rel_path):
+    """
+    Build the extraction tasks for one file of the corpus
+
+    Args:
+        full_path (str): Path to the file on disk
+        rel_path (str): Path of the file relative to the corpus root
+
+    Returns:
+        list: (document name, file path, archive member or None) tuples
+    """
+    if full_path.lower().endswith('.zip'):
+        return [
+            (f"{rel_path}{ARCHIVE_SEPARATOR}{name}", full_path, member)
+            for member, name in list_archive_documents(full_path)
+        ]
+    return [(rel_path, full_path, None)]
+
+def extract_task(task):
+    """
+    Extract the text of one document; runs in a worker process
+
+    Args:
+        task (tuple): (document name, file path, archive member or None)
+
+    Returns:
+        dict: 'name', 'path', 'text', 'seconds' and 'error' for the document
+    """
+    name, path, member = task
+    start = time.perf_counter()
+    text = None
+    error = None
+    try:
+        if member is None:
+            text = extract_text(path)
+        else:
+            with zipfile.ZipFile(path) as archive, archive.open(member) as stream:
+                if name.lower().endswith(ZIP_BASED_EXTENSIONS):
+                    # Nested zips need random access; decompress into memory, not to disk
+                    text = extract_text(name, io.BytesIO(stream.read()))
+                else:
+                    text = extract_text(name, stream)
+    except Exception as e:
+        error = str(e)
+
+    return {
+        'name': name,
+        'path': path,
+        'text': text,
+        'seconds': time.perf_counter() - start,
+        'error': error
+    }
+
+def run_pipeline(tasks, max_workers=None):
+    """
+    Extract documents in parallel, yielding results as they complete
+
+    Args:
+        tasks (list): Tasks from make_tasks
+        max_workers (int, optional): Worker processes, defaults to one per core
+
+    Yields:
+        dict: Result of extract_task for each document
+    """
+    tasks = list(tasks)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    # A pool costs more than it saves for a single worker or document
+    if max_workers == 1 or len(tasks) < 2:
+        for task in tasks:
+            yield extract_task(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(extract_task, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+def format_timings(results, limit=None):
+    """
+    Format per-document extraction timings, slowest first
+
+    Args:
+        results (list): Results from run_pipeline
+        limit (int, optional): Maximum number of documents to include
+
+    Returns:
+        str: One line per document
+    """
+    ordered = sorted(results, key=lambda result: result['seconds'], reverse=True)[:limit]
+    lines = []
+    for result in ordered:
+        if result['error']:
+            status = f"error: {result['error']}"
+        elif result['text'] is None:
+            status = "skipped"
+        else:
+            status = f"{len(result['text'])} chars"
+        lines.append(f"{result['seconds'] * 1000:9.1f} ms  {result['name']} ({status})")
+    return '\n'.join(lines)
@@ -0,0 +1,348 @@
+"""
+Functions for loading exemplar images as reference inputs for multimodal prompts.
+
+Exemplar folders hold the art of existing courses, e.g. the landing page art
+of each bootcamp. For the file types in REFERENCE_IMAGE_PATTERNS, the images
+whose folder best matches an item are attached to its request as style
+references.
+
+Each image is downscaled to at most IMAGE_MAX_EDGE pixels on its longer side
+and re-encoded as JPEG when Pillow is installed; without it, images are sent
+as they are if the API accepts their size. The base64 payload is cached on
+disk under a hash of the source file's content, and in memory by path, size
+and modification time, so an image is decoded and encoded once however many
+requests and runs use it.
+"""
+
+import base64
+import fnmatch
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import threading
+from ..config import (
+    DEFAULT_EXEMPLARS_DIR, DEFAULT_IMAGE_CACHE_DIR, IMAGE_MAX_EDGE, IMAGE_JPEG_QUALITY,
+    MAX_REFERENCE_IMAGES, REFERENCE_IMAGE_PATTERNS, REFERENCE_IMAGE_CAPTION
+)
+from ..utils.file_utils import write_file_atomic
+from .metadata_extractor import get_file_type, get_item_search_text
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Limits of the Messages API: larger images are rejected, and images beyond
+# the edge or pixel limits are downscaled by the API before they are read,
+# so sending them larger only adds upload time
+API_MAX_IMAGE_BYTES = 5 * 1024 * 1024
+API_MAX_IMAGE_EDGE = 1568
+API_MAX_IMAGE_PIXELS = 1150000
+
+# Pixels per input token of an image, as documented for the Messages API
+PIXELS_PER_TOKEN = 750
+
+# Image files looked for in the exemplars directory, by extension
+IMAGE_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+# JPEG start-of-frame markers, which hold the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Loaded images by (path, max_edge, quality), with the (size, mtime) they were loaded at
+_loaded_images = {}
+# Candidate image paths by (exemplars_dir, file_type)
+_candidate_images = {}
+_lock = threading.Lock()
+_warned_no_pillow = False
+
+def get_image_media_type(data):
+    """
+    Get the media type of image data from its signature
+
+    Returns:
+        str: 'image/jpeg', 'image/png', 'image/gif' or 'image/webp', or None if unrecognized
+    """
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def get_image_size(data):
+    """
+    Read the dimensions of a JPEG, PNG or GIF image from its header, without decoding it
+
+    Returns:
+        tuple: (width, height), or None if the format is not recognized or the header is damaged
+    """
+    media_type = get_image_media_type(data)
+    if media_type == 'image/png' and len(data) >= 24:
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if media_type == 'image/gif' and len(data) >= 10:
+        return int.from_bytes(data[6:8], 'little'), int.from_bytes(data[8:10], 'little')
+    if media_type != 'image/jpeg':
+        return None
+
+    # Walk the JPEG segments up to the first start-of-frame
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        length = int.from_bytes(data[offset + 2:offset + 4], 'big')
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[offset + 5:offset + 7], 'big')
+            width = int.from_bytes(data[offset + 7:offset + 9], 'big')
+            return width, height
+        offset += 2 + length
+    return None
+
+def estimate_image_tokens(width, height):
+    """
+    Estimate the input tokens an image costs
+
+    Images beyond the API's edge or pixel limits are counted at the size the
+    API scales them down to.
+
+    Args:
+        width (int): Width in pixels
+        height (int): Height in pixels
+
+    Returns:
+        int: Estimated tokens
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, API_MAX_IMAGE_EDGE / max(width, height), math.sqrt(API_MAX_IMAGE_PIXELS / (width * height)))
+    return math.ceil(round(width * scale) * round(height * scale) / PIXELS_PER_TOKEN)
+
+def encode_image(data, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY):
+    """
+    Downscale and re-encode an image for sending to the API
+
+    An image that already fits within ``max_edge`` is kept as it is when the
+    API accepts its format and size. Without Pillow, nothing is resized.
+
+    Args:
+        data (bytes): Image file content
+        max_edge (int, optional): Maximum width and height in pixels
+        quality (int, optional): JPEG quality of re-encoded images
+
+    Returns:
+        tuple: (payload bytes, media type, width, height), or None if the image cannot be sent
+    """
+    media_type = get_image_media_type(data)
+    size = get_image_size(data)
+    fits = size is not None and max(size) <= max_edge and len(data) <= API_MAX_IMAGE_BYTES
+    if media_type and fits:
+        return data, media_type, size[0], size[1]
+
+    if Image is None:
+        global _warned_no_pillow
+        if not _warned_no_pillow:
+            _warned_no_pillow = True
+            print("Pillow is not installed; reference images are sent at their original size")
+        if media_type and size and len(data) <= API_MAX_IMAGE_BYTES:
+            return data, media_type, size[0], size[1]
+        return None
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEGs are decoded straight at a reduced scale, which is much faster than a full decode
+            image.draft('RGB', (max_edge, max_edge))
+            image = image.convert('RGB')
+            image.thumbnail((max_edge, max_edge))
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=quality, optimize=True)
+    except (OSError, ValueError) as e:
+        print(f"Could not decode image: {e}")
+        return None
+    return output.getvalue(), 'image/jpeg', image.width, image.height
+
+def load_image(path, max_edge=IMAGE_MAX_EDGE, cache_dir=DEFAULT_IMAGE_CACHE_DIR, quality=IMAGE_JPEG_QUALITY):
+    """
+    Load an image as an API input, from the image caches when it has been loaded before
+
+    Args:
+        path (str): Image file
+        max_edge (int, optional): Maximum width and height in pixels
+        cache_dir (str, optional): Directory of encoded images, None to keep them in memory only
+        quality (int, optional): JPEG quality of re-encoded images
+
+    Returns:
+        dict: 'path', 'media_type', 'data' (base64), 'sha256' (of the payload), 'width',
+            'height', 'bytes' (payload size as sent) and 'tokens' (estimated), or None if
+            the file cannot be read or sent
+    """
+    key = (os.path.abspath(path), max_edge, quality)
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        print(f"Error reading image {path}: {e}")
+        return None
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        loaded = _loaded_images.get(key)
+    if loaded is not None and loaded[0] == stamp:
+        return loaded[1]
+
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError as e:
+        print(f"Error reading image {path}: {e}")
+        return None
+
+    # Encoded images are keyed by the source content and every setting that changes the payload
+    encoding = f"jpeg{quality}" if Image is not None else "original"
+    cache_name = f"{hashlib.sha256(data).hexdigest()}-{max_edge}-{encoding}.json"
+    cache_file = os.path.join(cache_dir, cache_name) if cache_dir else None
+    image = _read_cached_image(cache_file)
+
+    if image is None:
+        encoded = encode_image(data, max_edge, quality)
+        if encoded is None:
+            print(f"Skipping image {path}: unsupported format or too large to send")
+            return None
+        payload, media_type, width, height = encoded
+        image = {
+            'media_type': media_type,
+            'data': base64.b64encode(payload).decode('ascii'),
+            'sha256': hashlib.sha256(payload).hexdigest(),
+            'width': width,
+            'height': height,
+            'tokens': estimate_image_tokens(width, height)
+        }
+        image['bytes'] = len(image['data'])
+        if cache_file:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                write_file_atomic(json.dumps(image), cache_file)
+            except OSError as e:
+                print(f"Error caching image {path}: {e}")
+
+    image = dict(image, path=path)
+    with _lock:
+        _loaded_images[key] = (stamp, image)
+    return image
+
+def _read_cached_image(cache_file):
+    """Read an encoded image from the disk cache, or None if it is missing or damaged"""
+    if not cache_file:
+        return None
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            image = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(image, dict) or not image.get('data') or not image.get('media_type'):
+        return None
+    return image
+
+def find_reference_images(file_type, exemplars_dir=DEFAULT_EXEMPLARS_DIR):
+    """
+    Find the exemplar images used as references for a file type
+
+    The exemplars directory is scanned once per process and file type.
+
+    Args:
+        file_type (str): Item file type
+        exemplars_dir (str, optional): Directory of exemplar folders
+
+    Returns:
+        list: Image paths matching the file type's REFERENCE_IMAGE_PATTERNS, sorted
+    """
+    patterns = REFERENCE_IMAGE_PATTERNS.get(file_type)
+    if not patterns or not exemplars_dir:
+        return []
+    key = (os.path.abspath(exemplars_dir), file_type)
+    with _lock:
+        paths = _candidate_images.get(key)
+    if paths is not None:
+        return paths
+
+    paths = []
+    for root, dirs, files in os.walk(exemplars_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in IMAGE_MEDIA_TYPES:
+                continue
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                paths.append(os.path.join(root, name))
+    with _lock:
+        _candidate_images[key] = paths
+    return paths
+
+def select_reference_images(item, exemplars_dir=DEFAULT_EXEMPLARS_DIR, limit=MAX_REFERENCE_IMAGES):
+    """
+    Choose the reference images for an item
+
+    Images are ranked by how many words of the item's name and description
+    appear in their path (the exemplar folder names the course), then by path.
+
+    Args:
+        item (dict): Metadata item
+        exemplars_dir (str, optional): Directory of exemplar folders
+        limit (int, optional): Maximum number of images
+
+    Returns:
+        list: Image paths, best match first
+    """
+    paths = find_reference_images(get_file_type(item), exemplars_dir)
+    if not paths or limit <= 0:
+        return []
+    words = set(_WORD_RE.findall(get_item_search_text(item).lower()))
+
+    def score(path):
+        relative = os.path.relpath(path, exemplars_dir).lower()
+        return -len(words.intersection(_WORD_RE.findall(relative))), path
+
+    return sorted(paths, key=score)[:limit]
+
+def get_reference_images(item, exemplars_dir=DEFAULT_EXEMPLARS_DIR, limit=MAX_REFERENCE_IMAGES,
+                         max_edge=IMAGE_MAX_EDGE, cache_dir=DEFAULT_IMAGE_CACHE_DIR):
+    """
+    Load the reference images for an item
+
+    Args:
+        item (dict): Metadata item
+        exemplars_dir (str, optional): Directory of exemplar folders
+        limit (int, optional): Maximum number of images
+        max_edge (int, optional): Maximum width and height in pixels
+        cache_dir (str, optional): Directory of encoded images, None to keep them in memory only
+
+    Returns:
+        list: Images from load_image, each with a 'caption' naming its exemplar folder;
+            empty if the file type takes no reference images
+    """
+    images = []
+    for path in select_reference_images(item, exemplars_dir, limit):
+        image = load_image(path, max_edge, cache_dir)
+        if image is not None:
+            name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            images.append(dict(image, caption=REFERENCE_IMAGE_CAPTION.format(name=name)))
+    return images
+
+def clear_image_caches():
+    """Forget the images loaded and found in this process, e.g. after exemplars change"""
+    with _lock:
+        _loaded_images.clear()
+        _candidate_images.clear()
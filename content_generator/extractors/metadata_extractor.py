@@ -1,24 +1,39 @@
 """
 Functions for extracting and processing metadata.
+
+Metadata is either one JSON document mapping category names to lists of
+items, or a JSON Lines file (``.jsonl``) with one item per line, which is
+opened lazily through ``metadata_store.MetadataStore``. Either way it is a
+mapping of category name to a sequence of items, so the functions below
+work with both.
 """
 
 from ..config import DEFAULT_METADATA_PATH
 from ..utils.file_utils import read_json
+from .metadata_store import MetadataStore, is_jsonl_path, make_records
 
 def extract_metadata(metadata_path=DEFAULT_METADATA_PATH):
     """
-    Extract metadata from a JSON file
+    Extract metadata from a JSON or JSONL file
     
     Args:
-        metadata_path (str): Path to the metadata JSON file
+        metadata_path (str): Path to the metadata JSON or JSONL file
         
     Returns:
-        dict: The metadata as a dictionary
+        Mapping: Category name to a sequence of MetadataRecord items
     """
-    metadata = read_json(metadata_path)
-    if not metadata:
-        print(f"Failed to load metadata from {metadata_path}")
-        return {}
+    if is_jsonl_path(metadata_path):
+        try:
+            metadata = MetadataStore(metadata_path)
+        except (OSError, ValueError) as e:
+            print(f"Failed to load metadata from {metadata_path}: {e}")
+            return {}
+    else:
+        metadata = read_json(metadata_path)
+        if not metadata:
+            print(f"Failed to load metadata from {metadata_path}")
+            return {}
+        metadata = make_records(metadata)
     
     print(f"Loaded metadata with {len(metadata)} categories")
     return metadata
@@ -40,6 +55,13 @@ def get_item_by_index(metadata, category, index):
         return items[index]
     return None
 
+def get_item_names(metadata, category):
+    """Get the name of every item in a category, from the index when there is one"""
+    items = get_items_in_category(metadata, category)
+    if hasattr(items, 'names'):
+        return items.names()
+    return [get_item_name(item) for item in items]
+
 def get_item_name(item):
     """Get the name of an item (topic or course title)"""
     return item.get('topic', item.get('course_title', 'unnamed'))
@@ -55,3 +77,12 @@ def get_learning_objectives(item):
 def get_content_metrics(item):
     """Get the content metrics of an item"""
     return item.get('content_metrics', {})
+
+def get_item_search_text(item):
+    """Get the free text describing an item (name, objectives and description), used for retrieval"""
+    parts = [get_item_name(item)]
+    parts.extend(get_learning_objectives(item))
+    parts.extend(item.get('learning_path', []))
+    if item.get('course_description'):
+        parts.append(item['course_description'])
+    return ' '.join(str(part) for part in parts)
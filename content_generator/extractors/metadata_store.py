@@ -0,0 +1,325 @@
+"""
+Lazy, indexed metadata storage for large catalogs.
+
+Metadata can be stored as JSON Lines, one item per line with a ``category``
+field, instead of one JSON document. The first time a JSONL file is opened, a
+SQLite index of the byte offset of every item is built next to the other
+caches, and it is reused until the file's size or modification time changes.
+Listing categories then reads only the index, and fetching an item seeks to
+its line and parses just that line.
+
+Items are returned as ``MetadataRecord`` objects: read-only mappings backed
+by slots, which are much smaller than dicts and work with every
+``metadata_extractor`` helper.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping, Sequence
+from ..config import DEFAULT_METADATA_INDEX_DIR
+
+# Bump when the index layout changes; older indexes are rebuilt from scratch
+INDEX_VERSION = 1
+
+# Extensions of JSON Lines metadata files
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+# Index rows are inserted in chunks of this many items
+INDEX_CHUNK_SIZE = 10000
+
+_MISSING = object()
+
+class MetadataRecord(Mapping):
+    """
+    A read-only metadata item
+
+    Known fields are stored in slots and lists are stored as tuples; any other
+    fields go in a small overflow dict.
+    """
+
+    FIELDS = (
+        'topic', 'course_title', 'file_type', 'learning_objectives', 'content_metrics',
+        'learning_path', 'course_description'
+    )
+
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, data):
+        """
+        Create a record from a parsed item
+
+        Args:
+            data (dict): Item fields
+        """
+        extra = None
+        for key, value in data.items():
+            if isinstance(value, list):
+                value = tuple(value)
+            if key in self.FIELDS:
+                object.__setattr__(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        object.__setattr__(self, '_extra', extra)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            return getattr(self, key, default)
+        return self._extra.get(key, default) if self._extra else default
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MetadataRecord is read-only")
+
+    def __reduce__(self):
+        return (MetadataRecord, (dict(self),))
+
+    def __repr__(self):
+        return f"MetadataRecord({dict(self)!r})"
+
+def make_records(metadata):
+    """
+    Convert fully loaded JSON metadata into records
+
+    Args:
+        metadata (dict): Category name to list of item dicts
+
+    Returns:
+        dict: Category name to list of MetadataRecord objects
+    """
+    return {category: [MetadataRecord(item) for item in items] for category, items in metadata.items()}
+
+def is_jsonl_path(path):
+    """Check whether a metadata path is a JSON Lines file based on its extension"""
+    return str(path).lower().endswith(JSONL_EXTENSIONS)
+
+def write_jsonl(metadata, path):
+    """
+    Write metadata as JSON Lines, one item per line with its category
+
+    Args:
+        metadata (Mapping): Category name to sequence of items
+        path (str): Output path
+
+    Returns:
+        int: Number of items written
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for category, items in metadata.items():
+            for item in items:
+                file.write(json.dumps({'category': category, **item}, ensure_ascii=False))
+                file.write('\n')
+                count += 1
+    return count
+
+class CategoryView(Sequence):
+    """
+    The items of one category of a MetadataStore, loaded on access
+    """
+
+    def __init__(self, store, category_id, count):
+        self._store = store
+        self._category_id = category_id
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._store._read_item(self._category_id, index)
+
+    def __iter__(self):
+        # One query for every offset, then a sequential read of the file
+        for offset in self._store._category_offsets(self._category_id):
+            yield self._store._read_at(offset)
+
+    def names(self):
+        """Get the name of every item from the index, without reading the items"""
+        return self._store._category_names(self._category_id)
+
+class MetadataStore(Mapping):
+    """
+    Read-only mapping of category name to a lazy sequence of items, over a JSONL file
+    """
+
+    def __init__(self, path, index_dir=DEFAULT_METADATA_INDEX_DIR):
+        """
+        Open a JSONL metadata file, building or refreshing its offset index
+
+        Args:
+            path (str): Path to the JSONL metadata file
+            index_dir (str, optional): Directory for offset index files
+        """
+        self.path = path
+        self.index_path = os.path.join(
+            index_dir, hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16] + '.sqlite3'
+        )
+        os.makedirs(index_dir, exist_ok=True)
+
+        # Reads come from batch worker threads; one lock covers the index and the file handle
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        try:
+            self._file = open(path, 'rb')
+        except OSError:
+            self._conn.close()
+            raise
+
+        # A file that cannot be indexed leaves no open handles behind
+        try:
+            stat = os.fstat(self._file.fileno())
+            if self._get_stamp() != [INDEX_VERSION, stat.st_size, stat.st_mtime_ns]:
+                self._build_index(stat)
+
+            self._categories = {
+                name: (category_id, count)
+                for category_id, name, count in self._conn.execute(
+                    "SELECT id, name, count FROM categories ORDER BY id"
+                )
+            }
+        except BaseException:
+            self.close()
+            raise
+
+    def __getitem__(self, category):
+        category_id, count = self._categories[category]
+        return CategoryView(self, category_id, count)
+
+    def __contains__(self, category):
+        return category in self._categories
+
+    def __iter__(self):
+        return iter(self._categories)
+
+    def __len__(self):
+        return len(self._categories)
+
+    def close(self):
+        """Close the metadata file and the index"""
+        with self._lock:
+            self._file.close()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_stamp(self):
+        """Get [version, size, mtime_ns] of the file the index was built from, or None"""
+        try:
+            row = self._conn.execute("SELECT version, size, mtime_ns FROM stamp").fetchone()
+        except sqlite3.Error:
+            return None
+        return list(row) if row else None
+
+    def _build_index(self, stat):
+        """Scan the file once and record the offset, category and name of every item"""
+        print(f"Indexing metadata in {self.path}...")
+        self._conn.executescript("""
+            DROP TABLE IF EXISTS stamp;
+            DROP TABLE IF EXISTS categories;
+            DROP TABLE IF EXISTS items;
+            CREATE TABLE stamp (version INTEGER, size INTEGER, mtime_ns INTEGER);
+            CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, count INTEGER NOT NULL);
+            CREATE TABLE items (
+                category_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                name TEXT,
+                PRIMARY KEY (category_id, position)
+            ) WITHOUT ROWID;
+        """)
+
+        categories = {}
+        rows = []
+        self._file.seek(0)
+        offset = 0
+        for number, line in enumerate(self._file, start=1):
+            if line.strip():
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{self.path} line {number}: {e}") from None
+                category = item.get('category', 'uncategorized')
+                category_id, count = categories.get(category, (len(categories) + 1, 0))
+                categories[category] = (category_id, count + 1)
+                rows.append((category_id, count, offset, item.get('topic', item.get('course_title'))))
+                if len(rows) >= INDEX_CHUNK_SIZE:
+                    self._conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?)", rows)
+                    rows = []
+            offset += len(line)
+
+        self._conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?)", rows)
+        self._conn.executemany(
+            "INSERT INTO categories (id, name, count) VALUES (?, ?, ?)",
+            [(category_id, name, count) for name, (category_id, count) in categories.items()]
+        )
+        self._conn.execute(
+            "INSERT INTO stamp VALUES (?, ?, ?)", (INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+        )
+        self._conn.commit()
+
+    def _read_item(self, category_id, position):
+        """Read one item by its position in a category"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT offset FROM items WHERE category_id = ? AND position = ?", (category_id, position)
+            ).fetchone()
+        return self._read_at(row[0])
+
+    def _read_at(self, offset):
+        """Read and parse the item on the line starting at ``offset``"""
+        with self._lock:
+            self._file.seek(offset)
+            line = self._file.readline()
+        item = json.loads(line)
+        item.pop('category', None)
+        return MetadataRecord(item)
+
+    def _category_offsets(self, category_id):
+        """Get the offset of every item in a category, in order"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT offset FROM items WHERE category_id = ? ORDER BY position", (category_id,)
+            )]
+
+    def _category_names(self, category_id):
+        """Get the name of every item in a category, in order"""
+        with self._lock:
+            return [row[0] or 'unnamed' for row in self._conn.execute(
+                "SELECT name FROM items WHERE category_id = ? ORDER BY position", (category_id,)
+            )]
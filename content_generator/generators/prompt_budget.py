@@ -0,0 +1,120 @@
+"""
+Token budgeting for prompts.
+
+A prompt is a list of sections, each with a priority. Sections are clipped to
+their own token allowance when they are created, and if the whole prompt is
+still over the input budget, the lowest-priority sections are trimmed (or
+dropped) first until it fits. Token counts are local estimates, see
+``utils.token_utils``.
+"""
+
+from ..config import DEFAULT_MAX_TOKENS, MAX_INPUT_TOKENS, MODEL_CONTEXT_TOKENS
+from ..utils.token_utils import estimate_tokens, truncate_to_tokens
+
+# Section priorities; required sections are never trimmed
+PRIORITY_REQUIRED = 100
+PRIORITY_HIGH = 75
+PRIORITY_MEDIUM = 50
+PRIORITY_LOW = 25
+
+# A trimmed section shorter than this is dropped instead
+MIN_SECTION_TOKENS = 50
+
+class PromptSection:
+    """
+    One named section of a prompt with its priority and estimated token count
+    """
+
+    __slots__ = ('name', 'text', 'priority', 'tokens')
+
+    def __init__(self, name, text, priority=PRIORITY_MEDIUM, allowance=None):
+        """
+        Create a section, clipping it to its allowance
+
+        Args:
+            name (str): Section name, used in log messages
+            text (str): Section text
+            priority (int, optional): Higher priorities are trimmed last
+            allowance (int, optional): Maximum estimated tokens for this section
+        """
+        text = (text or "").strip()
+        if allowance is not None:
+            text = truncate_to_tokens(text, allowance)
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.tokens = estimate_tokens(text)
+
+    def __repr__(self):
+        return f"PromptSection({self.name!r}, priority={self.priority}, tokens={self.tokens})"
+
+def get_input_token_budget(max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Get the input token budget for a request
+
+    Args:
+        max_tokens (int, optional): Tokens reserved for the response
+
+    Returns:
+        int: The configured input limit, capped by what the context window leaves after the response
+    """
+    return min(MAX_INPUT_TOKENS, MODEL_CONTEXT_TOKENS - max_tokens)
+
+def count_tokens(sections):
+    """Get the total estimated tokens of a list of sections"""
+    return sum(section.tokens for section in sections if section is not None)
+
+def fit_sections(sections, max_input_tokens=None):
+    """
+    Trim sections until their total fits the input budget
+
+    Sections are trimmed lowest priority first, and among equal priorities
+    the later section first. A section that would be left with fewer than
+    ``MIN_SECTION_TOKENS`` is dropped entirely.
+
+    Args:
+        sections (list): PromptSection objects in prompt order
+        max_input_tokens (int, optional): Token budget, defaults to get_input_token_budget()
+
+    Returns:
+        list: The same list if it already fits, otherwise a new list aligned with
+            ``sections`` holding trimmed copies, or None for dropped sections
+    """
+    if max_input_tokens is None:
+        max_input_tokens = get_input_token_budget()
+
+    excess = count_tokens(sections) - max_input_tokens
+    if excess <= 0:
+        return sections
+
+    fitted = list(sections)
+    order = sorted(
+        (
+            position for position, section in enumerate(sections)
+            if section.tokens and section.priority < PRIORITY_REQUIRED
+        ),
+        key=lambda position: (sections[position].priority, -position)
+    )
+    trimmed = []
+    for position in order:
+        if excess <= 0:
+            break
+        section = sections[position]
+        keep = section.tokens - excess
+        if keep < MIN_SECTION_TOKENS:
+            fitted[position] = None
+            excess -= section.tokens
+            trimmed.append(f"{section.name} (dropped)")
+        else:
+            fitted[position] = PromptSection(section.name, section.text, section.priority, keep)
+            excess -= section.tokens - fitted[position].tokens
+            trimmed.append(f"{section.name} (to {fitted[position].tokens} tokens)")
+
+    print(f"Prompt trimmed to fit {max_input_tokens} input tokens: {', '.join(trimmed)}")
+    if excess > 0:
+        print(f"Warning: required prompt sections alone are {excess} tokens over the budget")
+    return fitted
+
+def join_sections(sections):
+    """Join the text of the sections that are present and non-empty"""
+    return "\n\n".join(section.text for section in sections if section is not None and section.text)
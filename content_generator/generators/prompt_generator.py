@@ -2,13 +2,29 @@
 Functions for generating prompts based on metadata and format instructions.
 """
 
-from ..extractors.example_extractor import extract_example_content
+import json
+import threading
+from ..config import DEFAULT_INDEX_PATH, EXAMPLE_RETRIEVAL, EXAMPLE_TOKEN_BUDGET
+from ..extractors.example_extractor import extract_example_content, get_example_path, get_example_stamp
+from ..extractors.exemplar_retriever import get_retriever
 from ..extractors.metadata_extractor import (
-    get_file_type, get_item_name, get_learning_objectives, get_content_metrics
+    get_file_type, get_item_name, get_learning_objectives, get_content_metrics, get_item_search_text
 )
 from .format_generator import (
     generate_format_instructions, generate_content_standards, generate_step_by_step_guidance
 )
+from .prompt_budget import (
+    PromptSection, PRIORITY_REQUIRED, PRIORITY_HIGH, PRIORITY_MEDIUM, PRIORITY_LOW,
+    fit_sections, join_sections, count_tokens, get_input_token_budget
+)
+from ..utils.token_utils import estimate_tokens
+
+# The last section of every item prompt
+CLOSING_INSTRUCTION = "Please generate complete, well-structured content that follows all the guidelines above."
+
+# PromptTemplate by (file_type, include_examples), with the example file stamp it was built from
+_static_prompt_cache = {}
+_static_prompt_lock = threading.Lock()
 
 def generate_basic_prompt(item):
     """
@@ -79,59 +95,294 @@ The following is an example of how the content should be structured and formatte
 Your generated content should follow a similar structure and formatting style.
 """
 
-def generate_full_prompt(item, include_examples=True):
+def generate_retrieved_example_prompt(item, token_budget=EXAMPLE_TOKEN_BUDGET, index_path=DEFAULT_INDEX_PATH):
     """
-    Generate a full prompt based on metadata
+    Generate a prompt section with the exemplar passages most relevant to an item
     
     Args:
         item (dict): Metadata item
+        token_budget (int, optional): Maximum estimated tokens of passage text
+        index_path (str, optional): Path to the exemplar index
+        
+    Returns:
+        str: Example prompt section, or None if there is no index or nothing relevant
+    """
+    retriever = get_retriever(index_path)
+    if retriever is None:
+        return None
+    
+    passages = retriever.retrieve(get_item_search_text(item), token_budget)
+    if not passages:
+        return None
+    
+    excerpts = "\n\n".join(f"[From: {passage['path']}]\n{passage['text']}" for passage in passages)
+    return f"""
+EXAMPLE EXCERPTS:
+The following excerpts from existing course materials are relevant to this content:
+
+{excerpts}
+
+Use them as a reference for tone, structure and level of detail.
+"""
+
+def generate_static_prompt(file_type, include_examples=True):
+    """
+    Generate the prompt sections that are identical for every item of a file type
+    
+    These form a stable prefix that is sent as a cacheable system prompt, so
+    they must not depend on anything item-specific.
+    
+    Args:
+        file_type (str): Type of file
         include_examples (bool): Whether to include example content
         
     Returns:
-        str: Full prompt
+        str: Static prompt sections
+    
+    The assembled sections are cached per file type and rebuilt only when the
+    example file changes, so batches of one file type share a single string.
     """
-    file_type = get_file_type(item)
+    return get_prompt_template(file_type, include_examples).system_prompt
+
+def clear_static_prompt_cache():
+    """Forget every cached static prompt and template"""
+    with _static_prompt_lock:
+        _static_prompt_cache.clear()
+
+def get_prompt_template(file_type, include_examples=True):
+    """
+    Get the compiled prompt template for a file type
+    
+    Templates are cached and rebuilt only when the example file changes.
+    
+    Args:
+        file_type (str): Type of file
+        include_examples (bool): Whether to include example content
+        
+    Returns:
+        PromptTemplate: The template
+    """
+    stamp = get_example_stamp(get_example_path(file_type)) if include_examples else None
+    key = (file_type, include_examples)
+    cached = _static_prompt_cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
     
-    # Basic prompt
-    basic_prompt = generate_basic_prompt(item)
+    template = PromptTemplate(file_type, include_examples)
+    with _static_prompt_lock:
+        _static_prompt_cache[key] = (stamp, template)
+    return template
+
+class PromptTemplate:
+    """
+    The prompt for one file type, compiled so that items only fill in their own fields
     
-    # Metrics prompt
-    metrics_prompt = generate_metrics_prompt(item)
+    The static sections are built, joined and counted once. Rendering an item
+    formats its details and metrics and joins them with the closing
+    instruction; the section-by-section token budget is only worked out for
+    prompts that could be over it.
     
-    # Format instructions
-    format_prompt = generate_format_instructions(file_type)
+    Attributes:
+        file_type (str): Type of file
+        include_examples (bool): Whether the static prompt includes the example
+        static_sections (list): PromptSection objects of the system prompt
+        system_prompt (str): The joined static sections
+        static_tokens (int): Estimated tokens of the system prompt
+    """
     
-    # Content standards
-    standards_prompt = generate_content_standards()
+    def __init__(self, file_type, include_examples=True):
+        """
+        Build the static part of the prompt
+        
+        Args:
+            file_type (str): Type of file
+            include_examples (bool): Whether to include example content
+        """
+        self.file_type = file_type
+        self.include_examples = include_examples
+        self.static_sections = _build_static_sections(file_type, include_examples)
+        self.system_prompt = join_sections(self.static_sections)
+        self.static_tokens = count_tokens(self.static_sections)
+        self._system_json = None
     
-    # Step-by-step guidance
-    step_by_step_prompt = generate_step_by_step_guidance()
+    @property
+    def system_json(self):
+        """The system prompt encoded as a JSON string, for writing it once per export line without re-encoding"""
+        if self._system_json is None:
+            self._system_json = json.dumps(self.system_prompt)
+        return self._system_json
     
-    # Example content
-    example_prompt = generate_example_prompt(file_type) if include_examples else ""
+    def render(self, item, example_prompt="", max_input_tokens=None):
+        """
+        Render the prompt for one item
+        
+        Gives the same result as assembling and fitting every section, see
+        generate_prompt_parts().
+        
+        Args:
+            item (dict): Metadata item of this template's file type
+            example_prompt (str, optional): Item-specific example section, e.g. retrieved excerpts
+            max_input_tokens (int, optional): Input token budget, defaults to get_input_token_budget()
+            
+        Returns:
+            tuple: (system_prompt, user_prompt)
+        """
+        user_prompt = "\n\n".join(
+            text for text in (
+                generate_basic_prompt(item).strip(),
+                generate_metrics_prompt(item).strip(),
+                (example_prompt or "").strip(),
+                CLOSING_INSTRUCTION
+            ) if text
+        )
+        if max_input_tokens is None:
+            max_input_tokens = get_input_token_budget()
+        
+        # Every estimated token is at least one character, so a prompt this short fits without counting
+        if self.static_tokens + len(user_prompt) <= max_input_tokens:
+            return self.system_prompt, user_prompt
+        
+        item_sections = generate_item_sections(item, example_prompt)
+        sections = self.static_sections + item_sections
+        fitted = fit_sections(sections, max_input_tokens)
+        if fitted is sections:
+            return self.system_prompt, user_prompt
+        return join_sections(fitted[:len(self.static_sections)]), join_sections(fitted[len(self.static_sections):])
     
-    # Combine all prompt components
-    full_prompt = f"""
-{basic_prompt}
+    def count_tokens(self, system_prompt, user_prompt):
+        """
+        Estimate the input tokens of a prompt rendered by this template
+        
+        Args:
+            system_prompt (str): System prompt returned by render()
+            user_prompt (str): User prompt returned by render()
+            
+        Returns:
+            int: Estimated tokens of both parts
+        """
+        static_tokens = self.static_tokens if system_prompt is self.system_prompt else estimate_tokens(system_prompt)
+        return static_tokens + estimate_tokens(user_prompt)
 
-{metrics_prompt}
+def _build_static_sections(file_type, include_examples):
+    """Build the static prompt sections for a file type"""
+    sections = [
+        # Format instructions
+        PromptSection('format instructions', generate_format_instructions(file_type), PRIORITY_REQUIRED),
+        
+        # Content standards
+        PromptSection('content standards', generate_content_standards(), PRIORITY_MEDIUM),
+        
+        # Step-by-step guidance
+        PromptSection('step-by-step guidance', generate_step_by_step_guidance(), PRIORITY_MEDIUM)
+    ]
+    
+    # Example content
+    if include_examples:
+        sections.append(PromptSection('example', generate_example_prompt(file_type), PRIORITY_LOW))
+    
+    return sections
 
-{format_prompt}
+def generate_item_sections(item, example_prompt=""):
+    """
+    Generate the item-specific sections of the prompt
+    
+    Args:
+        item (dict): Metadata item
+        example_prompt (str, optional): Item-specific example section, e.g. retrieved excerpts
+        
+    Returns:
+        list: PromptSection objects
+    """
+    return [
+        # Basic prompt
+        PromptSection('item details', generate_basic_prompt(item), PRIORITY_REQUIRED),
+        
+        # Metrics prompt
+        PromptSection('content metrics', generate_metrics_prompt(item), PRIORITY_HIGH),
+        
+        # Item-specific examples
+        PromptSection('example excerpts', example_prompt, PRIORITY_LOW),
+        
+        PromptSection('closing instruction', CLOSING_INSTRUCTION, PRIORITY_REQUIRED)
+    ]
 
-{standards_prompt}
+def generate_item_prompt(item, example_prompt=""):
+    """
+    Generate the item-specific part of the prompt
+    
+    Args:
+        item (dict): Metadata item
+        example_prompt (str, optional): Item-specific example section, e.g. retrieved excerpts
+        
+    Returns:
+        str: Item prompt
+    """
+    return join_sections(generate_item_sections(item, example_prompt))
 
-{step_by_step_prompt}
+def generate_prompt_parts(item, include_examples=True, example_token_budget=EXAMPLE_TOKEN_BUDGET,
+                          max_input_tokens=None):
+    """
+    Generate the prompt as a cacheable system prefix and a per-item user message
+    
+    When the exemplar index exists, examples are the passages most relevant to
+    the item, packed into ``example_token_budget``. They vary per item, so they
+    go in the user message. Otherwise the fixed example for the file type is
+    part of the static prefix.
+    
+    If the prompt is over the input token budget, the lowest-priority sections
+    (examples first, then standards and guidance) are trimmed until it fits.
+    A trimmed system prompt is no longer the shared prefix, so oversized items
+    lose prompt caching rather than being sent whole.
+    
+    Args:
+        item (dict): Metadata item
+        include_examples (bool): Whether to include example content
+        example_token_budget (int, optional): Token budget for retrieved examples
+        max_input_tokens (int, optional): Input token budget, defaults to get_input_token_budget()
+        
+    Returns:
+        tuple: (system_prompt, user_prompt)
+    """
+    template, example_prompt = get_item_template(item, include_examples, example_token_budget)
+    return template.render(item, example_prompt, max_input_tokens)
 
-{example_prompt}
+def get_item_template(item, include_examples=True, example_token_budget=EXAMPLE_TOKEN_BUDGET):
+    """
+    Get the template an item's prompt is rendered with, and its item-specific examples
+    
+    Args:
+        item (dict): Metadata item
+        include_examples (bool): Whether to include example content
+        example_token_budget (int, optional): Token budget for retrieved examples
+        
+    Returns:
+        tuple: (PromptTemplate, example_prompt), where example_prompt holds the retrieved
+            excerpts, or is empty when examples are left out or part of the template
+    """
+    retrieved = None
+    if include_examples and EXAMPLE_RETRIEVAL:
+        retrieved = generate_retrieved_example_prompt(item, example_token_budget)
+    return get_prompt_template(get_file_type(item), include_examples and not retrieved), retrieved or ""
 
-Please generate complete, well-structured content that follows all the guidelines above.
-""".strip()
+def generate_full_prompt(item, include_examples=True):
+    """
+    Generate a full prompt based on metadata
+    
+    Args:
+        item (dict): Metadata item
+        include_examples (bool): Whether to include example content
+        
+    Returns:
+        str: Full prompt
+    """
+    system_prompt, user_prompt = generate_prompt_parts(item, include_examples)
     
-    return full_prompt
+    # Static sections first and item-specific content last, as they are sent to the API
+    return f"{system_prompt}\n\n{user_prompt}"
 
-def generate_prompt_from_topic(topic, file_type="lesson", learning_objectives=None):
+def build_topic_item(topic, file_type="lesson", learning_objectives=None):
     """
-    Generate a prompt from a topic without metadata
+    Build a minimal metadata item from a topic
     
     Args:
         topic (str): Topic to generate content for
@@ -139,7 +390,7 @@ def generate_prompt_from_topic(topic, file_type="lesson", learning_objectives=No
         learning_objectives (list): List of learning objectives
         
     Returns:
-        str: Full prompt
+        dict: Metadata item
     """
     if learning_objectives is None:
         learning_objectives = [
@@ -148,8 +399,7 @@ def generate_prompt_from_topic(topic, file_type="lesson", learning_objectives=No
             f"Debug common issues with {topic}"
         ]
     
-    # Create a minimal metadata item
-    item = {
+    return {
         'topic': topic,
         'file_type': file_type,
         'learning_objectives': learning_objectives,
@@ -160,5 +410,17 @@ def generate_prompt_from_topic(topic, file_type="lesson", learning_objectives=No
             'number_of_diagrams': 1
         }
     }
+
+def generate_prompt_from_topic(topic, file_type="lesson", learning_objectives=None):
+    """
+    Generate a prompt from a topic without metadata
     
-    return generate_full_prompt(item)
+    Args:
+        topic (str): Topic to generate content for
+        file_type (str): Type of file (e.g., 'lesson', 'lab')
+        learning_objectives (list): List of learning objectives
+        
+    Returns:
+        str: Full prompt
+    """
+    return generate_full_prompt(build_topic_item(topic, file_type, learning_objectives))
@@ -0,0 +1,153 @@
+"""
+Functions for generating long items as an outline followed by sections.
+
+A long lesson or lab is first planned with one short request for an outline.
+Each section of the outline is then generated by its own request, so the
+sections run concurrently and each gets the full output token limit. Every
+request for the item sends the same system prompt and item prompt as
+cacheable prefix blocks; only the short instruction after them differs.
+"""
+
+import json
+import re
+from ..config import SECTIONED_MIN_WORDS, MAX_OUTLINE_SECTIONS
+from ..extractors.metadata_extractor import get_file_type, get_content_metrics
+
+# When items are generated in sections: by target length, for every item, or never
+SECTION_MODES = ('auto', 'always', 'never')
+
+# Outline lines that are headings, bullets or numbered entries
+_OUTLINE_LINE_RE = re.compile(r"^\s*(?:#{1,6}\s+|[-*]\s+|\d+[.)]\s+)(.+?)\s*$")
+
+def get_target_words(item):
+    """Get the target word count of an item, or 0 if it has none"""
+    try:
+        return int(get_content_metrics(item).get('word_count') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def should_generate_sections(item, mode='auto', min_words=SECTIONED_MIN_WORDS):
+    """
+    Decide whether an item is generated as an outline and sections
+
+    Args:
+        item (dict): Metadata item
+        mode (str, optional): One of SECTION_MODES
+        min_words (int, optional): Target word count from which 'auto' uses sections
+
+    Returns:
+        bool: True to generate in sections
+    """
+    if mode == 'always':
+        return True
+    if mode == 'never':
+        return False
+    return get_target_words(item) >= min_words
+
+def generate_outline_prompt(item, max_sections=MAX_OUTLINE_SECTIONS):
+    """
+    Generate the instruction asking for an item's outline
+
+    Args:
+        item (dict): Metadata item
+        max_sections (int, optional): Maximum number of sections to plan
+
+    Returns:
+        str: Outline instruction, sent after the item prompt
+    """
+    file_type = get_file_type(item).replace('_', ' ')
+    words = get_target_words(item)
+    length = f", about {words} words in total" if words else ""
+    return (
+        f"Before writing anything, plan the {file_type} described above as an outline of at most "
+        f"{max_sections} top-level sections{length}, in the order they will appear. "
+        "Reply with only a JSON array and no other text. Each element is an object with "
+        "\"title\" (the section heading, without # marks), \"summary\" (one or two sentences on what "
+        "the section covers) and \"words\" (its target length in words)."
+    )
+
+def parse_outline(text, max_sections=MAX_OUTLINE_SECTIONS):
+    """
+    Parse an outline reply into sections
+
+    JSON is expected; markdown headings, bullets or numbered lines are
+    accepted as titles when the reply is not valid JSON.
+
+    Args:
+        text (str): The outline reply
+        max_sections (int, optional): Sections kept, from the start
+
+    Returns:
+        list: Dicts with 'title', 'summary' and 'words' keys
+
+    Raises:
+        ValueError: No sections could be found
+    """
+    entries = None
+    start, end = text.find('['), text.rfind(']')
+    if start != -1 and end > start:
+        try:
+            entries = json.loads(text[start:end + 1])
+        except ValueError:
+            entries = None
+    if not isinstance(entries, list):
+        entries = [match.group(1) for match in map(_OUTLINE_LINE_RE.match, text.splitlines()) if match]
+
+    sections = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'title': entry}
+        if not isinstance(entry, dict) or not str(entry.get('title') or '').strip():
+            continue
+        try:
+            words = int(entry.get('words') or 0)
+        except (TypeError, ValueError):
+            words = 0
+        sections.append({
+            'title': str(entry['title']).strip().lstrip('#').strip(),
+            'summary': str(entry.get('summary') or '').strip(),
+            'words': max(0, words)
+        })
+
+    if not sections:
+        raise ValueError("no sections found in the outline")
+    return sections[:max_sections]
+
+def generate_section_prompt(item, outline, position):
+    """
+    Generate the instruction for writing one section of an outline
+
+    Args:
+        item (dict): Metadata item
+        outline (list): Sections from parse_outline
+        position (int): Index of the section to write
+
+    Returns:
+        str: Section instruction, sent after the item prompt
+    """
+    file_type = get_file_type(item).replace('_', ' ')
+    section = outline[position]
+    plan = '\n'.join(
+        f"{number}. {entry['title']}" + (f": {entry['summary']}" if entry['summary'] else "")
+        for number, entry in enumerate(outline, 1)
+    )
+
+    if position == 0:
+        opening = f"Start the document with its top-level title, then the heading \"## {section['title']}\"."
+    else:
+        opening = (
+            f"Start with the heading \"## {section['title']}\". The sections before it are written "
+            "separately, so do not repeat the document title or introduce the document again."
+        )
+    length = f" Aim for about {section['words']} words." if section['words'] else ""
+
+    return (
+        f"The {file_type} described above is being written one section at a time, following this outline:\n\n"
+        f"{plan}\n\n"
+        f"Write only section {position + 1}, \"{section['title']}\", in full and following all the "
+        f"guidelines above. {opening} Do not write any other section.{length}"
+    )
+
+def stitch_sections(sections):
+    """Join generated sections, in outline order, into one document"""
+    return '\n\n'.join(section.strip() for section in sections)
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Long-running generation server.
+
+Keeps one ContentGenerator warm (metadata, example and exemplar caches, the
+pooled API client and response cache) and accepts generation jobs over local
+HTTP, on a TCP port or a Unix socket:
+
+    POST /jobs                  start a job, returns {"id": ..., "status": "queued"}
+    GET  /jobs                  list jobs
+    GET  /jobs/<id>             job status, progress and results
+    GET  /jobs/<id>/events      progress as JSON Lines, streamed until the job ends
+    GET  /categories            metadata categories
+    GET  /health                server status
+
+A job body selects what to generate, as on the command line:
+{"category": "...", "item": 3}, {"category": "..."}, {"all": true} or
+{"topic": "...", "type": "lesson", "objectives": [...]}, with optional
+"include_examples", "save", "force" and "workers".
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import ContentGenerator
+from .extractors.metadata_extractor import get_item_by_index, get_file_type
+from .generators.prompt_generator import generate_prompt_parts
+from .generators.section_generator import SECTION_MODES
+from .utils.file_utils import FSYNC_POLICIES
+from .utils.retry_utils import GenerationError
+from .config import (
+    DEFAULT_METADATA_PATH, DEFAULT_OUTPUT_DIR, DEFAULT_CACHE_PATH, DEFAULT_MAX_WORKERS, DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_SERVE_HOST, DEFAULT_SERVE_PORT, DEFAULT_SERVE_MAX_JOBS, DEFAULT_SERVE_JOBS_KEPT, OUTPUT_FSYNC
+)
+
+class Job:
+    """
+    A generation job and its progress events
+    """
+
+    def __init__(self, job_id, request):
+        """
+        Initialize a queued job
+
+        Args:
+            job_id (str): Job ID
+            request (dict): Validated job request
+        """
+        self.id = job_id
+        self.request = request
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total = 0
+        self.results = []
+        self.error = None
+        self.events = []
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def add_event(self, event):
+        """Record a progress event and wake up event stream readers"""
+        with self._condition:
+            self.events.append(dict(event, job=self.id, time=time.time()))
+            self._condition.notify_all()
+
+    def wait_for_events(self, position, timeout=None):
+        """
+        Wait for events after ``position``
+
+        Args:
+            position (int): Number of events already seen
+            timeout (float, optional): Seconds to wait
+
+        Returns:
+            list: New events, empty if the wait timed out or the job has ended
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.events) > position or self.finished, timeout)
+            return self.events[position:]
+
+    def to_dict(self, include_results=True):
+        """Get the job's status as a JSON-serializable dict"""
+        job = {
+            'id': self.id,
+            'request': self.request,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'total': self.total,
+            'completed': len(self.results),
+            'failed': sum(1 for result in self.results if result['error']),
+            'error': self.error
+        }
+        if include_results:
+            job['results'] = self.results
+        return job
+
+class JobManager:
+    """
+    Runs jobs against a shared ContentGenerator on a bounded pool of job threads
+    """
+
+    def __init__(self, generator, max_jobs=DEFAULT_SERVE_MAX_JOBS, jobs_kept=DEFAULT_SERVE_JOBS_KEPT):
+        """
+        Initialize the manager
+
+        Args:
+            generator (ContentGenerator): Generator shared by every job
+            max_jobs (int, optional): Jobs that run at once; later jobs wait in the queue
+            jobs_kept (int, optional): Finished jobs kept for status queries
+        """
+        self.generator = generator
+        self.jobs_kept = jobs_kept
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._slots = threading.BoundedSemaphore(max(1, max_jobs))
+
+    def submit(self, request):
+        """
+        Validate a job request and start it
+
+        Args:
+            request (dict): Job request body
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            ValueError: The request does not select anything to generate
+        """
+        request = self.validate(request)
+        with self._lock:
+            job = Job(f"job-{next(self._ids)}-{int(time.time())}", request)
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        job.add_event({'type': 'queued'})
+        threading.Thread(target=self._run, args=(job,), name=job.id, daemon=True).start()
+        return job
+
+    def validate(self, request):
+        """Check a job request and fill in defaults"""
+        if not isinstance(request, dict):
+            raise ValueError("Job request must be a JSON object")
+        request = dict(request)
+        request.setdefault('include_examples', True)
+        request.setdefault('save', True)
+        request.setdefault('force', False)
+        request.setdefault('workers', DEFAULT_MAX_WORKERS)
+
+        if request.get('topic'):
+            request.setdefault('type', 'lesson')
+            return request
+        if not self.generator.metadata:
+            raise ValueError("No metadata loaded")
+        if request.get('all'):
+            return request
+
+        category = request.get('category')
+        if category is None:
+            raise ValueError("Give 'topic', 'category' (with optional 'item') or 'all'")
+        if category not in self.generator.get_categories():
+            raise ValueError(f"Unknown category '{category}'")
+        item = request.get('item')
+        if item is not None:
+            if not isinstance(item, int) or not get_item_by_index(self.generator.metadata, category, item):
+                raise ValueError(f"Item not found at index {item} in category {category}")
+        return request
+
+    def get(self, job_id):
+        """Get a job by ID, or None"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        """Get every known job, oldest first"""
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond jobs_kept"""
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.jobs_kept)]:
+            del self.jobs[job.id]
+
+    def _run(self, job):
+        """Wait for a free slot, then run a job to completion"""
+        with self._slots:
+            job.status = 'running'
+            job.started_at = time.time()
+            request = job.request
+            try:
+                if request.get('topic'):
+                    job.total = 1
+                    job.add_event({'type': 'started', 'total': job.total})
+                    self._run_topic(job)
+                else:
+                    self._run_items(job)
+                job.status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+            job.finished_at = time.time()
+            job.add_event({'type': 'finished', 'status': job.status, 'error': job.error})
+
+    def _run_topic(self, job):
+        """Generate content for a topic job"""
+        request = job.request
+        result = {'category': None, 'index': None, 'name': request['topic'], 'content': None, 'path': None,
+                  'error': None}
+        try:
+            result['content'] = self.generator.generate_from_topic(
+                request['topic'],
+                file_type=request['type'],
+                learning_objectives=request.get('objectives'),
+                save=request['save']
+            )
+        except GenerationError as e:
+            result['error'] = str(e)
+        self._add_result(job, result)
+        if result['error']:
+            raise GenerationError(result['error'])
+
+    def _run_items(self, job):
+        """Generate the metadata items of a job concurrently"""
+        request = job.request
+        if request.get('all'):
+            categories = None
+        else:
+            categories = [request['category']]
+        items = None
+        if request.get('item') is not None:
+            items = [(request['category'], request['item'])]
+
+        job.total = (
+            len(items) if items is not None
+            else sum(len(self.generator.get_items_in_category(category))
+                     for category in categories or self.generator.get_categories())
+        )
+        job.add_event({'type': 'started', 'total': job.total})
+        self.generator.generate_batch(
+            categories,
+            include_examples=request['include_examples'],
+            save=request['save'],
+            max_workers=request['workers'],
+            force=request['force'],
+            items=items,
+            on_result=lambda result: self._add_result(job, result)
+        )
+        # Up-to-date items were skipped; report the job as complete
+        job.total = len(job.results)
+
+    def _add_result(self, job, result):
+        """Record a finished item and publish it as an event"""
+        # Saved content is on disk; only unsaved content is returned
+        if result.get('path'):
+            result = dict(result, content=None)
+        job.results.append(result)
+        job.add_event({'type': 'item', 'completed': len(job.results), 'total': job.total, 'result': result})
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the job API"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Handle status, listing and event stream requests"""
+        parts = self.path.split('?')[0].strip('/').split('/')
+        manager = self.server.manager
+
+        if parts == ['health']:
+            jobs = manager.list()
+            self.send_json(200, {
+                'status': 'ok',
+                'uptime': time.time() - self.server.started_at,
+                'jobs': len(jobs),
+                'running': sum(1 for job in jobs if job.status == 'running'),
+                'coalescing': manager.generator.coalescing_stats()
+            })
+        elif parts == ['categories']:
+            self.send_json(200, {'categories': manager.generator.get_categories()})
+        elif parts == ['jobs']:
+            self.send_json(200, {'jobs': [job.to_dict(include_results=False) for job in manager.list()]})
+        elif len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = manager.get(parts[1])
+            if job is None:
+                self.send_json(404, {'error': f"Unknown job '{parts[1]}'"})
+            elif len(parts) == 2:
+                self.send_json(200, job.to_dict())
+            elif parts[2] == 'events':
+                self.send_events(job)
+            else:
+                self.send_json(404, {'error': f"Not found: {self.path}"})
+        else:
+            self.send_json(404, {'error': f"Not found: {self.path}"})
+
+    def do_POST(self):
+        """Handle job submissions"""
+        if self.path.split('?')[0].strip('/') != 'jobs':
+            self.send_json(404, {'error': f"Not found: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            job = self.server.manager.submit(request)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, {'id': job.id, 'status': job.status})
+
+    def send_json(self, status, payload):
+        """Send a JSON response"""
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_events(self, job):
+        """Stream a job's events as chunked JSON Lines until it ends"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        position = 0
+        while True:
+            events = job.wait_for_events(position, timeout=15)
+            position += len(events)
+            if events:
+                data = ''.join(json.dumps(event) + '\n' for event in events).encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+            elif not job.finished:
+                continue
+            if job.finished and position >= len(job.events):
+                break
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        """Log requests in one short line"""
+        print(f"{self.command} {self.path} {args[1] if len(args) > 1 else ''}".rstrip())
+
+class GenerationServer(ThreadingHTTPServer):
+    """Job API server on a TCP port"""
+
+    daemon_threads = True
+
+    def __init__(self, manager, host=DEFAULT_SERVE_HOST, port=DEFAULT_SERVE_PORT):
+        super().__init__((host, port), GenerationRequestHandler)
+        self.manager = manager
+        self.started_at = time.time()
+
+    @property
+    def url(self):
+        """Base URL of the server"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+class UnixGenerationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Job API server on a Unix socket"""
+
+    daemon_threads = True
+
+    def __init__(self, manager, path):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, UnixRequestHandler)
+        self.manager = manager
+        self.started_at = time.time()
+
+    @property
+    def url(self):
+        return f"unix:{self.server_address}"
+
+class UnixRequestHandler(GenerationRequestHandler):
+    """Job API handler for Unix socket connections, which have no client address"""
+
+    def address_string(self):
+        return 'unix'
+
+    def setup(self):
+        self.client_address = ('unix', 0)
+        super().setup()
+
+def warm_up(generator, include_examples=True):
+    """
+    Load everything the first request would otherwise pay for
+
+    Builds the prompt of the first item of each file type (filling the
+    example, exemplar retrieval and static prompt caches) and creates the
+    pooled API client.
+
+    Args:
+        generator (ContentGenerator): Generator to warm up
+        include_examples (bool, optional): Whether jobs will include examples
+
+    Returns:
+        float: Seconds taken
+    """
+    started = time.perf_counter()
+    seen = set()
+    for category in generator.get_categories():
+        for item in generator.get_items_in_category(category)[:1]:
+            if get_file_type(item) not in seen:
+                seen.add(get_file_type(item))
+                generate_prompt_parts(item, include_examples)
+    generator.client
+    return time.perf_counter() - started
+
+def create_server(generator, host=DEFAULT_SERVE_HOST, port=DEFAULT_SERVE_PORT, socket_path=None,
+                  max_jobs=DEFAULT_SERVE_MAX_JOBS):
+    """
+    Create a job API server for a generator
+
+    Args:
+        generator (ContentGenerator): Generator shared by every job
+        host (str, optional): Interface to listen on
+        port (int, optional): TCP port, 0 picks a free port
+        socket_path (str, optional): Listen on this Unix socket instead of TCP
+        max_jobs (int, optional): Jobs that run at once
+
+    Returns:
+        GenerationServer or UnixGenerationServer: The server; call serve_forever() to run it
+    """
+    manager = JobManager(generator, max_jobs)
+    if socket_path:
+        return UnixGenerationServer(manager, socket_path)
+    return GenerationServer(manager, host, port)
+
+def main():
+    """Run the generation server until interrupted"""
+    parser = argparse.ArgumentParser(description='Serve content generation jobs over local HTTP')
+    parser.add_argument('--host', type=str, default=DEFAULT_SERVE_HOST, help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_SERVE_PORT, help='TCP port to listen on')
+    parser.add_argument('--socket', type=str, help='Listen on a Unix socket instead of TCP')
+    parser.add_argument('--metadata', type=str, default=DEFAULT_METADATA_PATH, help='Path to metadata file')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_DIR, help='Output directory')
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_SERVE_MAX_JOBS, help='Jobs that run at once')
+    parser.add_argument('--sections', choices=SECTION_MODES, default='auto', help='Generate items as an outline plus concurrent sections: auto (long items), always or never')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS, help='Maximum open connections in the API client pool')
+    parser.add_argument('--cache-path', type=str, default=DEFAULT_CACHE_PATH, help='Path to the response cache')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the response cache')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=OUTPUT_FSYNC, help='When saved files are flushed to disk: never, each file, or always (files and their directory)')
+    parser.add_argument('--reference-images', action='store_true', help='Attach matching exemplar art (downscaled and cached) to course landing page prompts')
+    args = parser.parse_args()
+
+    generator = ContentGenerator(
+        metadata_path=args.metadata,
+        output_dir=args.output,
+        max_connections=args.max_connections,
+        cache_path=None if args.no_cache else args.cache_path,
+        sections=args.sections,
+        fsync=args.fsync,
+        reference_images=args.reference_images
+    )
+    with generator:
+        print(f"Warmed up in {warm_up(generator):.2f}s")
+        server = create_server(generator, args.host, args.port, args.socket, args.max_jobs)
+        print(f"Serving generation jobs on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down")
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.remove(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,9 @@ Test script to verify that the Content Generator package works correctly.
 
 import os
 import sys
+import tempfile
+import threading
+import time
 
 # Add the parent directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -84,6 +87,1157 @@ def test_format_instructions():
         print(f"FAILED: {e}")
         return False
 
+def test_batch_generation():
+    """Test concurrent batch generation with a stubbed API call"""
+    print("Testing batch generation... ", end="")
+    import content_generator
+    original = content_generator.generate_content_with_claude
+    try:
+        # Fail one item to check that failures are reported and not saved
+        from content_generator.utils.retry_utils import GenerationError
+        def fake_generate(prompt, **kwargs):
+            if "Broken" in prompt:
+                raise GenerationError("boom")
+            return f"# {prompt[:20]}"
+        content_generator.generate_content_with_claude = fake_generate
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            generator = ContentGenerator(api_key='test', output_dir=output_dir, cache_path=None)
+            generator.metadata = {
+                'lessons': [{'topic': f"Topic {i}", 'file_type': 'lesson'} for i in range(5)],
+                'labs': [{'topic': "Broken", 'file_type': 'lab'}]
+            }
+            results = generator.generate_batch(include_examples=False, max_workers=3)
+            saved = sorted(name for name in os.listdir(output_dir) if name.endswith('.md'))
+        
+        failed = [result for result in results if result['error']]
+        if len(results) == 6 and len(failed) == 1 and len(saved) == 5:
+            print("OK")
+            return True
+        print(f"FAILED: {len(results)} results, {len(failed)} failed, {len(saved)} saved")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+    finally:
+        content_generator.generate_content_with_claude = original
+
+def test_shared_client():
+    """Test that generations reuse one pooled client against a local stub server"""
+    print("Testing shared client... ", end="")
+    from content_generator.utils.stub_server import StubAPIServer
+    try:
+        with StubAPIServer(reply_text="Stub lesson") as server:
+            with ContentGenerator(api_key='test', base_url=server.base_url, cache_path=None) as generator:
+                contents = [generator.generate_from_topic("Test Topic", save=False) for _ in range(3)]
+            
+            if contents == ["Stub lesson"] * 3 and server.connection_count == 1:
+                print("OK")
+                return True
+            print(f"FAILED: {contents}, {server.connection_count} connections")
+            return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_response_cache():
+    """Test response cache hits, misses and LRU eviction"""
+    print("Testing response cache... ", end="")
+    from content_generator.utils.cache_utils import ResponseCache
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResponseCache(os.path.join(cache_dir, 'responses.sqlite3'), max_entries=2)
+            keys = [ResponseCache.make_key('model', 100, f"prompt {i}") for i in range(3)]
+            cache.set(keys[0], "first")
+            cache.set(keys[1], "second")
+            cache.get(keys[0])
+            cache.set(keys[2], "third")
+            
+            # The least recently used entry (keys[1]) should be evicted
+            cache.evict()
+            values = [cache.get(key) for key in keys]
+            stats = cache.stats()
+            cache.close()
+        
+        if values == ["first", None, "third"] and stats['hits'] == 3 and stats['misses'] == 1:
+            print("OK")
+            return True
+        print(f"FAILED: {values}, {stats}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_streaming_generation():
+    """Test streaming generation into an atomically renamed output file"""
+    print("Testing streaming generation... ", end="")
+    from content_generator.utils.stub_server import StubAPIServer
+    try:
+        reply = "Streamed lesson content arriving in several chunks"
+        with StubAPIServer(reply_text=reply) as server, tempfile.TemporaryDirectory() as output_dir:
+            with ContentGenerator(api_key='test', base_url=server.base_url, output_dir=output_dir,
+                                  cache_path=None) as generator:
+                content = generator.generate_from_topic("Test Topic", stream=True)
+            files = os.listdir(output_dir)
+            with open(os.path.join(output_dir, "lesson_Test_Topic.md"), encoding='utf-8') as file:
+                saved = file.read()
+        
+        if content == reply and saved == reply and files == ["lesson_Test_Topic.md"]:
+            print("OK")
+            return True
+        print(f"FAILED: {content!r}, {files}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_prompt_prefix():
+    """Test that static prompt sections form a shared, cacheable system prefix"""
+    print("Testing prompt prefix caching... ", end="")
+    from content_generator.generators.prompt_generator import generate_prompt_parts, build_topic_item
+    from content_generator.utils.stub_server import StubAPIServer
+    try:
+        first_system, first_user = generate_prompt_parts(build_topic_item("First Topic"), include_examples=False)
+        second_system, second_user = generate_prompt_parts(build_topic_item("Second Topic"), include_examples=False)
+        
+        with StubAPIServer() as server:
+            with ContentGenerator(api_key='test', base_url=server.base_url, cache_path=None) as generator:
+                generator.generate_from_topic("First Topic", save=False)
+            system = server.last_request['system']
+        
+        if (first_system == second_system and "First Topic" in first_user and "First Topic" not in first_system
+                and system[-1]['cache_control'] == {'type': 'ephemeral'}):
+            print("OK")
+            return True
+        print(f"FAILED: {system}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_example_cache():
+    """Test that cached example content is invalidated when the file changes"""
+    print("Testing example cache... ", end="")
+    try:
+        with tempfile.TemporaryDirectory() as example_dir:
+            path = os.path.join(example_dir, 'example.md')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("first version")
+            first = extract_example_content(file_path=path)
+            again = extract_example_content(file_path=path)
+            
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("second, longer version")
+            second = extract_example_content(file_path=path)
+        
+        if first == "first version" and again is first and second == "second, longer version":
+            print("OK")
+            return True
+        print(f"FAILED: {first!r}, {second!r}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_exemplar_index():
+    """Test incremental exemplar indexing of a docx and a text file, and passage search"""
+    print("Testing exemplar index... ", end="")
+    import zipfile
+    from content_generator.extractors.exemplar_index import ExemplarIndex
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            exemplars = os.path.join(root, 'Exemplars')
+            os.makedirs(exemplars)
+            
+            # A minimal Word document: just the main document part
+            document = (
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+                '<w:p><w:r><w:t>Instructor guide for the SQL bootcamp</w:t></w:r></w:p>'
+                '</w:body></w:document>'
+            )
+            with zipfile.ZipFile(os.path.join(exemplars, '📋 Guide [SQL].docx'), 'w') as archive:
+                archive.writestr('word/document.xml', document)
+            with open(os.path.join(exemplars, 'notes.txt'), 'w', encoding='utf-8') as file:
+                file.write("Marketing campaign planning notes")
+            
+            with ExemplarIndex(os.path.join(root, 'index.sqlite3')) as index:
+                first = index.build(exemplars)
+                second = index.build(exemplars)
+                results = index.search("SQL bootcamp")
+        
+        if (first['added'] == 2 and second['unchanged'] == 2 and results
+                and results[0]['path'] == '📋 Guide [SQL].docx'):
+            print("OK")
+            return True
+        print(f"FAILED: {first}, {second}, {results}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_extraction_pipeline():
+    """Test parallel extraction, including documents read straight out of a zip bundle"""
+    print("Testing extraction pipeline... ", end="")
+    import zipfile
+    from content_generator.extractors.extraction_pipeline import make_tasks, run_pipeline
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            bundle = os.path.join(root, 'Lesson Artifacts.zip')
+            with zipfile.ZipFile(bundle, 'w') as archive:
+                archive.writestr('📋 data.csv', "city,aqi\nLondon,42\n")
+                archive.writestr('__MACOSX/._📋 data.csv', "resource fork")
+            notes = os.path.join(root, 'notes.txt')
+            with open(notes, 'w', encoding='utf-8') as file:
+                file.write("Plain notes")
+            
+            tasks = make_tasks(bundle, 'Lesson Artifacts.zip') + make_tasks(notes, 'notes.txt')
+            results = {result['name']: result for result in run_pipeline(tasks, max_workers=2)}
+        
+        member = results.get('Lesson Artifacts.zip!📋 data.csv')
+        if (len(results) == 2 and member and member['text'] == "city\taqi\nLondon\t42"
+                and results['notes.txt']['text'] == "Plain notes"):
+            print("OK")
+            return True
+        print(f"FAILED: {results}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_exemplar_retrieval():
+    """Test that retrieval ranks passages by relevance and packs them into the token budget"""
+    print("Testing exemplar retrieval... ", end="")
+    from content_generator.extractors.exemplar_retriever import ExemplarRetriever
+    from content_generator.utils.token_utils import estimate_tokens
+    try:
+        join_text = "SQL joins combine rows from two tables. An inner join keeps matching rows."
+        passages = [
+            {'path': 'sql.docx', 'text': join_text},
+            {'path': 'copy/sql.docx', 'text': join_text},
+            {'path': 'python.docx', 'text': "Python lists and loops for data cleaning."},
+            {'path': 'joins.pptx', 'text': "Outer join examples with SQL. " * 40},
+            {'path': 'excel.xlsx', 'text': "Pivot tables in Excel summarise sales by region."}
+        ]
+        retriever = ExemplarRetriever(passages)
+        results = retriever.retrieve("Writing SQL joins", token_budget=100)
+        paths = [result['path'] for result in results]
+        
+        # The long passage overflows the budget; the duplicate is dropped
+        if (paths == ['sql.docx']
+                and sum(estimate_tokens(result['text']) for result in results) <= 100
+                and len(retriever.retrieve("SQL", token_budget=1000)) == 2
+                and retriever.retrieve("gardening", token_budget=1000) == []):
+            print("OK")
+            return True
+        print(f"FAILED: {paths}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_prompt_budget():
+    """Test token estimation and that prompts are trimmed lowest priority first"""
+    print("Testing prompt budget... ", end="")
+    from content_generator.generators.prompt_budget import (
+        PromptSection, PRIORITY_REQUIRED, PRIORITY_LOW, fit_sections
+    )
+    from content_generator.utils.token_utils import estimate_tokens, truncate_to_tokens
+    try:
+        sections = [
+            PromptSection('instructions', "Write a lesson. " * 20, PRIORITY_REQUIRED),
+            PromptSection('example', "Example line.\n" * 200, PRIORITY_LOW),
+            PromptSection('guidance', "Think step by step. " * 30)
+        ]
+        trimmed = fit_sections(sections, max_input_tokens=300)
+        fitted = fit_sections(sections, max_input_tokens=200)
+        untouched = fit_sections(sections, max_input_tokens=10000)
+        clipped = PromptSection('example', "word " * 1000, PRIORITY_LOW, allowance=100)
+        
+        # The example goes first: trimmed, then dropped once too little of it would be left
+        if (estimate_tokens("Hello, world!") == 4
+                and truncate_to_tokens("one two three", 3) == "one two three"
+                and untouched is sections
+                and trimmed[1].tokens <= 70 and trimmed[2] is sections[2]
+                and fitted[0] is sections[0] and fitted[1] is None and fitted[2].tokens <= 120
+                and clipped.tokens <= 100):
+            print("OK")
+            return True
+        print(f"FAILED: {fitted}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_message_batch():
+    """Test submitting items as a message batch and collecting the results into files"""
+    print("Testing message batch... ", end="")
+    from content_generator import ContentGenerator
+    from content_generator.utils.stub_server import StubAPIServer
+    import json
+    
+    def reply(body):
+        # The third item is cut off at max_tokens
+        return ("Batch cut", 'max_tokens') if 'Third Topic' in body['messages'][0]['content'] else "Batch content"
+    
+    try:
+        with StubAPIServer(reply, batch_pending_polls=1) as server, \
+                tempfile.TemporaryDirectory() as output_dir:
+            generator = ContentGenerator(
+                api_key='test', base_url=server.base_url, output_dir=output_dir,
+                cache_path=os.path.join(output_dir, 'cache', 'responses.sqlite3')
+            )
+            generator.metadata = {
+                'lessons': [{'topic': 'First Topic', 'file_type': 'lesson'}],
+                'labs': [{'topic': 'Second Topic', 'file_type': 'lab'}, {'topic': 'Third Topic', 'file_type': 'lab'}]
+            }
+            manifest_path = os.path.join(output_dir, 'manifest.json')
+            batch_id = generator.submit_batch(manifest_path=manifest_path)
+            pending = generator.collect_batch(manifest_path)
+            results = generator.collect_batch(manifest_path)
+            with open(manifest_path, encoding='utf-8') as file:
+                cache_keys = [entry['cache_key'] for entry in json.load(file)['requests'].values()]
+            cached = [generator.cache.get(key) for key in cache_keys]
+            generator.close()
+            
+            # Files use the same names as generate_from_metadata; the truncated item is not saved
+            expected = {'lesson_First_Topic.md', 'lab_Second_Topic.md'}
+            saved = {name for name in os.listdir(output_dir) if name.endswith('.md')}
+            requests = server.batches[batch_id]['requests']
+        
+        if (pending is None and len(results) == 3 and saved == expected
+                and [result['content'] for result in results] == ["Batch content", "Batch content", None]
+                and 'max_tokens' in (results[2]['error'] or '')
+                and cached == ["Batch content", "Batch content", None]
+                and len(requests) == 3 and 'system' in requests[0]['params']):
+            print("OK")
+            return True
+        print(f"FAILED: {saved}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_cli_smoke():
+    """Test that the command-line interface runs end to end in a fresh process"""
+    print("Testing CLI smoke run... ", end="")
+    import json
+    import subprocess
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            metadata_path = os.path.join(work_dir, 'metadata.json')
+            with open(metadata_path, 'w', encoding='utf-8') as file:
+                json.dump({'lessons': [{'topic': 'Smoke Topic', 'file_type': 'lesson'}]}, file)
+            result = subprocess.run(
+                [sys.executable, '-m', 'content_generator.cli', '--metadata', metadata_path, '--list-categories'],
+                capture_output=True, text=True,
+                cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+            )
+        
+        if result.returncode == 0 and '1. lessons' in result.stdout:
+            print("OK")
+            return True
+        print(f"FAILED: exit code {result.returncode}: {result.stderr.strip().splitlines()[-1:]}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_metadata_store():
+    """Test lazy JSONL metadata loading through the offset index"""
+    print("Testing metadata store... ", end="")
+    from content_generator import ContentGenerator
+    from content_generator.extractors.metadata_store import MetadataStore, MetadataRecord, write_jsonl
+    from content_generator.extractors.metadata_extractor import (
+        get_categories, get_item_by_index, get_item_names, get_learning_objectives
+    )
+    try:
+        metadata = {
+            'lessons': [{'topic': f"Lesson {i}", 'file_type': 'lesson', 'learning_objectives': ["Learn"]} for i in range(3)],
+            'courses': [{'course_title': "Course", 'file_type': 'course_landing', 'price': 10}]
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'metadata.jsonl')
+            index_dir = os.path.join(temp_dir, 'index')
+            write_jsonl(metadata, path)
+            
+            with MetadataStore(path, index_dir) as store:
+                categories = get_categories(store)
+                item = get_item_by_index(store, 'lessons', 2)
+                course = get_item_by_index(store, 'courses', 0)
+                names = get_item_names(store, 'lessons')
+                missing = get_item_by_index(store, 'lessons', 3)
+            
+            # Appending an item invalidates the index
+            with open(path, 'a', encoding='utf-8') as file:
+                file.write('{"category": "lessons", "topic": "Lesson 3"}\n')
+            with MetadataStore(path, index_dir) as store:
+                appended = [item['topic'] for item in store['lessons']]
+            
+            # Closing a generator closes its metadata store
+            generator = ContentGenerator(api_key='test', cache_path=None)
+            generator.metadata = MetadataStore(path, index_dir)
+            generator.close()
+            closed = generator.metadata._file.closed
+        
+        if (categories == ['lessons', 'courses'] and isinstance(item, MetadataRecord)
+                and item['topic'] == "Lesson 2" and get_learning_objectives(item) == ("Learn",)
+                and 'category' not in item and course.get('price') == 10
+                and names == ["Lesson 0", "Lesson 1", "Lesson 2"] and missing is None
+                and appended[-1] == "Lesson 3" and len(appended) == 4 and closed):
+            print("OK")
+            return True
+        print(f"FAILED: {categories} {item!r} {names} {appended} closed={closed}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_incremental_build():
+    """Test that batch runs skip outputs whose inputs are unchanged"""
+    print("Testing incremental build... ", end="")
+    from content_generator import ContentGenerator
+    from content_generator.utils.stub_server import StubAPIServer
+    try:
+        with StubAPIServer() as server, tempfile.TemporaryDirectory() as output_dir:
+            generator = ContentGenerator(
+                api_key='test', base_url=server.base_url, output_dir=output_dir, cache_path=None
+            )
+            generator.metadata = {
+                'lessons': [
+                    {'topic': 'First Topic', 'file_type': 'lesson', 'learning_objectives': ["One"]},
+                    {'topic': 'Second Topic', 'file_type': 'lesson', 'learning_objectives': ["Two"]},
+                    {'topic': 'Third Topic', 'file_type': 'lesson', 'learning_objectives': ["Three"]}
+                ]
+            }
+            first = generator.generate_batch(include_examples=False)
+            second = generator.generate_batch(include_examples=False)
+            
+            # Edit one item's objectives and delete another's output
+            generator.metadata['lessons'][0] = dict(generator.metadata['lessons'][0], learning_objectives=["Edited"])
+            os.remove(os.path.join(output_dir, 'lesson_Second_Topic.md'))
+            statuses = [entry['status'] for entry in generator.plan_build(include_examples=False)]
+            third = generator.generate_batch(include_examples=False)
+            forced = generator.generate_batch(include_examples=False, force=True)
+            
+            # Switching to sectioned output makes every file out of date
+            generator.sections = 'always'
+            sectioned = [entry['status'] for entry in generator.plan_build(include_examples=False)]
+            generator.sections = 'auto'
+            generator.close()
+            
+            # A dry run against a clean output directory creates nothing
+            clean_dir = os.path.join(output_dir, 'clean')
+            dry_run = ContentGenerator(api_key='test', output_dir=clean_dir, cache_path=None)
+            dry_run.metadata = generator.metadata
+            clean = [entry['status'] for entry in dry_run.plan_build(include_examples=False)]
+            created = os.path.exists(clean_dir)
+        
+        if (len(first) == 3 and second == [] and statuses == ['changed', 'missing', 'up to date']
+                and clean == ['new'] * 3 and not created and sectioned == ['changed'] * 3
+                and sorted(result['name'] for result in third) == ['First Topic', 'Second Topic']
+                and len(forced) == 3):
+            print("OK")
+            return True
+        print(f"FAILED: {statuses} {sectioned} {len(second)} {len(third)}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_request_telemetry():
+    """Test that every generation emits a metrics record and the Prometheus export aggregates them"""
+    print("Testing request telemetry... ", end="")
+    from content_generator import ContentGenerator
+    from content_generator.utils.stub_server import StubAPIServer
+    from content_generator.utils.telemetry import Telemetry, PrometheusTextfileExporter
+    try:
+        with StubAPIServer() as server, tempfile.TemporaryDirectory() as output_dir:
+            records = []
+            metrics_path = os.path.join(output_dir, 'metrics.prom')
+            telemetry = Telemetry([records.append, PrometheusTextfileExporter(metrics_path)])
+            generator = ContentGenerator(
+                api_key='test', base_url=server.base_url, output_dir=output_dir, cache_path=None,
+                telemetry=telemetry
+            )
+            generator.metadata = {
+                'lessons': [{'topic': 'Telemetry Topic', 'file_type': 'lesson', 'learning_objectives': ["One"]}]
+            }
+            generator.generate_from_metadata('lessons', 0, include_examples=False)
+            generator.generate_batch(include_examples=False, stream=True, force=True)
+            generator.close()
+            with open(metrics_path, encoding='utf-8') as file:
+                exported = file.read()
+        
+        plain, streamed = records
+        complete = all(
+            record['category'] == 'lessons' and record['file_type'] == 'lesson' and record['error'] is None
+            and record['stop_reason'] == 'end_turn' and record['retries'] == 0 and record['output_tokens'] > 0
+            and record['api_seconds'] > 0 and record['prompt_build_seconds'] is not None
+            and record['write_seconds'] is not None and record['total_seconds'] >= record['api_seconds']
+            for record in records
+        )
+        histogram = ('content_generator_request_duration_seconds_count'
+                     '{phase="api",file_type="lesson",category="lessons"} 2')
+        if (complete and plain['ttft_seconds'] is None and streamed['ttft_seconds'] is not None
+                and histogram in exported and 'reason="end_turn"} 2' in exported):
+            print("OK")
+            return True
+        print(f"FAILED: {records}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_retry_policy():
+    """Test retries of transient errors, permanent failures, deadlines and hedging"""
+    print("Testing retry policy... ", end="")
+    from content_generator.utils.api_utils import create_client, generate_content_with_claude
+    from content_generator.utils.retry_utils import RetryPolicy, GenerationError, DeadlineExceededError
+    from content_generator.utils.stub_server import StubAPIServer
+    
+    def attempt_generation(server, policy, metrics=None):
+        client = create_client('test', base_url=server.base_url)
+        try:
+            return generate_content_with_claude("Prompt", client=client, retry=policy, on_metrics=metrics)
+        except GenerationError as e:
+            return e
+        finally:
+            client.close()
+    
+    try:
+        # Overloaded and rate limited, then success
+        metrics = {}
+        with StubAPIServer(failures=[(529, 0), 429]) as server:
+            retried = attempt_generation(server, RetryPolicy(base_delay=0.01), metrics.update)
+            retried_requests = server.request_count
+        
+        # Bad requests are not retried, and failures are not saved as content
+        with StubAPIServer(failures=[400]) as server, tempfile.TemporaryDirectory() as output_dir:
+            permanent = attempt_generation(server, RetryPolicy(base_delay=0.01))
+            permanent_requests = server.request_count
+            generator = ContentGenerator(
+                api_key='test', base_url=server.base_url, output_dir=output_dir, cache_path=None
+            )
+            generator.metadata = {'lessons': [{'topic': 'Failing Topic', 'file_type': 'lesson'}]}
+            server.failures = [400]
+            try:
+                generator.generate_from_metadata('lessons', 0, include_examples=False)
+                raised = False
+            except GenerationError:
+                raised = True
+            generator.close()
+            saved = os.listdir(output_dir)
+        
+        # A retry-after longer than the deadline gives up at once
+        with StubAPIServer(failures=[(529, 30)]) as server:
+            started = time.perf_counter()
+            expired = attempt_generation(server, RetryPolicy(deadline=2))
+            expired_seconds = time.perf_counter() - started
+        
+        # A request slower than the learned p95 is hedged, and the fast duplicate wins
+        hedge_metrics = {}
+        with StubAPIServer(delays=[2.0]) as server:
+            policy = RetryPolicy(hedge=True, hedge_min_samples=1)
+            policy.latencies.record(0.05)
+            started = time.perf_counter()
+            hedged = attempt_generation(server, policy, hedge_metrics.update)
+            hedged_seconds = time.perf_counter() - started
+        
+        # A hedge gets only the time left before the deadline, and none is sent once it has passed
+        def slow_attempt(timeout):
+            timeouts.append(timeout)
+            time.sleep(0.3 if len(timeouts) == 1 else 0)
+            return "Slow content"
+        timeouts = []
+        policy = RetryPolicy(deadline=0.6, hedge=True, hedge_min_samples=1)
+        policy.latencies.record(0.2)
+        policy.run(slow_attempt, hedgeable=True)
+        bounded = len(timeouts) == 2 and timeouts[1] <= 0.6 - 0.2 + 0.02
+        timeouts = []
+        late_stats = {}
+        policy = RetryPolicy(deadline=0.1, hedge=True, hedge_min_samples=1)
+        policy.latencies.record(0.2)
+        policy.run(slow_attempt, hedgeable=True, stats=late_stats)
+        bounded = bounded and len(timeouts) == 1 and late_stats['hedged'] == 0
+        
+        if (retried == "Stub content" and retried_requests == 3 and metrics['retries'] == 2
+                and isinstance(permanent, GenerationError) and not permanent.transient and permanent_requests == 1
+                and raised and not any(name.endswith('.md') for name in saved)
+                and isinstance(expired, DeadlineExceededError) and expired_seconds < 1.5
+                and hedged == "Stub content" and hedge_metrics['hedged'] == 1 and hedged_seconds < 1.5
+                and bounded):
+            print("OK")
+            return True
+        print(f"FAILED: {retried!r} {permanent!r} {expired!r} {hedged!r} {hedged_seconds:.2f}s {timeouts}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+# Cold import budget for the listing commands; loading the SDK alone takes over a second
+STARTUP_IMPORT_BUDGET = 0.25
+
+def test_cli_startup():
+    """Test that the listing commands start fast and never load the SDK"""
+    print("Testing CLI startup time... ", end="")
+    import json
+    import subprocess
+    script = (
+        "import sys, time\n"
+        "metadata_path = sys.argv[1]\n"
+        "started = time.perf_counter()\n"
+        "import content_generator.cli as cli\n"
+        "seconds = time.perf_counter() - started\n"
+        "for command in (['--list-categories'], ['--list-items', 'lessons']):\n"
+        "    sys.argv = ['cli', '--metadata', metadata_path] + command\n"
+        "    cli.main()\n"
+        "heavy = [name for name in ('anthropic', 'dotenv', 'httpx', 'httpx2') if name in sys.modules]\n"
+        "print('STARTUP', seconds, ','.join(heavy))\n"
+    )
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            metadata_path = os.path.join(work_dir, 'metadata.json')
+            with open(metadata_path, 'w', encoding='utf-8') as file:
+                json.dump({'lessons': [{'topic': 'Startup Topic', 'file_type': 'lesson'}]}, file)
+            
+            # Best of three cold starts, to ride out scheduling noise
+            timings = []
+            for _ in range(3):
+                output = subprocess.run(
+                    [sys.executable, '-c', script, metadata_path], capture_output=True, text=True, check=True,
+                    cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+                ).stdout
+                _, seconds, heavy = output.splitlines()[-1].split(' ', 2)
+                timings.append(float(seconds))
+        
+        if '0. Startup Topic' in output and not heavy.strip() and min(timings) < STARTUP_IMPORT_BUDGET:
+            print("OK")
+            return True
+        print(f"FAILED: import took {min(timings):.3f}s, loaded {heavy.strip() or 'nothing heavy'}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_generation_server():
+    """Test the job API: concurrent jobs, streamed progress and job status"""
+    print("Testing generation server... ", end="")
+    import json
+    import threading
+    import urllib.error
+    import urllib.request
+    from content_generator.serve import create_server
+    from content_generator.utils.stub_server import StubAPIServer
+    
+    def call(url, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8')
+    
+    try:
+        with StubAPIServer() as stub, tempfile.TemporaryDirectory() as output_dir:
+            generator = ContentGenerator(
+                api_key='test', base_url=stub.base_url, output_dir=output_dir, cache_path=None
+            )
+            generator.metadata = {
+                'lessons': [{'topic': f"Served Topic {i}", 'file_type': 'lesson'} for i in range(3)]
+            }
+            server = create_server(generator, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                _, category_job = call(f"{server.url}/jobs", {'category': 'lessons', 'include_examples': False})
+                _, topic_job = call(f"{server.url}/jobs", {'topic': 'On Demand', 'save': False})
+                bad_status, _ = call(f"{server.url}/jobs", {'category': 'missing'})
+                
+                category_id = json.loads(category_job)['id']
+                _, events = call(f"{server.url}/jobs/{category_id}/events")
+                events = [json.loads(line) for line in events.splitlines()]
+                _, category_status = call(f"{server.url}/jobs/{category_id}")
+                topic_id = json.loads(topic_job)['id']
+                call(f"{server.url}/jobs/{topic_id}/events")
+                _, topic_status = call(f"{server.url}/jobs/{topic_id}")
+            finally:
+                server.shutdown()
+                server.server_close()
+                generator.close()
+            saved = sorted(name for name in os.listdir(output_dir) if name.endswith('.md'))
+        
+        category_status = json.loads(category_status)
+        topic_status = json.loads(topic_status)
+        types = [event['type'] for event in events]
+        if (bad_status == 400 and types[:2] == ['queued', 'started'] and types.count('item') == 3
+                and types[-1] == 'finished' and category_status['status'] == 'done'
+                and category_status['completed'] == 3 and len(saved) == 3
+                and topic_status['status'] == 'done' and topic_status['results'][0]['content'] == "Stub content"):
+            print("OK")
+            return True
+        print(f"FAILED: {types} {category_status['status']} {topic_status['status']} {saved}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_job_queue():
+    """Test that a queued run resumes after its worker dies, without regenerating finished items"""
+    print("Testing job queue... ", end="")
+    import socket
+    from content_generator import ContentGenerator
+    from content_generator.utils.job_queue import JobQueue
+    from content_generator.utils.stub_server import StubAPIServer
+    try:
+        with StubAPIServer() as server, tempfile.TemporaryDirectory() as work_dir:
+            output_dir = os.path.join(work_dir, 'output')
+            generator = ContentGenerator(
+                api_key='test', base_url=server.base_url, output_dir=output_dir, cache_path=None
+            )
+            generator.metadata = {
+                'lessons': [{'topic': f"Topic {i}", 'file_type': 'lesson'} for i in range(4)]
+            }
+            with JobQueue(os.path.join(work_dir, 'queue.sqlite3')) as queue:
+                run_id = generator.enqueue_batch(queue, include_examples=False)
+                
+                # A worker that finished one item and died holding another
+                worker_id = queue.worker_id
+                queue.worker_id = f"{socket.gethostname()}:999999:dead"
+                queue.complete(run_id, queue.claim(run_id)['seq'])
+                queue.claim(run_id)
+                queue.worker_id = worker_id
+                
+                results = generator.run_queue(queue, run_id, max_workers=2)
+                counts = queue.counts(run_id)
+                
+                # An item renamed since it was queued fails, and can be retried
+                rerun = generator.enqueue_batch(queue, include_examples=False, force=True)
+                generator.metadata['lessons'][3] = {'topic': "Renamed", 'file_type': 'lesson'}
+                generator.run_queue(queue, rerun)
+                failed = queue.counts(rerun)['failed']
+                
+                # A run left with only failures is not resumed unless failures are retried
+                resumable = (queue.latest_unfinished_run(), queue.latest_unfinished_run(include_failed=True))
+                requeued = queue.retry_failed(rerun)
+                generator.metadata['lessons'][3] = {'topic': "Topic 3", 'file_type': 'lesson'}
+                generator.run_queue(queue, rerun)
+                rerun_counts = queue.counts(rerun)
+            generator.close()
+        
+        if (len(results) == 3 and counts['done'] == 4 and failed == 1 and requeued == 1
+                and resumable == (None, rerun) and rerun_counts['done'] == 4 and server.request_count == 3 + 3 + 1):
+            print("OK")
+            return True
+        print(f"FAILED: {len(results)} results, {counts}, {rerun_counts}, {server.request_count} requests")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_request_coalescing():
+    """Test that concurrent identical requests share one API call, including its failure"""
+    print("Testing request coalescing... ", end="")
+    from content_generator import ContentGenerator
+    from content_generator.utils.retry_utils import GenerationError
+    from content_generator.utils.stub_server import StubAPIServer
+    
+    def run_together(generator, calls):
+        barrier = threading.Barrier(len(calls))
+        outcomes = [None] * len(calls)
+        def run(position, call):
+            barrier.wait()
+            try:
+                outcomes[position] = call()
+            except GenerationError as e:
+                outcomes[position] = e
+        threads = [threading.Thread(target=run, args=item) for item in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+    
+    try:
+        with StubAPIServer("Shared lesson", delays=[0.5]) as server, tempfile.TemporaryDirectory() as output_dir:
+            with ContentGenerator(api_key='test', base_url=server.base_url, output_dir=output_dir,
+                                  cache_path=None) as generator:
+                same = lambda: generator.generate_from_topic("Same Topic", save=False)
+                streamed = lambda: generator.generate_from_topic("Same Topic", stream=True)
+                contents = run_together(generator, [same, same, same, streamed])
+                stats = generator.coalescing_stats()
+                with open(os.path.join(output_dir, 'lesson_Same_Topic.md'), encoding='utf-8') as file:
+                    saved = file.read()
+            shared_requests = server.request_count
+        
+        with StubAPIServer(failures=[400], delays=[0.5]) as server:
+            with ContentGenerator(api_key='test', base_url=server.base_url, cache_path=None) as generator:
+                failures = run_together(generator, [lambda: generator.generate_from_topic("Bad", save=False)] * 3)
+            failed_requests = server.request_count
+        
+        if (contents == ["Shared lesson"] * 4 and saved == "Shared lesson" and shared_requests == 1
+                and stats['coalesced'] == 3 and stats['in_flight'] == 0
+                and all(isinstance(error, GenerationError) for error in failures) and failed_requests == 1):
+            print("OK")
+            return True
+        print(f"FAILED: {contents} {stats} {shared_requests} requests, {failures} {failed_requests} requests")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_sectioned_generation():
+    """Test that long items are generated as an outline plus concurrent sections, joined in order"""
+    print("Testing sectioned generation... ", end="")
+    import json
+    import re
+    from content_generator import ContentGenerator
+    from content_generator.generators.section_generator import parse_outline
+    from content_generator.utils.stub_server import StubAPIServer
+    
+    outline = [{'title': f"Part {number}", 'summary': "", 'words': 1000} for number in range(1, 4)]
+    def reply(body):
+        instruction = body['messages'][-1]['content']
+        if "outline" in instruction and "Write only" not in instruction:
+            return "Here is the plan:\n" + json.dumps(outline)
+        section = re.search(r"Write only section (\d+)", instruction)
+        return f"## Part {section.group(1)}\n\nBody\n" if section else "Short lab"
+    
+    try:
+        # Three sections of 0.4s each should take about as long as one
+        with StubAPIServer(reply, delays=[0, 0.4, 0.4, 0.4]) as server, tempfile.TemporaryDirectory() as output_dir:
+            with ContentGenerator(api_key='test', base_url=server.base_url, output_dir=output_dir,
+                                  cache_path=None) as generator:
+                generator.metadata = {'labs': [
+                    {'topic': "Long Lab", 'file_type': 'lab', 'content_metrics': {'word_count': 3000}},
+                    {'topic': "Short Lab", 'file_type': 'lab', 'content_metrics': {'word_count': 500}}
+                ]}
+                started = time.perf_counter()
+                content = generator.generate_from_metadata('labs', 0, include_examples=False, save=False)
+                elapsed = time.perf_counter() - started
+                system_blocks = len(server.last_request['system'])
+                
+                streamed = generator.generate_from_metadata('labs', 0, include_examples=False, stream=True)
+                with open(os.path.join(output_dir, 'lab_Long_Lab.md'), encoding='utf-8') as file:
+                    saved = file.read()
+                
+                before = server.request_count
+                generator.generate_from_metadata('labs', 1, include_examples=False, save=False)
+                short_requests = server.request_count - before
+        
+        fallback = [section['title'] for section in parse_outline("# Plan\n1. Setup\n2. Build\n- Deploy")]
+        expected = "## Part 1\n\nBody\n\n## Part 2\n\nBody\n\n## Part 3\n\nBody"
+        if (content == expected and streamed == expected and saved == expected and elapsed < 1.0
+                and system_blocks == 2 and short_requests == 1 and fallback == ["Plan", "Setup", "Build", "Deploy"]):
+            print("OK")
+            return True
+        print(f"FAILED: {content!r} {saved!r} {elapsed:.2f}s {system_blocks} blocks {short_requests} requests {fallback}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_continuation():
+    """Test that truncated and interrupted responses are resumed from the partial text"""
+    print("Testing continuation... ", end="")
+    from content_generator import ContentGenerator
+    from content_generator.utils.stub_server import StubAPIServer
+    from content_generator.utils.telemetry import Telemetry
+    from content_generator.utils.api_utils import create_client, generate_content_with_claude
+    from content_generator.utils.cache_utils import ResponseCache
+    from content_generator.utils.retry_utils import TruncatedResponseError
+    
+    full = "# Lesson\n\nFirst paragraph of the lesson.\n\n" + "More text. " * 12
+    def resume(body):
+        # Continue from the reply prefix, as the model would
+        messages = body['messages']
+        if messages[-1]['role'] == 'assistant':
+            return full[len(messages[-1]['content']):]
+        return full
+    def reply(body):
+        # Cut the first request off at max_tokens
+        if body['messages'][-1]['role'] == 'assistant':
+            return resume(body), 'end_turn'
+        return full[:30], 'max_tokens'
+    
+    try:
+        records = []
+        with StubAPIServer(reply) as server, tempfile.TemporaryDirectory() as output_dir:
+            with ContentGenerator(api_key='test', base_url=server.base_url, output_dir=output_dir, cache_path=None,
+                                  telemetry=Telemetry([records.append])) as generator:
+                truncated = generator.generate_from_topic("Resume", save=False)
+                prefix = server.last_request['messages'][-1]
+                
+                # A stream that drops half way is continued, not restarted
+                server.reply_text = resume
+                server.failures = ['drop']
+                streamed = generator.generate_from_topic("Resume", stream=True)
+                with open(os.path.join(output_dir, 'lesson_Resume.md'), encoding='utf-8') as file:
+                    saved = file.read()
+                
+                # Continuations stop at the cap and the response fails instead of being kept
+                server.reply_text = lambda body: ("Still going", 'max_tokens')
+                generator.max_continuations = 2
+                before = server.request_count
+                try:
+                    generator.generate_from_topic("Capped")
+                    capped = None
+                except TruncatedResponseError as e:
+                    capped = e
+                capped_requests = server.request_count - before
+                capped_saved = os.path.exists(os.path.join(output_dir, 'lesson_Capped.md'))
+                
+                # The truncated text is not cached
+                cache = ResponseCache(os.path.join(output_dir, 'responses.sqlite3'))
+                try:
+                    generate_content_with_claude("Capped", client=create_client('test', base_url=server.base_url),
+                                                 cache=cache, max_continuations=0)
+                except TruncatedResponseError:
+                    pass
+                cached = cache.stats()['entries']
+                cache.close()
+        
+        if (truncated == full and prefix == {'role': 'assistant', 'content': full[:30].rstrip()}
+                and records[0]['continuations'] == 1 and streamed == full and saved == full
+                and records[1]['continuations'] == 1 and capped_requests == 3
+                and records[2]['stop_reason'] == 'max_tokens' and records[2]['error']
+                and capped is not None and capped.stop_reason == 'max_tokens'
+                and capped.content.startswith("Still going") and not capped_saved and cached == 0):
+            print("OK")
+            return True
+        print(f"FAILED: {truncated!r} {streamed!r} {saved!r} {capped_requests} requests {capped!r} {cached} cached")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_prompt_export():
+    """Test that compiled templates match section-by-section assembly and prompts export to JSON Lines"""
+    print("Testing prompt export... ", end="")
+    import contextlib
+    import io
+    import json
+    from content_generator import ContentGenerator
+    from content_generator.generators.prompt_generator import (
+        get_prompt_template, generate_prompt_parts, generate_item_sections, join_sections
+    )
+    from content_generator.generators.prompt_budget import fit_sections
+    from content_generator.utils.token_utils import estimate_tokens
+    try:
+        items = [
+            {'topic': 'Closures', 'file_type': 'lesson', 'learning_objectives': ['Explain scope'],
+             'content_metrics': {'word_count': 800}},
+            {'course_title': 'Web Basics', 'file_type': 'course_landing', 'course_description': 'HTML and CSS',
+             'learning_path': ['HTML', 'CSS']},
+            {'topic': 'Long Lab', 'file_type': 'lab', 'learning_objectives': ["Practice loops " * 400]}
+        ]
+        
+        # Rendering matches building, fitting and joining every section, including when trimmed
+        matched = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            for item in items:
+                template = get_prompt_template(item['file_type'], False)
+                for budget in (None, 1000, 200):
+                    sections = template.static_sections + generate_item_sections(item)
+                    fitted = fit_sections(sections, budget) if budget else sections
+                    static = len(template.static_sections)
+                    expected = (join_sections(fitted[:static]), join_sections(fitted[static:]))
+                    matched = matched and template.render(item, max_input_tokens=budget) == expected
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            generator = ContentGenerator(api_key='test', cache_path=None)
+            generator.metadata = {'Course': items}
+            path = os.path.join(output_dir, 'prompts.jsonl')
+            count = generator.export_prompts(path, include_examples=False)
+            with open(path, encoding='utf-8') as file:
+                lines = [json.loads(line) for line in file]
+            single = generator.export_prompts(path, include_examples=False, items=[('Course', 1)])
+            leftovers = [name for name in os.listdir(output_dir) if name != 'prompts.jsonl']
+        
+        parts = [generate_prompt_parts(item, False) for item in items]
+        if (matched and count == 3 and single == 1 and not leftovers
+                and [(line['system'], line['prompt']) for line in lines] == parts
+                and [line['index'] for line in lines] == [0, 1, 2]
+                and lines[1]['filename'] == generator.get_output_filename(items[1])
+                and lines[0]['input_tokens'] == estimate_tokens(parts[0][0]) + estimate_tokens(parts[0][1])):
+            print("OK")
+            return True
+        print(f"FAILED: matched={matched}, {count} prompts, {lines[:1]}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_output_writer():
+    """Test background writes, fsync batches, archive output and rate-limited save messages"""
+    print("Testing output writer... ", end="")
+    import contextlib
+    import io
+    import tarfile
+    import zipfile
+    from content_generator import ContentGenerator
+    from content_generator.utils.output_writer import OutputWriter, RateLimitedLog
+    from content_generator.utils.stub_server import StubAPIServer
+    try:
+        with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()) as output:
+            # Writes go through a small queue; a bad path fails on its own without stopping the writer
+            saved = []
+            writer = OutputWriter(os.path.join(work_dir, 'out'), fsync='always', queue_size=2, log_interval=60)
+            for number in range(20):
+                writer.submit(f"File {number}", f"part/{number}.md", lambda path, error: saved.append((path, error)))
+            writer.submit("x", "part/0.md/child.md", lambda path, error: saved.append((path, error)))
+            writer.submit("Last", "last.md")
+            writer.flush()
+            written = sorted(os.listdir(os.path.join(work_dir, 'out', 'part')))
+            with open(os.path.join(work_dir, 'out', 'part', '7.md'), encoding='utf-8') as file:
+                seventh = file.read()
+            writer.close()
+            counts = (writer.saved, writer.failed)
+            
+            # A batch saved into an archive, and an aborted archive that leaves nothing behind
+            archive_path = os.path.join(work_dir, 'catalog.zip')
+            with StubAPIServer("Archived") as server:
+                with ContentGenerator(api_key='test', base_url=server.base_url, cache_path=None,
+                                      output_dir=os.path.join(work_dir, 'unused'), archive_path=archive_path) as generator:
+                    generator.metadata = {'lessons': [{'topic': f"Topic {i}", 'file_type': 'lesson'} for i in range(3)]}
+                    results = generator.generate_batch(include_examples=False)
+            with zipfile.ZipFile(archive_path) as archive:
+                members = {name: archive.read(name).decode('utf-8') for name in archive.namelist()}
+            aborted = OutputWriter(work_dir, os.path.join(work_dir, 'aborted.tar.gz'))
+            aborted.submit("Gone", "gone.md")
+            aborted.close(abort=True)
+            tar_path = os.path.join(work_dir, 'catalog.tar.gz')
+            tar_writer = OutputWriter(work_dir, tar_path)
+            tar_writer.submit("Packed", "lesson_Packed.md")
+            tar_writer.close()
+            with tarfile.open(tar_path) as archive:
+                packed = archive.extractfile('lesson_Packed.md').read().decode('utf-8')
+            leftovers = [name for name in os.listdir(work_dir) if name.startswith('.') or name.startswith('aborted')]
+            
+            log = RateLimitedLog(interval=60)
+            for number in range(5):
+                log.log(f"Message {number}")
+            log.flush()
+        lines = output.getvalue().splitlines()
+        
+        if (written == sorted(f"{number}.md" for number in range(20)) and seventh == "File 7"
+                and counts == (21, 1) and len(saved) == 21 and sum(1 for path, error in saved if error) == 1
+                and all(result['error'] is None for result in results) and not os.path.exists(os.path.join(work_dir, 'unused'))
+                and members == {f"lesson_Topic_{i}.md": "Archived" for i in range(3)}
+                and packed == "Packed" and not leftovers
+                and "Message 0" in lines and "Message 4 (+3 more)" in lines and "Message 2" not in lines):
+            print("OK")
+            return True
+        print(f"FAILED: {written}, {counts}, {members}, {leftovers}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_reference_images():
+    """Test that matching exemplar art is cached and attached to course landing page requests"""
+    print("Testing reference images... ", end="")
+    import base64
+    import contextlib
+    import io
+    import json
+    import struct
+    import zlib
+    from content_generator import ContentGenerator
+    from content_generator.extractors import image_extractor
+    from content_generator.utils.cache_utils import ResponseCache
+    from content_generator.utils.stub_server import StubAPIServer
+    
+    def make_png(width, height):
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        rows = b''.join(b'\x00' + b'\x80\x40\x20' * width for _ in range(height))
+        header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+        return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+    
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            exemplars_dir = os.path.join(root, 'Exemplars')
+            cache_dir = os.path.join(root, 'images')
+            for folder, width in (('Coding Bootcamp', 40), ('SQL Bootcamp', 30)):
+                os.makedirs(os.path.join(exemplars_dir, folder))
+                with open(os.path.join(exemplars_dir, folder, 'Landing Page Art.png'), 'wb') as file:
+                    file.write(make_png(width, 20))
+                with open(os.path.join(exemplars_dir, folder, 'Notes.png'), 'wb') as file:
+                    file.write(make_png(10, 10))
+            item = {'course_title': 'SQL Fundamentals', 'file_type': 'course_landing',
+                    'course_description': 'Query databases'}
+            
+            # The folder named like the course ranks first; files not matching the pattern are ignored
+            image_extractor.clear_image_caches()
+            selected = image_extractor.select_reference_images(item, exemplars_dir, limit=2)
+            images = image_extractor.get_reference_images(item, exemplars_dir, limit=1, cache_dir=cache_dir)
+            
+            # A second process reads the encoded image from the disk cache
+            cache_files = os.listdir(cache_dir)
+            with open(os.path.join(cache_dir, cache_files[0]), 'r+', encoding='utf-8') as file:
+                cached = dict(json.load(file), tokens=999)
+                file.seek(0)
+                file.truncate()
+                json.dump(cached, file)
+            image_extractor.clear_image_caches()
+            reloaded = image_extractor.get_reference_images(item, exemplars_dir, limit=1, cache_dir=cache_dir)
+            
+            output = io.StringIO()
+            with StubAPIServer("Landing page") as server, contextlib.redirect_stdout(output):
+                with ContentGenerator(api_key='test', base_url=server.base_url, cache_path=None,
+                                      reference_images=True, exemplars_dir=exemplars_dir,
+                                      image_cache_dir=None) as generator:
+                    generator.metadata = {'Courses': [item], 'Lessons': [{'topic': 'Joins', 'file_type': 'lesson'}]}
+                    content = generator.generate_from_metadata('Courses', 0, include_examples=False, save=False)
+                    landing_request = server.last_request
+                    generator.generate_from_metadata('Lessons', 0, include_examples=False, save=False)
+                    lesson_request = server.last_request
+            image_extractor.clear_image_caches()
+        
+        blocks = landing_request['messages'][0]['content']
+        with_images = ResponseCache.make_key('model', 100, 'prompt', None, images)
+        if (content == "Landing page" and [os.path.basename(os.path.dirname(path)) for path in selected]
+                == ['SQL Bootcamp', 'Coding Bootcamp']
+                and len(images) == 1 and (images[0]['width'], images[0]['height']) == (30, 20)
+                and len(cache_files) == 1 and reloaded[0]['tokens'] == 999
+                and [block['type'] for block in blocks] == ['text', 'image', 'text', 'image', 'text']
+                and 'SQL Bootcamp' in blocks[0]['text'] and 'cache_control' in blocks[3]
+                and base64.b64decode(blocks[1]['source']['data']) == make_png(30, 20)
+                and "Images: 2 attached" in output.getvalue()
+                and isinstance(lesson_request['messages'][0]['content'], str)
+                and image_extractor.estimate_image_tokens(1200, 750) == 1200
+                and image_extractor.estimate_image_tokens(3000, 3000) < 1600
+                and with_images != ResponseCache.make_key('model', 100, 'prompt')):
+            print("OK")
+            return True
+        print(f"FAILED: {selected} {images[:1]} {[block['type'] for block in blocks]}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
+def test_pipeline_benchmark():
+    """Test that the pipeline benchmark measures every stage and compares runs"""
+    print("Testing pipeline benchmark... ", end="")
+    from content_generator.benchmarks.bench_pipeline import run_benchmark, compare
+    try:
+        report = run_benchmark(sizes=[20], max_ops=10, repeat=1)
+        stages = {result['stage'] for result in report['results']}
+        baseline = {'results': [dict(result, seconds=1.0) for result in report['results']]}
+        slower = {'results': [dict(result, per_op_us=result['per_op_us'] * 10 + 1) for result in report['results']]}
+        
+        if ({'load_json', 'lookup_jsonl', 'prompt_with_examples', 'write_file'} <= stages
+                and all(result['size'] == 20 and result['peak_bytes'] > 0 for result in report['results'])
+                and compare(report, baseline) == []
+                and len(compare(slower, baseline)) == len(report['results'])):
+            print("OK")
+            return True
+        print(f"FAILED: {sorted(stages)}")
+        return False
+    except Exception as e:
+        print(f"FAILED: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("Content Generator Package Tests")
@@ -94,7 +1248,33 @@ def main():
         test_imports,
         test_prompt_generation,
         test_example_extraction,
-        test_format_instructions
+        test_format_instructions,
+        test_batch_generation,
+        test_shared_client,
+        test_response_cache,
+        test_streaming_generation,
+        test_prompt_prefix,
+        test_example_cache,
+        test_exemplar_index,
+        test_extraction_pipeline,
+        test_exemplar_retrieval,
+        test_prompt_budget,
+        test_message_batch,
+        test_cli_smoke,
+        test_metadata_store,
+        test_incremental_build,
+        test_request_telemetry,
+        test_retry_policy,
+        test_cli_startup,
+        test_generation_server,
+        test_job_queue,
+        test_request_coalescing,
+        test_sectioned_generation,
+        test_continuation,
+        test_prompt_export,
+        test_output_writer,
+        test_reference_images,
+        test_pipeline_benchmark
     ]
     
     # Count successes
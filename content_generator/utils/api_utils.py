@@ -1,15 +1,25 @@
 """
 Utility functions for API interactions.
+
+The SDK and dotenv are imported inside the functions that need them: loading
+the SDK takes over a second, and commands that only read metadata should not
+pay for it.
 """
 
 import os
-from anthropic import Anthropic
-from dotenv import load_dotenv
-from ..config import DEFAULT_MODEL, DEFAULT_MAX_TOKENS
+import time
+from ..config import (
+    DEFAULT_MODEL, DEFAULT_MAX_TOKENS, DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS, DEFAULT_KEEPALIVE_EXPIRY, MAX_CONTINUATIONS
+)
+from .retry_utils import RetryPolicy, GenerationError, DeadlineExceededError, TruncatedResponseError, classify_error
+from .singleflight import make_request_key
+from .token_utils import estimate_tokens
 
 def get_api_key():
     """Get API key from environment variables or .env file"""
     # Load environment variables from .env file
+    from dotenv import load_dotenv
     load_dotenv()
     
     # Get API key from environment variable
@@ -29,25 +39,597 @@ def initialize_client(api_key=None):
         if not api_key:
             return None
     
-    return Anthropic(api_key=api_key)
+    from anthropic import Anthropic
+    
+    # Retries are handled by RetryPolicy, which classifies errors and honors deadlines
+    return Anthropic(api_key=api_key, max_retries=0)
 
-def generate_content_with_claude(prompt, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS, api_key=None):
-    """Generate content using Claude API"""
-    client = initialize_client(api_key)
-    if not client:
-        return "Error: Could not initialize Anthropic client."
+def create_client(api_key=None, base_url=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                  max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                  keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY):
+    """
+    Create a long-lived Anthropic client with a pooled HTTP connection
+    
+    The client is meant to be created once and shared by every request (and
+    thread), so that connections and TLS sessions are reused between calls.
+    
+    Args:
+        api_key (str, optional): API key for Claude API
+        base_url (str, optional): Override the API base URL
+        max_connections (int, optional): Maximum number of open connections
+        max_keepalive_connections (int, optional): Maximum number of idle connections kept open
+        keepalive_expiry (float, optional): Seconds an idle connection is kept open
+        
+    Returns:
+        Anthropic: The client, or None if no API key is available
+    """
+    if not api_key:
+        api_key = get_api_key()
+        if not api_key:
+            return None
+    
+    from anthropic import Anthropic, DefaultHttpxClient, DEFAULT_CONNECTION_LIMITS
+    
+    # Build the limits with the same HTTP library the installed SDK uses
+    limits = type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+    return Anthropic(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=DefaultHttpxClient(limits=limits),
+        # Retries are handled by RetryPolicy, which classifies errors and honors deadlines
+        max_retries=0
+    )
+
+def build_message_params(prompt, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS, system=None, prefix=None,
+                         images=None):
+    """
+    Build the keyword arguments for a Messages API request
+    
+    A system prompt is sent as a single block marked for prompt caching, so
+    requests that share it (e.g. every item of one file type) can reuse the
+    cached prefix instead of paying full price for it each time. A sequence
+    of strings is sent as one cached block each, so requests that share a
+    longer prefix (e.g. every section of one item) reuse all of it.
+    
+    A ``prefix`` is sent as the start of the assistant's reply, which the
+    model continues; it is how a truncated or interrupted response is resumed.
+    
+    ``images`` are sent before the prompt text, each after its caption if it
+    has one. The last image is marked for prompt caching too, so requests
+    that attach the same images reuse them from the cache.
+    
+    Args:
+        prompt (str): The user prompt
+        model (str, optional): Model name
+        max_tokens (int, optional): Maximum tokens to generate
+        system (str or sequence, optional): Static system prompt shared between requests, or its blocks
+        prefix (str, optional): Start of the reply, without trailing whitespace
+        images (list, optional): Images from image_extractor.load_image, with an optional 'caption'
+        
+    Returns:
+        dict: Request parameters
+    """
+    content = prompt
+    if images:
+        content = []
+        for image in images:
+            if image.get('caption'):
+                content.append({"type": "text", "text": image['caption']})
+            content.append({
+                "type": "image",
+                "source": {"type": "base64", "media_type": image['media_type'], "data": image['data']}
+            })
+        content[-1]['cache_control'] = {"type": "ephemeral"}
+        content.append({"type": "text", "text": prompt})
+    params = {
+        'model': model,
+        'max_tokens': max_tokens,
+        'messages': [
+            {"role": "user", "content": content}
+        ]
+    }
+    if prefix:
+        params['messages'].append({"role": "assistant", "content": prefix})
+    if system:
+        params['system'] = [
+            {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+            for text in get_system_blocks(system)
+        ]
+    return params
+
+def get_system_blocks(system):
+    """Get a system prompt as a list of its non-empty blocks"""
+    if not system:
+        return []
+    if isinstance(system, str):
+        return [system]
+    return [text for text in system if text]
+
+def get_usage_counts(usage):
+    """Get the token counts of an API response's ``usage`` object as a dict"""
+    return {
+        'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+        'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+        'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+        'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    }
+
+def estimate_input_tokens(prompt, system=None, images=None):
+    """Estimate the input tokens of a request locally, before sending it"""
+    tokens = sum(estimate_tokens(text) for text in get_system_blocks(system)) + estimate_tokens(prompt)
+    for image in images or ():
+        tokens += image['tokens'] + estimate_tokens(image.get('caption'))
+    return tokens
+
+def get_image_stats(images):
+    """Get the number, base64 payload size and estimated token cost of a request's images"""
+    images = images or ()
+    return {
+        'image_count': len(images),
+        'image_bytes': sum(image['bytes'] for image in images),
+        'image_tokens': sum(image['tokens'] for image in images)
+    }
+
+def report_images(images):
+    """
+    Print the images attached to a request, with their payload size and estimated tokens
+    
+    Returns:
+        dict: Image statistics from get_image_stats, empty if there are no images
+    """
+    if not images:
+        return {}
+    stats = get_image_stats(images)
+    print(
+        f"Images: {stats['image_count']} attached, {stats['image_bytes'] / 1024:.0f} KB payload, "
+        f"~{stats['image_tokens']} tokens"
+    )
+    return stats
+
+def report_usage(usage, on_usage=None, estimated_input_tokens=None):
+    """
+    Print token usage for a response, including prompt cache reads and writes
+    
+    Args:
+        usage: The ``usage`` object of an API response
+        on_usage (callable, optional): Called with a dict of token counts
+        estimated_input_tokens (int, optional): Local estimate of the prompt size, printed for comparison
+        
+    Returns:
+        dict: Token counts
+    """
+    counts = get_usage_counts(usage)
+    estimate = f" (~{estimated_input_tokens} estimated)" if estimated_input_tokens is not None else ""
+    print(
+        f"Tokens: {counts['input_tokens']} input{estimate}, {counts['cache_read_input_tokens']} cache read, "
+        f"{counts['cache_creation_input_tokens']} cache write, {counts['output_tokens']} output"
+    )
+    if on_usage:
+        on_usage(counts)
+    return counts
+
+def get_response_text(message, allow_empty=False):
+    """
+    Get the text of a Messages API response
+    
+    Args:
+        message: The API response
+        allow_empty (bool, optional): Accept a response with no text, e.g. a continuation with nothing to add
+        
+    Raises:
+        GenerationError: The response contained no text
+    """
+    text = ''.join(block.text for block in message.content if getattr(block, 'type', None) == 'text')
+    if not text and not allow_empty:
+        raise GenerationError(f"Response contained no text (stop reason: {message.stop_reason})")
+    return text
+
+def generate_content_with_claude(prompt, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS, api_key=None, client=None,
+                                 cache=None, refresh=False, system=None, on_usage=None, on_metrics=None, retry=None,
+                                 singleflight=None, max_continuations=MAX_CONTINUATIONS, images=None):
+    """
+    Generate content using Claude API
+    
+    A response cut off at ``max_tokens`` is continued rather than returned
+    truncated: the text so far is sent back as the start of the assistant's
+    reply and the model carries on from there, up to ``max_continuations``
+    times. A response still cut off after that fails with
+    TruncatedResponseError and is not cached.
+    
+    Args:
+        prompt (str): The user prompt
+        model (str, optional): Model name
+        max_tokens (int, optional): Maximum tokens to generate per request
+        api_key (str, optional): API key, used only when no client is given
+        client (Anthropic, optional): Shared client to reuse
+        cache (ResponseCache, optional): Response cache to read from and store into
+        refresh (bool, optional): Skip the cache lookup but still store the new response
+        system (str or sequence, optional): Static system prompt or its blocks, sent as a cacheable prefix
+        on_usage (callable, optional): Called with the token counts of each response
+        on_metrics (callable, optional): Called once with a dict of request metrics: 'cached',
+            'coalesced', 'api_seconds', 'stop_reason', 'retries', 'hedged', 'continuations',
+            'error', the token counts and, when images are sent, 'image_count', 'image_bytes'
+            and 'image_tokens'
+        retry (RetryPolicy, optional): Retry, deadline and hedging policy
+        singleflight (SingleFlight, optional): Share one request between concurrent identical calls
+        max_continuations (int, optional): Follow-up requests allowed for a response cut off at max_tokens
+        images (list, optional): Images from image_extractor.load_image, sent before the prompt
+        
+    Returns:
+        str: Generated content
+        
+    Raises:
+        GenerationError: The request failed permanently, or ran out of attempts or time
+        TruncatedResponseError: The response was still cut off at max_tokens after every continuation
+    """
+    # Serve identical requests from the cache without touching the API
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(model, max_tokens, prompt, system, images)
+        if not refresh:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                if on_metrics:
+                    on_metrics({'cached': True})
+                return cached
+    
+    client = _require_client(client, api_key, on_metrics)
+    retry = retry or RetryPolicy()
+    
+    def request():
+        stats = {'continuations': 0}
+        counts = report_images(images)
+        content = ''
+        start = time.perf_counter()
+        try:
+            while True:
+                prefix = content
+                params = build_message_params(prompt, model, max_tokens, system, prefix=prefix, images=images)
+                
+                def attempt(timeout):
+                    return client.messages.create(**params, **_timeout_option(timeout))
+                
+                # Create a message using the specified model; concurrent duplicates are harmless here
+                message = retry.run(attempt, hedgeable=True, stats=stats)
+                content += get_response_text(message, allow_empty=bool(content))
+                _add_counts(counts, report_usage(
+                    message.usage, on_usage, estimate_input_tokens(prompt, system, images) + estimate_tokens(prefix)
+                ))
+                if not _should_continue(message.stop_reason, stats, max_continuations):
+                    break
+                # The API rejects a reply prefix that ends in whitespace
+                content = content.rstrip()
+        except GenerationError as e:
+            _report_error(on_metrics, e, time.perf_counter() - start, stats=stats)
+            raise
+        api_seconds = time.perf_counter() - start
+        
+        if message.stop_reason == 'max_tokens':
+            _raise_truncated(content, on_metrics, api_seconds, counts, stats)
+        if on_metrics:
+            on_metrics(dict(counts, api_seconds=api_seconds, stop_reason=message.stop_reason, **stats))
+        return content
+    
+    content, _ = _share_request(singleflight, request, model, max_tokens, prompt, system, images, on_metrics)
+    
+    # Only successful responses are cached
+    if cache_key is not None:
+        cache.set(cache_key, content)
+    
+    # Return the generated content
+    return content
+
+def stream_content_with_claude(prompt, on_text, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS, api_key=None,
+                               client=None, cache=None, refresh=False, system=None, on_usage=None, on_metrics=None,
+                               retry=None, singleflight=None, max_continuations=MAX_CONTINUATIONS, images=None):
+    """
+    Generate content using Claude API, streaming text as it arrives
+    
+    Failures before the first chunk of text are retried like any request.
+    Once text has been passed to ``on_text``, a retry would repeat it, so a
+    stream that drops part way, or is cut off at ``max_tokens``, is continued
+    instead: the text delivered so far is sent back as the start of the
+    assistant's reply and only the rest is streamed, up to
+    ``max_continuations`` times; a response still cut off after that fails
+    with TruncatedResponseError and is not cached. Streams are never
+    hedged. A call that joins an identical request already in flight
+    receives the whole content as a single chunk when that request finishes.
+    
+    Args:
+        prompt (str): The user prompt
+        on_text (callable): Called with each chunk of text as it arrives
+        model (str, optional): Model name
+        max_tokens (int, optional): Maximum tokens to generate per request
+        api_key (str, optional): API key, used only when no client is given
+        client (Anthropic, optional): Shared client to reuse
+        cache (ResponseCache, optional): Response cache to read from and store into
+        refresh (bool, optional): Skip the cache lookup but still store the new response
+        system (str or sequence, optional): Static system prompt or its blocks, sent as a cacheable prefix
+        on_usage (callable, optional): Called with the token counts of each completed response
+        on_metrics (callable, optional): Called once with a dict of request metrics, as for
+            generate_content_with_claude, plus 'ttft_seconds' (time to the first text chunk)
+        retry (RetryPolicy, optional): Retry and deadline policy
+        singleflight (SingleFlight, optional): Share one request between concurrent identical calls
+        max_continuations (int, optional): Follow-up requests allowed for a stream that dropped or was cut off
+        images (list, optional): Images from image_extractor.load_image, sent before the prompt
+        
+    Returns:
+        str: The complete generated content, exactly as passed to ``on_text``
+        
+    Raises:
+        GenerationError: The request failed permanently, ran out of attempts, continuations or time
+        TruncatedResponseError: The response was still cut off at max_tokens after every continuation
+    """
+    # A cached response is delivered as a single chunk
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(model, max_tokens, prompt, system, images)
+        if not refresh:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                if on_metrics:
+                    on_metrics({'cached': True})
+                on_text(cached)
+                return cached
+    
+    client = _require_client(client, api_key, on_metrics)
+    retry = retry or RetryPolicy()
+    start = time.perf_counter()
+    progress = {'ttft_seconds': None}
+    delivered = []
+    
+    def deliver(text):
+        if progress['ttft_seconds'] is None:
+            progress['ttft_seconds'] = time.perf_counter() - start
+        delivered.append(text)
+        on_text(text)
+    
+    def make_attempt(params, write):
+        def attempt(timeout):
+            expires = time.monotonic() + timeout if timeout is not None else None
+            received = False
+            with client.messages.stream(**params, **_timeout_option(timeout)) as stream:
+                try:
+                    for text in stream.text_stream:
+                        received = True
+                        write(text)
+                        if expires and time.monotonic() > expires:
+                            raise DeadlineExceededError("Deadline exceeded while streaming", transient=True)
+                    return stream.get_final_message(), None
+                except GenerationError:
+                    raise
+                except Exception as e:
+                    # Nothing new was delivered, so a retry repeats nothing
+                    if not received:
+                        raise
+                    if not classify_error(e):
+                        raise GenerationError(f"Stream failed after partial content: {e}") from e
+                    return None, e
+        return attempt
+    
+    def request():
+        stats = {'continuations': 0}
+        counts = report_images(images)
+        message = None
+        try:
+            while True:
+                text = ''.join(delivered)
+                prefix = text.rstrip()
+                params = build_message_params(prompt, model, max_tokens, system, prefix=prefix, images=images)
+                write = _skip_repeated_whitespace(deliver, text[len(prefix):])
+                message, dropped = retry.run(make_attempt(params, write), stats=stats)
+                if message is not None:
+                    _add_counts(counts, report_usage(
+                        message.usage, on_usage, estimate_input_tokens(prompt, system, images) + estimate_tokens(prefix)
+                    ))
+                if not _should_continue('dropped' if dropped else message.stop_reason, stats, max_continuations):
+                    if dropped:
+                        raise GenerationError(
+                            f"Stream interrupted after partial content {stats['continuations'] + 1} times: {dropped}",
+                            transient=True
+                        ) from dropped
+                    break
+            content = ''.join(delivered)
+            if not content:
+                raise GenerationError(f"Response contained no text (stop reason: {message.stop_reason})")
+        except GenerationError as e:
+            _report_error(on_metrics, e, time.perf_counter() - start, progress['ttft_seconds'], stats)
+            raise
+        api_seconds = time.perf_counter() - start
+        
+        if message.stop_reason == 'max_tokens':
+            metrics = dict(counts, ttft_seconds=progress['ttft_seconds'])
+            _raise_truncated(content, on_metrics, api_seconds, metrics, stats)
+        if on_metrics:
+            on_metrics(dict(
+                counts, api_seconds=api_seconds, ttft_seconds=progress['ttft_seconds'],
+                stop_reason=message.stop_reason, **stats
+            ))
+        return content
+    
+    content, shared = _share_request(singleflight, request, model, max_tokens, prompt, system, images, on_metrics)
+    if shared:
+        on_text(content)
+    
+    # Only successful responses are cached
+    if cache_key is not None:
+        cache.set(cache_key, content)
+    
+    return content
+
+def _should_continue(stop_reason, stats, max_continuations):
+    """
+    Decide whether to continue a response that ended with ``stop_reason``, counting the continuation
+
+    Only responses cut off at max_tokens and streams that dropped part way
+    ('dropped') are continued, up to ``max_continuations`` times.
+    """
+    if stop_reason not in ('max_tokens', 'dropped'):
+        return False
+    reason = "cut off at max_tokens" if stop_reason == 'max_tokens' else "interrupted"
+    if stats['continuations'] >= max_continuations:
+        return False
+    stats['continuations'] += 1
+    print(f"Response {reason}; continuing from the partial text ({stats['continuations']}/{max_continuations})")
+    return True
+
+def _raise_truncated(content, on_metrics, api_seconds, counts, stats):
+    """
+    Fail a response still cut off at max_tokens after its continuations
+
+    Its metrics, with the stop reason and token counts, are reported as a
+    failure, so the text is neither cached nor saved as finished output.
+
+    Raises:
+        TruncatedResponseError: Always, holding the text generated so far
+    """
+    error = TruncatedResponseError(
+        f"Response still cut off at max_tokens after {stats['continuations']} continuations", content, stats['retries']
+    )
+    if on_metrics:
+        on_metrics(dict(counts, error=str(error), api_seconds=api_seconds, stop_reason='max_tokens', **stats))
+    raise error
+
+def _skip_repeated_whitespace(write, delivered_whitespace):
+    """
+    Wrap ``write`` for a continuation of text that ended in ``delivered_whitespace``
+
+    The reply prefix is sent without its trailing whitespace, so the
+    continuation may start by repeating it. Leading whitespace that repeats
+    what has been delivered already is dropped.
+    """
+    if not delivered_whitespace:
+        return write
+    state = {'leading': ''}
+    
+    def continue_write(text):
+        if state['leading'] is None:
+            return write(text)
+        body = text.lstrip()
+        state['leading'] += text[:len(text) - len(body)]
+        if body:
+            leading = state['leading']
+            state['leading'] = None
+            if leading.startswith(delivered_whitespace):
+                leading = leading[len(delivered_whitespace):]
+            elif delivered_whitespace.startswith(leading):
+                leading = ''
+            write(leading + body)
+    return continue_write
+
+def _add_counts(totals, counts):
+    """Add token counts into running totals"""
+    for key, value in counts.items():
+        totals[key] = totals.get(key, 0) + value
+
+def _share_request(singleflight, request, model, max_tokens, prompt, system, images, on_metrics):
+    """
+    Make a request, or wait for an identical one already in flight
+
+    Returns:
+        tuple: (content, shared) where shared is True if another call's request was used
+    """
+    if singleflight is None:
+        return request(), False
+    start = time.perf_counter()
+    made = []
+    
+    def lead():
+        made.append(True)
+        return request()
     
     try:
-        # Create a message using the specified model
-        message = client.messages.create(
-            model=model,
-            max_tokens=max_tokens,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Return the generated content
-        return message.content[0].text
-    except Exception as e:
-        return f"Error generating content: {str(e)}"
+        content, shared = singleflight.do(make_request_key(model, max_tokens, prompt, system, images), lead)
+    except GenerationError as e:
+        # A request this call made has reported its own failure already
+        if not made:
+            _report_error(on_metrics, e, time.perf_counter() - start)
+        raise
+    if shared and on_metrics:
+        # No tokens were spent on this call
+        on_metrics({'coalesced': True, 'api_seconds': time.perf_counter() - start})
+    return content, shared
+
+def _require_client(client, api_key, on_metrics):
+    """Return the given client, or a new one from ``api_key``, raising if neither is available"""
+    if client is None:
+        client = initialize_client(api_key)
+    if not client:
+        error = GenerationError("Could not initialize Anthropic client.")
+        _report_error(on_metrics, error)
+        raise error
+    return client
+
+def _timeout_option(timeout):
+    """Request options for a per-attempt timeout; None keeps the client's default"""
+    return {} if timeout is None else {'timeout': max(timeout, 0.001)}
+
+def _report_error(on_metrics, error, api_seconds=None, ttft_seconds=None, stats=None):
+    """Pass a failed request's metrics to ``on_metrics``"""
+    if on_metrics:
+        on_metrics(dict(stats or {}, error=str(error), api_seconds=api_seconds, ttft_seconds=ttft_seconds))
+
+
+def submit_message_batch(requests, client, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Submit prompts as one asynchronous Message Batch
+    
+    Batches are processed offline, typically within an hour and at most 24
+    hours, at half the price of synchronous requests.
+    
+    Args:
+        requests (list): (custom_id, prompt, system, images) tuples; custom IDs must be unique,
+            and images may be None
+        client (Anthropic): Client to submit with
+        model (str, optional): Model name
+        max_tokens (int, optional): Maximum tokens to generate per request
+        
+    Returns:
+        MessageBatch: The created batch
+    """
+    return client.messages.batches.create(requests=[
+        {'custom_id': custom_id, 'params': build_message_params(prompt, model, max_tokens, system, images=images)}
+        for custom_id, prompt, system, images in requests
+    ])
+
+def iter_message_batch_results(batch_id, client):
+    """
+    Iterate over the results of a finished Message Batch
+    
+    Args:
+        batch_id (str): ID of the batch
+        client (Anthropic): Client to fetch the results with
+        
+    A response cut off at ``max_tokens`` is reported as an error rather than
+    as content, so it is neither saved nor cached as if it were complete;
+    generating the item synchronously continues it instead.
+    
+    Yields:
+        tuple: (custom_id, content, usage counts, error) where content is None unless
+            the request succeeded with a complete response, usage is None unless a
+            response was received, and error is None if content is given
+    """
+    for response in client.messages.batches.results(batch_id):
+        result = response.result
+        if result.type == 'succeeded':
+            message = result.message
+            usage = get_usage_counts(message.usage)
+            if message.stop_reason == 'max_tokens':
+                error = "Response cut off at max_tokens; generate the item again to continue it"
+                yield response.custom_id, None, usage, error
+                continue
+            try:
+                content = get_response_text(message)
+            except GenerationError as e:
+                yield response.custom_id, None, usage, str(e)
+                continue
+            yield response.custom_id, content, usage, None
+        elif result.type == 'errored':
+            error = getattr(result.error, 'error', result.error)
+            yield response.custom_id, None, None, f"Request errored: {getattr(error, 'message', error)}"
+        else:
+            yield response.custom_id, None, None, f"Request {result.type}"
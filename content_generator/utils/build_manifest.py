@@ -0,0 +1,134 @@
+"""
+Build manifest for incremental regeneration.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from ..config import DEFAULT_MODEL, DEFAULT_MAX_TOKENS, BUILD_MANIFEST_NAME
+
+def make_fingerprint(item, system_prompt, prompt, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS, images=None,
+                     outline=None):
+    """
+    Fingerprint everything that goes into generating one output file
+
+    The assembled prompt already contains the example or exemplar passages in
+    use, so editing an exemplar, rebuilding the index or changing format
+    instructions all change the fingerprint, as do edits to the item itself.
+
+    Args:
+        item (Mapping): Metadata item
+        system_prompt (str): Static system prompt
+        prompt (str): Item prompt
+        model (str, optional): Model name
+        max_tokens (int, optional): Maximum tokens to generate
+        images (list, optional): Reference images sent with the prompt, identified by their 'sha256'
+        outline (tuple, optional): Outline instruction and its max_tokens when the item is generated
+            in sections, None when it is generated in one request
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    parts = [model, str(max_tokens), json.dumps(dict(item), sort_keys=True, default=list), system_prompt or "", prompt]
+    parts.extend(image['sha256'] for image in images or ())
+    if outline is not None:
+        parts.extend(['sections', outline[0], str(outline[1])])
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class BuildManifest:
+    """
+    Record of the input fingerprint of every file in an output directory
+
+    Stored as a SQLite file inside the output directory, so it travels with
+    the outputs it describes.
+    """
+
+    def __init__(self, output_dir, name=BUILD_MANIFEST_NAME, read_only=False):
+        """
+        Open (or create) the manifest of an output directory
+
+        Args:
+            output_dir (str): Directory containing the generated files
+            name (str, optional): Manifest filename within the output directory
+            read_only (bool, optional): Only check statuses, creating nothing; a missing
+                manifest reports every file as 'new'
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, name)
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._conn = None
+        if read_only:
+            if os.path.exists(self.path):
+                uri = f"{Path(os.path.abspath(self.path)).as_uri()}?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+        os.makedirs(output_dir, exist_ok=True)
+
+        # One connection shared by all threads, serialized by self._lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outputs (
+                filename TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                built_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def status(self, filename, fingerprint):
+        """
+        Work out whether an output file needs to be generated
+
+        Args:
+            filename (str): Output filename relative to the output directory
+            fingerprint (str): Fingerprint of its current inputs
+
+        Returns:
+            str: 'up to date', 'new' (never built), 'missing' (built but deleted) or 'changed'
+        """
+        if self._conn is None:
+            return 'new'
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM outputs WHERE filename = ?", (filename,)
+            ).fetchone()
+        if row is None:
+            return 'new'
+        if not os.path.exists(os.path.join(self.output_dir, filename)):
+            return 'missing'
+        return 'up to date' if row[0] == fingerprint else 'changed'
+
+    def record(self, filename, fingerprint):
+        """
+        Record that an output file was built from inputs with this fingerprint
+
+        Args:
+            filename (str): Output filename relative to the output directory
+            fingerprint (str): Fingerprint of its inputs
+
+        Raises:
+            RuntimeError: The manifest was opened read-only
+        """
+        if self.read_only:
+            raise RuntimeError(f"The build manifest {self.path} is open read-only")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outputs (filename, fingerprint, built_at) VALUES (?, ?, ?)",
+                (filename, fingerprint, time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
@@ -0,0 +1,205 @@
+"""
+Persistent response cache for generated content.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from ..config import (
+    DEFAULT_CACHE_PATH, DEFAULT_CACHE_MAX_ENTRIES, DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_MAX_AGE
+)
+
+# How many writes to allow between eviction passes
+EVICT_EVERY = 100
+
+class ResponseCache:
+    """
+    Content-addressed cache of API responses stored in a single SQLite file
+
+    Entries are keyed by a hash of everything that determines a completion
+    (model, max_tokens, system and user prompt) and evicted least-recently-used first once
+    the cache grows past its entry or size limits. Entries older than
+    ``max_age`` seconds are treated as misses.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+                 max_bytes=DEFAULT_CACHE_MAX_BYTES, max_age=DEFAULT_CACHE_MAX_AGE):
+        """
+        Open (or create) the cache
+
+        Args:
+            path (str, optional): Path to the SQLite database file
+            max_entries (int, optional): Maximum number of cached responses
+            max_bytes (int, optional): Maximum total size of cached responses in bytes
+            max_age (float, optional): Maximum age of an entry in seconds, None for no limit
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by all threads, serialized by self._lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model, max_tokens, prompt, system=None, images=None):
+        """
+        Build the cache key for a request
+
+        Args:
+            model (str): Model name
+            max_tokens (int): Maximum tokens to generate
+            prompt (str): The user prompt
+            system (str or sequence, optional): The system prompt or its blocks, if any
+            images (list, optional): Images sent with the prompt, identified by their 'sha256'
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        parts = [model, str(max_tokens), prompt]
+        if isinstance(system, str):
+            parts.append(system)
+        elif system:
+            parts.extend(text for text in system if text)
+        # Images are keyed by a hash of their payload rather than the base64 data itself
+        parts.extend(image['sha256'] for image in images or ())
+
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached response
+
+        Args:
+            key (str): Cache key from make_key
+
+        Returns:
+            str: The cached response, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if not row:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        """
+        Store a response
+
+        Args:
+            key (str): Cache key from make_key
+            response (str): Response text to store
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+
+        if due:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then least-recently-used entries until the cache fits its limits
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            removed = 0
+            if self.max_age is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)
+                ).rowcount
+
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+            # Walk from the least recently used entry until both limits are met
+            doomed = []
+            if count > self.max_entries or total > self.max_bytes:
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ):
+                    if count <= self.max_entries and total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    count -= 1
+                    total -= size
+
+            if doomed:
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                removed += len(doomed)
+            self._conn.commit()
+            return removed
+
+    def stats(self):
+        """
+        Get cache statistics
+
+        Returns:
+            dict: Hit and miss counters for this session plus entry count and size on disk
+        """
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': total}
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
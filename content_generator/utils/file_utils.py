@@ -5,6 +5,7 @@ Utility functions for file operations.
 import os
 import json
 from pathlib import Path
+from .token_utils import truncate_to_tokens
 
 def read_file(filepath):
     """Read content from a file with error handling"""
@@ -24,15 +25,18 @@ def read_json(filepath):
         print(f"Error reading JSON file {filepath}: {e}")
         return None
 
+# When written files are flushed to disk: never (left to the OS), each file
+# before it is renamed into place, or also its directory after the rename
+FSYNC_POLICIES = ('never', 'file', 'always')
+
 def write_file(content, filepath, output_dir=None):
     """Write content to a file with error handling"""
     try:
         # Handle output directory if provided
         if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
             filepath = os.path.join(output_dir, filepath)
         
-        # Create parent directories if they don't exist
+        # Create parent directories (including the output directory) if they don't exist
         os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
         
         # Write content to file
@@ -45,9 +49,117 @@ def write_file(content, filepath, output_dir=None):
         print(f"Error writing to file {filepath}: {e}")
         return None
 
-def read_example_content(file_path, max_length=None):
-    """Read example content from a file with truncation"""
+def write_file_atomic(content, filepath, fsync='never'):
+    """
+    Write content through a temporary file that is renamed over the destination
+    
+    Readers see either the previous file or the complete new one. The parent
+    directory must exist.
+    
+    Args:
+        content (str): Content to write
+        filepath (str): Destination path
+        fsync (str, optional): One of FSYNC_POLICIES
+    """
+    directory, name = os.path.split(os.path.abspath(filepath))
+    temp_path = os.path.join(directory, f".{name}.partial")
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+            if fsync != 'never':
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if fsync == 'always':
+        sync_directory(directory)
+
+def sync_directory(directory):
+    """Flush a directory's entries to disk, so that renames in it survive a crash"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on every platform
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class AtomicFileWriter:
+    """
+    Write a file chunk by chunk and move it into place only when complete
+    
+    Chunks go to a hidden ``.partial`` file next to the destination and are
+    flushed as they are written, so another process can tail the file while it
+    grows. On commit the partial file is renamed over the destination; on
+    abort it is removed, leaving any previous version untouched.
+    """
+    
+    def __init__(self, filepath, output_dir=None, fsync='never'):
+        """
+        Open the temporary file
+        
+        Args:
+            filepath (str): Destination path
+            output_dir (str, optional): Directory the path is relative to
+            fsync (str, optional): One of FSYNC_POLICIES, applied on commit
+        """
+        if output_dir:
+            filepath = os.path.join(output_dir, filepath)
+        self.filepath = filepath
+        self.fsync = fsync
+        
+        directory, name = os.path.split(os.path.abspath(filepath))
+        os.makedirs(directory, exist_ok=True)
+        self.temp_path = os.path.join(directory, f".{name}.partial")
+        self._file = open(self.temp_path, 'w', encoding='utf-8')
+    
+    def write(self, chunk):
+        """Append a chunk and flush it to disk"""
+        self._file.write(chunk)
+        self._file.flush()
+    
+    def commit(self):
+        """
+        Close the temporary file and rename it into place
+        
+        Returns:
+            str: The destination path
+        """
+        if self.fsync != 'never':
+            os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.temp_path, self.filepath)
+        if self.fsync == 'always':
+            sync_directory(os.path.dirname(self.temp_path))
+        print(f"Content saved to {self.filepath}")
+        return self.filepath
+    
+    def abort(self):
+        """Close and remove the temporary file"""
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._file.closed:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.abort()
+
+def read_example_content(file_path, max_tokens=None):
+    """Read example content from a file, truncated to ``max_tokens`` estimated tokens"""
     content = read_file(file_path)
-    if content and max_length and len(content) > max_length:
-        content = content[:max_length] + "\n...\n[Example truncated for brevity]"
+    if content and max_tokens:
+        content = truncate_to_tokens(content, max_tokens, "\n...\n[Example truncated for brevity]")
     return content
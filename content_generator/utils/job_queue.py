@@ -0,0 +1,280 @@
+"""
+Durable job queue for long batch runs.
+
+A run is a list of items to generate, stored in SQLite with a state per item:
+pending, running (leased to a worker until its lease expires), done or
+failed. Workers renew their leases while they run, so a job whose worker was
+killed is picked up again once its lease expires, or straight away when its
+worker was a process on this host that no longer exists. Resuming a run
+only generates the items that are not done.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from ..config import DEFAULT_JOB_QUEUE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+STATES = ('pending', 'running', 'done', 'failed')
+
+def make_worker_id():
+    """Get a worker ID for this process: host, process ID and a random suffix"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def is_worker_alive(worker_id):
+    """
+    Check whether a worker may still be running
+
+    Only workers on this host can be checked; others are assumed alive until
+    their leases expire.
+    """
+    host, _, rest = (worker_id or '').partition(':')
+    pid = rest.partition(':')[0]
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+
+    # A killed process can linger as a zombie until its parent reaps it
+    try:
+        with open(f"/proc/{pid}/stat", encoding='utf-8') as file:
+            return file.read().rpartition(')')[2].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+class JobQueue:
+    """
+    SQLite-backed queue of generation runs and their items
+    """
+
+    def __init__(self, path=DEFAULT_JOB_QUEUE_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        """
+        Open (or create) a job queue
+
+        Args:
+            path (str, optional): Path to the queue database
+            lease_seconds (float, optional): How long a claimed job is reserved without a renewal
+            max_attempts (int, optional): Claims of one job before it is marked failed
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = make_worker_id()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # One connection shared by all threads, serialized by self._lock; several
+        # processes can share the file, so claims run in immediate transactions
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                options TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                run_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                item_index INTEGER NOT NULL,
+                name TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (run_id, seq)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (run_id, state);
+        """)
+
+    def create_run(self, items, options=None):
+        """
+        Record a new run
+
+        Args:
+            items (list): (category, index, name) tuples, in the order to generate them
+            options (dict, optional): Settings needed to resume the run, stored as JSON
+
+        Returns:
+            int: The run ID
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO runs (created_at, options) VALUES (?, ?)", (now, json.dumps(options or {}))
+                )
+                run_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO jobs (run_id, seq, category, item_index, name, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(run_id, seq, category, index, name, now) for seq, (category, index, name) in enumerate(items)]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return run_id
+
+    def get_run_options(self, run_id):
+        """Get the options a run was created with, or None if there is no such run"""
+        with self._lock:
+            row = self._conn.execute("SELECT options FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest_unfinished_run(self, include_failed=False):
+        """
+        Get the ID of the most recent run with items left to generate
+
+        Failed items are only generated again by retry_failed(), so a run
+        whose other items are all done is finished unless ``include_failed``.
+
+        Args:
+            include_failed (bool, optional): Also count runs with failed items
+
+        Returns:
+            int: Run ID, or None if there is no such run
+        """
+        states = ('pending', 'running', 'failed') if include_failed else ('pending', 'running')
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT MAX(run_id) FROM jobs WHERE state IN ({', '.join('?' * len(states))})", states
+            ).fetchone()
+        return row[0]
+
+    def counts(self, run_id):
+        """
+        Count a run's items by state
+
+        Returns:
+            dict: Number of items in each of STATES
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state", (run_id,)
+            ).fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def release_lost_jobs(self, run_id):
+        """
+        Return running jobs whose workers are gone to the pending state
+
+        Jobs whose worker was a process on this host that has exited are
+        released at once; others are released when their leases expire.
+
+        Returns:
+            int: Number of jobs released
+        """
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT lease_owner FROM jobs WHERE run_id = ? AND state = 'running'", (run_id,)
+            )]
+            lost = [owner for owner in owners if owner != self.worker_id and not is_worker_alive(owner)]
+            released = 0
+            for owner in lost:
+                released += self._conn.execute(
+                    "UPDATE jobs SET state = 'pending', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                    "WHERE run_id = ? AND state = 'running' AND lease_owner = ?",
+                    (time.time(), run_id, owner)
+                ).rowcount
+        return released
+
+    def retry_failed(self, run_id):
+        """
+        Return a run's failed items to the pending state with a fresh attempt count
+
+        Returns:
+            int: Number of items requeued
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, error = NULL, updated_at = ? "
+                "WHERE run_id = ? AND state = 'failed'",
+                (time.time(), run_id)
+            ).rowcount
+
+    def claim(self, run_id):
+        """
+        Lease the next pending (or abandoned) item of a run to this worker
+
+        Returns:
+            dict: 'seq', 'category', 'index', 'name' and 'attempts' of the item, or None if none is left
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose workers kept disappearing are given up on rather than retried forever
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'failed', error = ?, lease_owner = NULL, updated_at = ? "
+                    "WHERE run_id = ? AND attempts >= ? AND (state = 'pending' OR (state = 'running' AND lease_expires < ?))",
+                    (f"Worker lost {self.max_attempts} times", now, run_id, self.max_attempts, now)
+                )
+                row = self._conn.execute(
+                    "SELECT seq, category, item_index, name, attempts FROM jobs "
+                    "WHERE run_id = ? AND (state = 'pending' OR (state = 'running' AND lease_expires < ?)) "
+                    "ORDER BY seq LIMIT 1",
+                    (run_id, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'running', attempts = attempts + 1, lease_owner = ?, "
+                        "lease_expires = ?, updated_at = ? WHERE run_id = ? AND seq = ?",
+                        (self.worker_id, now + self.lease_seconds, now, run_id, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        seq, category, index, name, attempts = row
+        return {'seq': seq, 'category': category, 'index': index, 'name': name, 'attempts': attempts + 1}
+
+    def renew(self):
+        """Extend the leases of every job this worker is running"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE lease_owner = ? AND state = 'running'",
+                (time.time() + self.lease_seconds, self.worker_id)
+            )
+
+    def complete(self, run_id, seq):
+        """Mark an item done"""
+        self._finish(run_id, seq, 'done', None)
+
+    def fail(self, run_id, seq, error):
+        """Mark an item failed with an error message"""
+        self._finish(run_id, seq, 'failed', error)
+
+    def _finish(self, run_id, seq, state, error):
+        """Move an item to a final state and release its lease"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE run_id = ? AND seq = ?",
+                (state, error, time.time(), run_id, seq)
+            )
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
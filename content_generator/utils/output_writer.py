@@ -0,0 +1,316 @@
+"""
+Background writer for generated output files.
+
+Workers hand finished content to an OutputWriter and go back to generating.
+A single writer thread takes files from a bounded queue, so a slow disk
+holds workers back instead of piling content up in memory. Each file is
+written through a temporary file that is renamed into place and flushed to
+disk as the fsync policy says. Files that are queued together are written
+as one batch, and with the 'always' policy each directory is synced once
+per batch rather than once per file. Instead of a directory, the writer can
+add every file to a single tar or zip archive.
+
+Saved files are reported on the console at most once per interval.
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+from ..config import OUTPUT_QUEUE_SIZE, OUTPUT_FSYNC, OUTPUT_LOG_INTERVAL
+from .file_utils import FSYNC_POLICIES, write_file_atomic, sync_directory
+
+# Archive formats by file suffix: 'zip', or the tarfile write mode
+ARCHIVE_FORMATS = {
+    '.zip': 'zip',
+    '.tar': 'w',
+    '.tar.gz': 'w:gz',
+    '.tgz': 'w:gz',
+    '.tar.bz2': 'w:bz2',
+    '.tar.xz': 'w:xz'
+}
+
+def get_archive_format(path):
+    """
+    Get the archive format for a path from its suffix
+
+    Returns:
+        str: 'zip' or a tarfile write mode, or None if the suffix is not an archive's
+    """
+    name = path.lower()
+    for suffix, archive_format in ARCHIVE_FORMATS.items():
+        if name.endswith(suffix):
+            return archive_format
+    return None
+
+class RateLimitedLog:
+    """
+    Prints messages at most once per interval
+
+    Messages that arrive sooner are held back and counted; the count is added
+    to the next message printed, and flush() prints the last one held back.
+    """
+
+    def __init__(self, interval=OUTPUT_LOG_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = None
+        self._held = 0
+        self._held_message = None
+
+    def log(self, message):
+        """Print a message, or hold it back if one was printed less than an interval ago"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last is not None and now - self._last < self.interval:
+                self._held += 1
+                self._held_message = message
+                return
+            held, self._held, self._held_message, self._last = self._held, 0, None, now
+        print(f"{message} (+{held} more)" if held else message)
+
+    def flush(self):
+        """Print the last message held back, if any"""
+        with self._lock:
+            held, message = self._held, self._held_message
+            self._held, self._held_message, self._last = 0, None, time.monotonic()
+        if held:
+            print(f"{message} (+{held - 1} more)" if held > 1 else message)
+
+class DirectorySink:
+    """Writes output files into a directory, each through a temporary file and a rename"""
+
+    def __init__(self, output_dir, fsync=OUTPUT_FSYNC):
+        self.output_dir = output_dir or '.'
+        self.fsync = fsync
+        self._directories = set()
+
+    def path_for(self, filename):
+        """Get the path a file is written to"""
+        return os.path.join(self.output_dir, filename)
+
+    def write(self, filename, content):
+        """Write one file; its directory is synced by sync() under the 'always' policy"""
+        path = self.path_for(filename)
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory not in self._directories:
+            os.makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+        write_file_atomic(content, path, 'file' if self.fsync == 'always' else self.fsync)
+        return path
+
+    def sync(self, paths):
+        """Make the renames of a batch of written files durable"""
+        if self.fsync == 'always':
+            for directory in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+                sync_directory(directory)
+
+    def close(self, abort=False):
+        """Nothing to finish: every file was moved into place as it was written"""
+
+class ArchiveSink:
+    """
+    Writes output files into one tar or zip archive
+
+    The archive is built under a temporary name and moved into place when it
+    is closed, so an existing archive is only replaced by a complete one.
+    """
+
+    def __init__(self, archive_path, fsync=OUTPUT_FSYNC):
+        """
+        Open the temporary archive
+
+        Args:
+            archive_path (str): Destination path; its suffix picks the format, see ARCHIVE_FORMATS
+            fsync (str, optional): One of FSYNC_POLICIES, applied when the archive is closed
+
+        Raises:
+            ValueError: The suffix is not an archive's
+        """
+        archive_format = get_archive_format(archive_path)
+        if archive_format is None:
+            raise ValueError(f"Unsupported archive type: {archive_path} (use one of {', '.join(ARCHIVE_FORMATS)})")
+        self.path = archive_path
+        self.fsync = fsync
+        self.count = 0
+        directory, name = os.path.split(os.path.abspath(archive_path))
+        os.makedirs(directory, exist_ok=True)
+        self.temp_path = os.path.join(directory, f".{name}.partial")
+        # Imported here to keep package import fast
+        if archive_format == 'zip':
+            import zipfile
+            self._zip = zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_DEFLATED)
+            self._tar = None
+        else:
+            import tarfile
+            self._zip = None
+            self._tar = tarfile.open(self.temp_path, archive_format)
+
+    def path_for(self, filename):
+        """Get the path of a file inside the archive, for messages"""
+        return f"{self.path}/{filename}"
+
+    def write(self, filename, content):
+        """Add one file to the archive"""
+        data = content.encode('utf-8')
+        name = filename.replace(os.sep, '/')
+        if self._zip is not None:
+            self._zip.writestr(name, data)
+        else:
+            info = self._tar.tarinfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+        self.count += 1
+        return self.path_for(filename)
+
+    def sync(self, paths):
+        """Nothing to sync until the archive is complete"""
+
+    def close(self, abort=False):
+        """
+        Finish the archive and move it into place, or remove it if ``abort`` is set
+        """
+        (self._zip if self._zip is not None else self._tar).close()
+        if abort:
+            os.remove(self.temp_path)
+            return
+        if self.fsync != 'never':
+            with open(self.temp_path, 'rb') as file:
+                os.fsync(file.fileno())
+        os.replace(self.temp_path, self.path)
+        if self.fsync == 'always':
+            sync_directory(os.path.dirname(self.temp_path))
+        print(f"Archive saved to {self.path} ({self.count} files)")
+
+class OutputWriter:
+    """
+    Writes output files on a background thread
+
+    Attributes:
+        saved (int): Files written
+        failed (int): Files that could not be written
+    """
+
+    def __init__(self, output_dir, archive_path=None, fsync=OUTPUT_FSYNC, queue_size=OUTPUT_QUEUE_SIZE,
+                 log_interval=OUTPUT_LOG_INTERVAL):
+        """
+        Start the writer thread
+
+        Args:
+            output_dir (str): Directory to write files into
+            archive_path (str, optional): Write every file into this .zip or .tar(.gz, .bz2, .xz) archive instead
+            fsync (str, optional): One of FSYNC_POLICIES
+            queue_size (int, optional): Files that may wait to be written before submit() blocks
+            log_interval (float, optional): Minimum seconds between "Content saved" messages
+
+        Raises:
+            ValueError: Unknown fsync policy or archive type
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync} (use one of {', '.join(FSYNC_POLICIES)})")
+        self.sink = ArchiveSink(archive_path, fsync) if archive_path else DirectorySink(output_dir, fsync)
+        self.saved = 0
+        self.failed = 0
+        self._log = RateLimitedLog(log_interval)
+        self._queue = queue.Queue(max(1, queue_size))
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='output-writer', daemon=True)
+        self._thread.start()
+
+    def path_for(self, filename):
+        """Get the path a file is written to"""
+        return self.sink.path_for(filename)
+
+    def submit(self, content, filename, on_saved=None):
+        """
+        Queue a file to be written, waiting while the queue is full
+
+        Args:
+            content (str): File content
+            filename (str): Path relative to the output directory or archive
+            on_saved (callable, optional): Called on the writer thread as on_saved(path, error) once
+                the file is written (error is None) or has failed (path is None)
+
+        Returns:
+            str: The path the file is written to
+        """
+        if self._closed:
+            raise RuntimeError("The output writer is closed")
+        self._queue.put((content, filename, on_saved))
+        return self.path_for(filename)
+
+    def flush(self):
+        """Wait until every queued file has been written"""
+        self._queue.join()
+
+    def close(self, abort=False):
+        """
+        Write the queued files, stop the writer thread and finish the archive
+
+        Args:
+            abort (bool, optional): Discard the archive instead of moving it into place
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._log.flush()
+        self.sink.close(abort)
+
+    def _run(self):
+        """Write queued files a batch at a time until close()"""
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self._queue.maxsize:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                running = self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        """Write a batch of files and report them; returns False once close() was requested"""
+        running = True
+        written = []
+        for job in batch:
+            if job is None:
+                running = False
+                continue
+            content, filename, on_saved = job
+            try:
+                path = self.sink.write(filename, content)
+            except Exception as e:
+                self.failed += 1
+                print(f"Error writing to file {self.sink.path_for(filename)}: {e}")
+                self._notify(on_saved, None, e)
+            else:
+                written.append((path, on_saved))
+
+        if written:
+            try:
+                self.sink.sync([path for path, _ in written])
+            except OSError as e:
+                print(f"Error syncing output files: {e}")
+        for path, on_saved in written:
+            self.saved += 1
+            self._log.log(f"Content saved to {path}")
+            self._notify(on_saved, path, None)
+        return running
+
+    def _notify(self, on_saved, path, error):
+        """Call a file's on_saved callback, keeping the writer thread alive if it fails"""
+        if on_saved is None:
+            return
+        try:
+            on_saved(path, error)
+        except Exception as e:
+            print(f"Error after saving {path or 'a file'}: {e}")
@@ -0,0 +1,293 @@
+"""
+Retries, deadlines and hedging for API requests.
+
+Failures are classified as transient (rate limits, overloads, server errors,
+timeouts and dropped connections) or permanent (bad requests, authentication,
+anything that is not an API error). Transient failures are retried with
+exponential backoff and full jitter, waiting at least as long as the API asks
+for in ``retry-after``, until the attempts or the request's deadline run out.
+
+Optionally, a request that is still running after the recent p95 latency is
+hedged: a duplicate is sent and whichever finishes first is used.
+"""
+
+import importlib
+import random
+import threading
+import time
+from collections import deque
+from ..config import (
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, DEFAULT_REQUEST_DEADLINE,
+    HEDGE_QUANTILE, HEDGE_MIN_SAMPLES
+)
+
+# HTTP statuses worth retrying: timeout, conflict, rate limit, server errors and overload
+TRANSIENT_STATUSES = frozenset((408, 409, 429, 500, 502, 503, 504, 529))
+
+class GenerationError(Exception):
+    """
+    Content generation failed
+
+    Attributes:
+        retries (int): Retries made before giving up
+        transient (bool): Whether the last failure was transient
+    """
+
+    def __init__(self, message, retries=0, transient=False):
+        super().__init__(message)
+        self.retries = retries
+        self.transient = transient
+
+class DeadlineExceededError(GenerationError):
+    """The request's deadline passed before it succeeded"""
+
+class TruncatedResponseError(GenerationError):
+    """
+    The response was still cut off at max_tokens when its continuations ran out
+
+    Attributes:
+        content (str): The text generated before the cut-off
+        stop_reason (str): Always 'max_tokens'
+    """
+
+    def __init__(self, message, content, retries=0):
+        super().__init__(message, retries, False)
+        self.content = content
+        self.stop_reason = 'max_tokens'
+
+def classify_error(error):
+    """
+    Classify a failed request
+
+    Args:
+        error (Exception): Exception raised by the request
+
+    Returns:
+        bool: True if the failure is transient and worth retrying
+    """
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in TRANSIENT_STATUSES
+
+    # Timeouts and dropped connections carry no status; only the SDK is loaded by now
+    from anthropic import APIConnectionError, DEFAULT_CONNECTION_LIMITS
+    if isinstance(error, APIConnectionError):
+        return True
+
+    # A stream that breaks while it is read raises the SDK's HTTP library's own error
+    http = importlib.import_module(type(DEFAULT_CONNECTION_LIMITS).__module__.partition('.')[0])
+    return isinstance(error, http.TransportError)
+
+def get_retry_after(error):
+    """
+    Get how long the API asked us to wait before retrying
+
+    Args:
+        error (Exception): Exception raised by the request
+
+    Returns:
+        float: Seconds to wait, or None if the response did not say
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, retry_after=None, rng=random):
+    """
+    Get the delay before a retry, with exponential backoff and full jitter
+
+    Args:
+        attempt (int): Number of the failed attempt, from 1
+        base_delay (float, optional): Delay ceiling after the first failure
+        max_delay (float, optional): Upper bound of the delay ceiling
+        retry_after (float, optional): Minimum delay requested by the API
+        rng (random.Random, optional): Source of jitter
+
+    Returns:
+        float: Seconds to wait
+    """
+    delay = rng.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        # Spread clients that were told the same retry-after over a little extra time
+        delay = max(delay, retry_after + rng.uniform(0, base_delay))
+    return delay
+
+class LatencyTracker:
+    """
+    Recent request latencies, for picking the hedging delay
+    """
+
+    def __init__(self, size=200):
+        """
+        Initialize the tracker
+
+        Args:
+            size (int, optional): Number of recent latencies kept
+        """
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def record(self, seconds):
+        """Record the latency of a successful request"""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def quantile(self, q):
+        """Get the ``q`` quantile of the recent latencies, or None if there are none"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+class RetryPolicy:
+    """
+    How API requests are retried, bounded and hedged
+
+    One policy is shared by every request of a ContentGenerator, so hedging
+    delays are learned from all of them.
+    """
+
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 deadline=DEFAULT_REQUEST_DEADLINE, hedge=False, hedge_quantile=HEDGE_QUANTILE,
+                 hedge_min_samples=HEDGE_MIN_SAMPLES, sleep=time.sleep, rng=None):
+        """
+        Initialize the policy
+
+        Args:
+            max_attempts (int, optional): Attempts per request, including the first
+            base_delay (float, optional): Backoff delay ceiling after the first failure
+            max_delay (float, optional): Upper bound of the backoff delay ceiling
+            deadline (float, optional): Seconds a request may take across all attempts, None for no limit
+            hedge (bool, optional): Send a duplicate of requests slower than the recent ``hedge_quantile``
+            hedge_quantile (float, optional): Latency quantile after which a request is hedged
+            hedge_min_samples (int, optional): Latencies needed before hedging starts
+            sleep (callable, optional): Waits between attempts
+            rng (random.Random, optional): Source of jitter
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.latencies = LatencyTracker()
+
+    def hedge_delay(self):
+        """Get how long to wait before hedging a request, or None if it should not be hedged"""
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    def run(self, attempt, hedgeable=False, stats=None):
+        """
+        Run a request, retrying transient failures
+
+        Args:
+            attempt (callable): Makes one attempt; called with the seconds left before the
+                deadline (None if there is none), to use as its timeout
+            hedgeable (bool, optional): Whether the attempt may run twice concurrently
+            stats (dict, optional): Receives 'retries' and 'hedged' counts
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            GenerationError: The failure was permanent, or attempts or time ran out;
+                the last exception is chained as the cause
+        """
+        if stats is None:
+            stats = {}
+        stats.setdefault('retries', 0)
+        stats.setdefault('hedged', 0)
+        expires = time.monotonic() + self.deadline if self.deadline else None
+
+        for number in range(1, self.max_attempts + 1):
+            remaining = expires - time.monotonic() if expires else None
+            started = time.monotonic()
+            try:
+                if hedgeable and self.hedge_delay() is not None:
+                    result = self._run_hedged(attempt, expires, stats)
+                else:
+                    result = attempt(remaining)
+                self.latencies.record(time.monotonic() - started)
+                return result
+            except GenerationError as e:
+                # Already classified, e.g. a stream that failed after delivering text
+                e.retries = stats['retries']
+                raise
+            except Exception as e:
+                transient = classify_error(e)
+                if not transient:
+                    raise GenerationError(f"Permanent API error: {e}", stats['retries'], False) from e
+                if number == self.max_attempts:
+                    raise GenerationError(
+                        f"API error after {number} attempts: {e}", stats['retries'], True
+                    ) from e
+
+                delay = backoff_delay(number, self.base_delay, self.max_delay, get_retry_after(e), self.rng)
+                if expires and time.monotonic() + delay >= expires:
+                    raise DeadlineExceededError(
+                        f"Deadline of {self.deadline:g}s exceeded after {number} attempts: {e}",
+                        stats['retries'], True
+                    ) from e
+                print(f"Transient API error ({e}); retrying in {delay:.1f}s")
+                self.sleep(delay)
+                stats['retries'] += 1
+
+    def _run_hedged(self, attempt, expires, stats):
+        """
+        Run an attempt, starting a duplicate if it outlives the hedging delay
+
+        Each attempt's timeout is the time left before ``expires`` (a
+        time.monotonic() value, None for no deadline) when it starts, so the
+        duplicate never runs past the deadline; none is started if no time is left.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        # Not a context manager: the losing request is left to finish in the background
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            futures = [executor.submit(attempt, expires - time.monotonic() if expires else None)]
+            done, _ = wait(futures, timeout=self.hedge_delay())
+            remaining = expires - time.monotonic() if expires else None
+            if not done and (remaining is None or remaining > 0):
+                stats['hedged'] += 1
+                futures.append(executor.submit(attempt, remaining))
+
+            pending = set(futures)
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            executor.shutdown(wait=False)
@@ -0,0 +1,128 @@
+"""
+Coalescing of identical in-flight API requests.
+
+When several threads ask for the same completion at once (batch workers
+whose items share a prompt, or server jobs for the same topic), only the
+first sends the request; the others wait for it and receive its result. The
+response cache cannot do this on its own, as nothing is stored until the
+first response arrives.
+"""
+
+import hashlib
+import re
+import threading
+from .retry_utils import GenerationError
+
+def normalize_prompt(text):
+    """
+    Normalize whitespace that does not change a prompt's meaning
+
+    Trailing spaces on each line and runs of blank lines are collapsed, and
+    leading and trailing whitespace is removed.
+    """
+    if not text:
+        return ''
+    lines = (line.rstrip() for line in text.strip().splitlines())
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+def make_request_key(model, max_tokens, prompt, system=None, images=None):
+    """
+    Build the key that identifies identical requests
+
+    Args:
+        model (str): Model name
+        max_tokens (int): Maximum tokens to generate
+        prompt (str): The user prompt
+        system (str or sequence, optional): The system prompt or its blocks, if any
+        images (list, optional): Images sent with the prompt, identified by their 'sha256'
+
+    Returns:
+        str: Hex digest of the model, limit, normalized prompts and images
+    """
+    if system is not None and not isinstance(system, str):
+        system = '\0'.join(text for text in system if text)
+    digest = hashlib.sha256()
+    parts = [model, str(max_tokens), normalize_prompt(prompt), normalize_prompt(system)]
+    parts.extend(image['sha256'] for image in images or ())
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class _Call:
+    """One request in flight and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, sharing its result with concurrent callers
+
+    Attributes:
+        calls (int): Calls that were made
+        coalesced (int): Calls that waited for an identical call instead
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """
+        Call ``function``, unless a call with the same key is already running
+
+        Args:
+            key (str): Identifies calls that give the same result
+            function (callable): Makes the call; takes no arguments
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came from another caller's call
+
+        Raises:
+            GenerationError: Another caller's call with the same key failed
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                # A fresh exception for each waiter; one instance raised in several threads shares a traceback
+                error = call.error
+                raise GenerationError(
+                    str(error), getattr(error, 'retries', 0), getattr(error, 'transient', False)
+                ) from error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Later callers start a new call; waiters already hold this one
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        """
+        Get coalescing statistics
+
+        Returns:
+            dict: 'calls' made, 'coalesced' calls and 'in_flight' keys
+        """
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
@@ -0,0 +1,304 @@
+"""
+A minimal local stand-in for the Anthropic Messages API.
+
+Used by tests and benchmarks to exercise the real SDK client without network
+access or API spend. Every request gets a canned reply, streamed as
+server-sent events when the request asks for it. Message Batches are
+accepted too; they stay in progress for ``batch_pending_polls`` status
+checks and then end with every request succeeded. Failures and slow
+responses can be scripted for message requests with ``failures`` and
+``delays``, including streams that drop part way.
+"""
+
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """Request handler that answers Messages API calls with a canned reply"""
+
+    # HTTP/1.1 so that clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    # Send each response in one write; split writes on a kept-alive
+    # connection stall on delayed ACKs and swamp the measurements
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """Count each new TCP connection"""
+        super().setup()
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def do_POST(self):
+        """Handle a POST request"""
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.last_request = body
+
+        path = self.path.split('?')[0].rstrip('/')
+        if path == '/v1/messages':
+            failure, delay = self.server.next_fault()
+            if delay:
+                time.sleep(delay)
+            if failure == ('drop',):
+                self.send_events(self.server.make_stream_events(body), drop=True)
+            elif failure:
+                self.send_api_error(*failure)
+            elif body.get('stream'):
+                self.send_events(self.server.make_stream_events(body))
+            else:
+                self.send_json(200, self.server.make_message(body))
+        elif path == '/v1/messages/batches':
+            self.send_json(200, self.server.create_batch(body.get('requests', [])))
+        else:
+            self.send_not_found()
+
+    def do_GET(self):
+        """Handle a GET request for a message batch or its results"""
+        with self.server.lock:
+            self.server.request_count += 1
+
+        parts = self.path.split('?')[0].strip('/').split('/')
+        batch = None
+        if len(parts) in (4, 5) and parts[:3] == ['v1', 'messages', 'batches']:
+            batch = self.server.batches.get(parts[3])
+
+        if batch is None:
+            self.send_not_found()
+        elif len(parts) == 4:
+            self.send_json(200, self.server.poll_batch(batch))
+        elif parts[4] == 'results' and batch['processing_status'] == 'ended':
+            self.send_jsonl(self.server.make_batch_results(batch))
+        else:
+            self.send_not_found()
+
+    def send_not_found(self):
+        """Send a not-found API error"""
+        self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def send_api_error(self, status, retry_after=None):
+        """Send an API error with the given status and optional retry-after header"""
+        error_types = {
+            400: 'invalid_request_error', 401: 'authentication_error', 429: 'rate_limit_error',
+            529: 'overloaded_error'
+        }
+        payload = {'type': 'error', 'error': {'type': error_types.get(status, 'api_error'), 'message': f"Stub {status}"}}
+        headers = {} if retry_after is None else {'retry-after': str(retry_after)}
+        self.send_json(status, payload, headers)
+
+    def send_json(self, status, payload, headers=None):
+        """Send a JSON response"""
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_jsonl(self, records):
+        """Send a JSON Lines response"""
+        data = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/binary')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_events(self, events, drop=False):
+        """Send a server-sent event stream, or only its first half before closing the connection"""
+        data = ''.join(
+            f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events
+        ).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if drop:
+            # Cut at an event boundary, so the client has received some text when the connection closes
+            cut = data.rfind(b'\n\n', 0, len(data) // 2) + 2
+            self.wfile.write(data[:cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Silence per-request logging"""
+        pass
+
+class StubAPIServer(ThreadingHTTPServer):
+    """
+    Local stub of the Anthropic API running on a background thread
+
+    Use as a context manager and point a client at ``base_url``.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, reply_text="Stub content", host='127.0.0.1', port=0, batch_pending_polls=0,
+                 failures=None, delays=None):
+        """
+        Initialize the stub server
+
+        Args:
+            reply_text (str or callable, optional): Text returned for every message, or a function
+                that builds it, or a (text, stop reason) tuple, from the request body
+            host (str, optional): Interface to bind to
+            port (int, optional): Port to bind to, 0 picks a free port
+            batch_pending_polls (int, optional): Status checks a batch stays in progress for
+            failures (list, optional): Outcomes of the first message requests, in order: None to
+                succeed, an HTTP status, a (status, retry-after seconds) tuple, or 'drop' to
+                close the connection half way through a streamed reply
+            delays (list, optional): Seconds to wait before answering the first message requests, in order
+        """
+        super().__init__((host, port), StubAPIHandler)
+        self.reply_text = reply_text
+        self.batch_pending_polls = batch_pending_polls
+        self.lock = threading.Lock()
+        self.connection_count = 0
+        self.request_count = 0
+        self.last_request = None
+        self.batches = {}
+        self.failures = list(failures or [])
+        self.delays = list(delays or [])
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """Base URL to pass to the Anthropic client"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_fault(self):
+        """Take the scripted failure and delay for the next message request"""
+        with self.lock:
+            failure = self.failures.pop(0) if self.failures else None
+            delay = self.delays.pop(0) if self.delays else 0
+        if failure is not None and not isinstance(failure, tuple):
+            failure = (failure,)
+        return failure, delay
+
+    def make_message(self, body):
+        """Build a Messages API response for a request body"""
+        reply = self.reply_text(body) if callable(self.reply_text) else self.reply_text
+        text, stop_reason = reply if isinstance(reply, tuple) else (reply, 'end_turn')
+        return {
+            'id': f"msg_stub_{self.request_count}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'stub'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': stop_reason,
+            'stop_sequence': None,
+            'usage': {'input_tokens': 1, 'output_tokens': 1}
+        }
+
+    def create_batch(self, requests):
+        """Record a new message batch and return its status"""
+        with self.lock:
+            batch_id = f"msgbatch_stub_{len(self.batches)}"
+            batch = {
+                'id': batch_id,
+                'requests': requests,
+                'pending_polls': self.batch_pending_polls,
+                'processing_status': 'in_progress' if self.batch_pending_polls else 'ended',
+                'created_at': time.time()
+            }
+            self.batches[batch_id] = batch
+        return self.make_batch(batch)
+
+    def poll_batch(self, batch):
+        """Return a batch's status, counting down the polls until it ends"""
+        with self.lock:
+            if batch['pending_polls']:
+                batch['pending_polls'] -= 1
+            else:
+                batch['processing_status'] = 'ended'
+        return self.make_batch(batch)
+
+    def make_batch(self, batch):
+        """Build a Message Batches API batch object"""
+        ended = batch['processing_status'] == 'ended'
+        total = len(batch['requests'])
+        created_at = datetime.fromtimestamp(batch['created_at'], timezone.utc).isoformat()
+        return {
+            'id': batch['id'],
+            'type': 'message_batch',
+            'processing_status': batch['processing_status'],
+            'request_counts': {
+                'processing': 0 if ended else total,
+                'succeeded': total if ended else 0,
+                'errored': 0,
+                'canceled': 0,
+                'expired': 0
+            },
+            'created_at': created_at,
+            'expires_at': created_at,
+            'ended_at': created_at if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None
+        }
+
+    def make_batch_results(self, batch):
+        """Build the JSON Lines results of an ended batch"""
+        return [
+            {
+                'custom_id': request['custom_id'],
+                'result': {'type': 'succeeded', 'message': self.make_message(request['params'])}
+            }
+            for request in batch['requests']
+        ]
+
+    def make_stream_events(self, body, chunk_size=8):
+        """Build the streaming events for a request body, splitting the reply into small text deltas"""
+        message = self.make_message(body)
+        text = message['content'][0]['text']
+        start = dict(message, content=[], stop_reason=None)
+        events = [
+            {'type': 'message_start', 'message': start},
+            {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}}
+        ]
+        events.extend(
+            {'type': 'content_block_delta', 'index': 0,
+             'delta': {'type': 'text_delta', 'text': text[i:i + chunk_size]}}
+            for i in range(0, len(text), chunk_size)
+        )
+        events.extend([
+            {'type': 'content_block_stop', 'index': 0},
+            {'type': 'message_delta', 'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+             'usage': {'output_tokens': message['usage']['output_tokens']}},
+            {'type': 'message_stop'}
+        ])
+        return events
+
+    def handle_error(self, request, client_address):
+        """Ignore clients that hang up early, such as the loser of a hedged request"""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        """Start serving on a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the socket"""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,283 @@
+"""
+Per-request telemetry for content generation.
+
+Every generation produces one metrics record: a dict with the wall time of
+each phase (prompt build, time to first token, API call, file write), token
+usage, stop reason, retry, hedge and continuation counts, the number, payload size and
+estimated tokens of attached reference images, whether the response came from the
+cache or a coalesced request, the number of sections of a long item and the
+error, labelled with the item's category and file type. Records are passed to pluggable sinks; a sink is any callable
+that takes a record, and may have ``flush()`` and ``close()`` methods.
+
+Two sinks are provided: ``JSONLSink`` appends every record to a log file, and
+``PrometheusTextfileExporter`` aggregates records into latency histograms and
+counters written in the Prometheus text format, for node_exporter's textfile
+collector.
+"""
+
+import json
+import os
+import threading
+import time
+from ..config import METRICS_FLUSH_INTERVAL
+
+# Timed phases of a generation, as keys of a metrics record
+PHASES = ('prompt_build', 'ttft', 'api', 'write', 'total')
+
+# Token counts of a metrics record
+TOKEN_TYPES = ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens')
+
+# Reference image counts of a metrics record: images sent, their base64 payload bytes and estimated tokens
+IMAGE_STATS = ('image_count', 'image_bytes', 'image_tokens')
+
+# Latency histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.05, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def new_record(category=None, file_type=None, name=None):
+    """
+    Create an empty metrics record for one generation
+
+    Args:
+        category (str, optional): Metadata category of the item
+        file_type (str, optional): File type of the item
+        name (str, optional): Item name
+
+    Returns:
+        dict: Record with every phase timing and token count unset
+    """
+    record = {
+        'timestamp': time.time(),
+        'category': category,
+        'file_type': file_type,
+        'name': name,
+        'cached': False,
+        'coalesced': False,
+        'stop_reason': None,
+        'retries': 0,
+        'hedged': 0,
+        'continuations': 0,
+        'sections': None,
+        'error': None
+    }
+    record.update((f"{phase}_seconds", None) for phase in PHASES)
+    record.update((token_type, 0) for token_type in TOKEN_TYPES)
+    record.update((stat, 0) for stat in IMAGE_STATS)
+    return record
+
+class Telemetry:
+    """
+    Dispatches metrics records to sinks
+    """
+
+    def __init__(self, sinks=None):
+        """
+        Initialize the dispatcher
+
+        Args:
+            sinks (list, optional): Callables that receive each record
+        """
+        self.sinks = list(sinks or [])
+
+    def add_sink(self, sink):
+        """Add a sink that receives every following record"""
+        self.sinks.append(sink)
+
+    def emit(self, record):
+        """
+        Send a record to every sink
+
+        A failing sink is reported and skipped; telemetry never fails a generation.
+
+        Args:
+            record (dict): Metrics record from new_record
+        """
+        for sink in self.sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                print(f"Error in telemetry sink {sink!r}: {e}")
+
+    def close(self):
+        """Flush and close every sink"""
+        for sink in self.sinks:
+            close = getattr(sink, 'close', None)
+            if close:
+                close()
+
+class JSONLSink:
+    """
+    Appends every metrics record to a JSON Lines file
+    """
+
+    def __init__(self, path):
+        """
+        Open the log file for appending
+
+        Args:
+            path (str): Path to the log file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        """Close the log file"""
+        with self._lock:
+            self._file.close()
+
+    def __repr__(self):
+        return f"JSONLSink({self.path!r})"
+
+class PrometheusTextfileExporter:
+    """
+    Aggregates metrics records per file type and category into Prometheus metrics
+
+    The text file is rewritten atomically at most every ``interval`` seconds
+    while records arrive, and on flush() and close().
+    """
+
+    def __init__(self, path, interval=METRICS_FLUSH_INTERVAL, prefix='content_generator'):
+        """
+        Initialize the exporter
+
+        Args:
+            path (str): Path of the .prom file to write
+            interval (float, optional): Minimum seconds between rewrites while records arrive
+            prefix (str, optional): Metric name prefix
+        """
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+
+        # {(phase, file_type, category): [bucket counts..., sum, count]}
+        self._latency = {}
+        # {(name, labels tuple): value}
+        self._counters = {}
+
+    def __call__(self, record):
+        labels = (('file_type', record.get('file_type') or 'unknown'), ('category', record.get('category') or 'none'))
+        if record.get('error'):
+            status = 'error'
+        elif record.get('cached'):
+            status = 'cached'
+        elif record.get('coalesced'):
+            status = 'coalesced'
+        else:
+            status = 'ok'
+
+        with self._lock:
+            for phase in PHASES:
+                seconds = record.get(f"{phase}_seconds")
+                if seconds is not None:
+                    self._observe((('phase', phase),) + labels, seconds)
+            self._increment('requests_total', labels + (('status', status),), 1)
+            for token_type in TOKEN_TYPES:
+                if record.get(token_type):
+                    self._increment('tokens_total', labels + (('type', token_type[:-len('_tokens')]),),
+                                    record[token_type])
+            if record.get('stop_reason'):
+                self._increment('stop_reason_total', labels + (('reason', record['stop_reason']),), 1)
+            self._increment('retries_total', labels, record.get('retries') or 0)
+            self._increment('hedged_total', labels, record.get('hedged') or 0)
+            self._increment('continuations_total', labels, record.get('continuations') or 0)
+            self._increment('images_total', labels, record.get('image_count') or 0)
+            self._increment('image_bytes_total', labels, record.get('image_bytes') or 0)
+
+            due = time.monotonic() - self._last_write >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the current aggregates to the text file"""
+        with self._lock:
+            text = self.render()
+            self._last_write = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename, so the collector never reads a half-written file
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        """Write the final aggregates"""
+        self.flush()
+
+    def render(self):
+        """
+        Render the aggregates in the Prometheus text exposition format
+
+        Returns:
+            str: Metrics text
+        """
+        name = f"{self.prefix}_request_duration_seconds"
+        lines = [
+            f"# HELP {name} Wall time of each phase of a generation",
+            f"# TYPE {name} histogram"
+        ]
+        for labels, values in sorted(self._latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+        descriptions = {
+            'requests_total': "Generations by status (ok, cached, coalesced or error)",
+            'tokens_total': "Tokens by type (input, output, cache_read_input, cache_creation_input)",
+            'stop_reason_total': "Responses by stop reason",
+            'retries_total': "API request retries",
+            'hedged_total': "Duplicate requests sent for slow requests",
+            'continuations_total': "Follow-up requests that resumed truncated or interrupted responses",
+            'images_total': "Reference images sent",
+            'image_bytes_total': "Base64 payload bytes of reference images sent"
+        }
+        for counter, description in descriptions.items():
+            name = f"{self.prefix}_{counter}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (key, labels), value in sorted(self._counters.items()):
+                if key == counter:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def _observe(self, labels, seconds):
+        """Add one observation to a latency histogram"""
+        values = self._latency.get(labels)
+        if values is None:
+            # One count per bucket, then the sum and the total count
+            values = self._latency[labels] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+        for position, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                values[position] += 1
+                break
+        values[-2] += seconds
+        values[-1] += 1
+
+    def _increment(self, counter, labels, amount):
+        """Add to a counter"""
+        key = (counter, labels)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def __repr__(self):
+        return f"PrometheusTextfileExporter({self.path!r})"
+
+def _format_labels(labels):
+    """Format label pairs as {name="value",...}, escaping values"""
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
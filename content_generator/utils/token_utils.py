@@ -0,0 +1,55 @@
+"""
+Utility functions for estimating token counts locally.
+
+Counts are estimated without a tokenizer by splitting text the way BPE
+tokenizers tend to: one piece per short word (long words are split into
+8-letter chunks), per group of up to three digits and per punctuation mark or
+non-Latin character. This tracks real counts for English prose and markdown
+far more closely than a flat characters-per-token ratio, and costs one regex
+scan of the text.
+"""
+
+import re
+from itertools import islice
+
+# Pieces that each count as roughly one token
+_PIECE_RE = re.compile(r"[A-Za-z]{1,8}|\d{1,3}|[^\sA-Za-z\d]")
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a string without calling the API"""
+    if not text:
+        return 0
+    return len(_PIECE_RE.findall(text))
+
+def truncate_to_tokens(text, max_tokens, marker="\n...\n[Truncated for brevity]"):
+    """
+    Truncate text to about ``max_tokens`` estimated tokens
+
+    The cut is moved back to the last line break when one is close enough, so
+    markdown is not split mid-line, and ``marker`` is appended.
+
+    Args:
+        text (str): Text to truncate
+        max_tokens (int): Maximum estimated tokens of the result, including the marker
+        marker (str, optional): Appended to the text when it is truncated
+
+    Returns:
+        str: The text, unchanged if it already fits
+    """
+    if not text or max_tokens is None:
+        return text
+
+    # The piece just past the limit marks where to cut
+    overflow = next(islice(_PIECE_RE.finditer(text), max_tokens, None), None)
+    if overflow is None:
+        return text
+
+    keep = max_tokens - estimate_tokens(marker)
+    if keep <= 0:
+        return ""
+    end = next(islice(_PIECE_RE.finditer(text), keep, None)).start()
+
+    line_end = text.rfind('\n', 0, end)
+    if line_end > end // 2:
+        end = line_end
+    return text[:end].rstrip() + marker